@@ -88,6 +88,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Readers do not block writers, so a worker can renew a job's lease while the job reads
+            'init_command': 'PRAGMA journal_mode=WAL;',
+        },
+        'TEST': {
+            # On disk like the real database, so tests see its locking; removed after the run
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
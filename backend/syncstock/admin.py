@@ -1,12 +1,18 @@
 from django.contrib import admin
 from .models import User, InventoryItem, StockAdjustment, StockTransfer, Location, Category, Company
-from .models import TotalCurrentInventory
+from .models import TotalCurrentInventory, StockMovement, TransferDocument, Product, Job, ReorderPoint, StockAlert
 from django.contrib.auth.models import Group, Permission
+from . import alerts
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('id','username', 'email', 'first_name', 'last_name', "company")
     search_fields = ('username', 'email')
 
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('id', 'company', 'sku', 'item_name', 'product_code', 'category')
+    search_fields = ('sku', 'item_name', 'product_code')
+    list_filter = ('company',)
+
 class InventoryItemAdmin(admin.ModelAdmin):
     list_display = ('id', 'company', 'item_name', 'product_code', 'sku', 'quantity', 'price', 'location', 'category')
     search_fields = ('item_name', 'location', 'product_code')
@@ -39,16 +45,64 @@ class StockTransferAdmin(admin.ModelAdmin):
     list_display = ('id', 'date', 'company', 'item', 'quantity', 'from_location', 'to_location')
     list_filter = ('company',)
 
+class StockTransferInline(admin.TabularInline):
+    model = StockTransfer
+    fields = ('item', 'quantity', 'sku', 'product_code')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+class TransferDocumentAdmin(admin.ModelAdmin):
+    inlines = [StockTransferInline]
+    list_display = ('id', 'date', 'reference', 'company', 'from_location', 'to_location')
+    list_filter = ('company',)
+
 
 class TotalCurrentInventoryAdmin(admin.ModelAdmin):
     list_display = ('id', 'item_name', 'product_code', 'total_current_inventory',  "category", 'location', 'company')
     list_filter = ('company', 'location')
 
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('id', 'date', 'company', 'product', 'location', 'quantity', 'source_type', 'source_id')
+    list_filter = ('company', 'source_type')
+
+    # The journal is append-only
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'company', 'status', 'priority', 'attempts', 'run_at', 'worker', 'finished_at')
+    list_filter = ('status', 'task')
+    readonly_fields = ('created_at', 'finished_at')
+
+class ReorderPointAdmin(admin.ModelAdmin):
+    list_display = ('id', 'company', 'product', 'location', 'threshold', 'low', 'updated_at')
+    list_filter = ('company', 'low')
+    # Kept by the ledger as balances cross the threshold
+    readonly_fields = ('low',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        alerts.check([(obj.product_id, obj.location_id)])
+
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ('id', 'sequence', 'created_at', 'company', 'product', 'location', 'kind', 'quantity', 'threshold')
+    list_filter = ('company', 'kind')
+
 admin.site.register(Location, LocationAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(User, UserAdmin)
+admin.site.register(Product, ProductAdmin)
 admin.site.register(InventoryItem, InventoryItemAdmin)
 admin.site.register(StockAdjustment, StockAdjustmentAdmin)
 admin.site.register(StockTransfer, StockTransferAdmin)
 admin.site.register(Company, CompanyAdmin)
-admin.site.register(TotalCurrentInventory, TotalCurrentInventoryAdmin)
\ No newline at end of file
+admin.site.register(TotalCurrentInventory, TotalCurrentInventoryAdmin)
+admin.site.register(StockMovement, StockMovementAdmin)
+admin.site.register(TransferDocument, TransferDocumentAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(ReorderPoint, ReorderPointAdmin)
+admin.site.register(StockAlert, StockAlertAdmin)
@@ -0,0 +1,113 @@
+"""
+Aggregated series of receipts, adjustments and transfers for the chart endpoints.
+
+aggregate() answers one chart request with one grouped query: every requested
+metric per period, optionally split by the document's dimensions. It reads the
+daily rollups whenever they keep what the request needs, and the documents
+otherwise (filters on a single item, or distinct SKUs, which do not add up
+across days).
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncQuarter, TruncYear
+from rest_framework.exceptions import ValidationError
+
+from .models import InventoryItem, StockAdjustment, StockTransfer
+from . import rollups
+
+CENT = Decimal('0.01')
+
+GRANULARITIES = {
+    '': None,  # each date
+    'daily': TruncDay,
+    'weekly': TruncWeek,
+    'monthly': TruncMonth,
+    'quarterly': TruncQuarter,
+    'yearly': TruncYear,
+    'total': None,  # the whole range in one row per split
+}
+
+# Metric -> response key
+METRICS = {
+    'quantity': 'total_quantity',
+    'value': 'total_value',
+    'count': 'count',
+    'skus': 'distinct_skus',
+}
+
+# Dimensions a document's series can be split by
+DIMENSIONS = {
+    InventoryItem: ('location', 'category'),
+    StockAdjustment: ('location', 'category', 'adjustment_type'),
+    StockTransfer: ('from_location', 'to_location', 'category'),
+}
+
+# Price each document is valued at; adjustments use their item's
+PRICES = {
+    InventoryItem: 'price',
+    StockAdjustment: 'item__price',
+    StockTransfer: 'price',
+}
+
+
+def parse_list(value):
+    """Comma-separated query parameter as a list of its non-empty parts."""
+    return [part.strip() for part in (value or '').split(',') if part.strip()]
+
+
+def _document_metrics(model):
+    value = ExpressionWrapper(F('quantity') * F(PRICES[model]), output_field=DecimalField(max_digits=24, decimal_places=2))
+    return {
+        'quantity': Sum('quantity'),
+        'value': Sum(value),
+        'count': Count('pk'),
+        'skus': Count('product', distinct=True),
+    }
+
+
+ROLLUP_METRICS = {
+    'quantity': Sum('quantity'),
+    'value': Sum('value'),
+    'count': Sum('lines'),
+}
+
+
+def aggregate(filterset, company, group_by='', metrics=('quantity',), split_by=()):
+    """
+    Rows of {'trunc_date', *split_by, *metric keys} for the filterset's documents, by period.
+
+    Split dimensions that are locations or categories also get a `<dimension>_name`.
+    Raises ValidationError for an unknown granularity, metric or dimension.
+    """
+    model = filterset._meta.model
+    errors = {}
+    if group_by not in GRANULARITIES:
+        errors['group_by'] = [f"Choose one of: {', '.join(name for name in GRANULARITIES if name)}."]
+    if not metrics or any(metric not in METRICS for metric in metrics):
+        errors['metrics'] = [f"Choose any of: {', '.join(METRICS)}."]
+    if any(dimension not in DIMENSIONS[model] for dimension in split_by):
+        errors['split_by'] = [f"Choose any of: {', '.join(DIMENSIONS[model])}."]
+    if errors:
+        raise ValidationError(errors)
+
+    queryset, date_field, rolled_up = rollups.source(filterset, company, split_by, metrics)
+    available = ROLLUP_METRICS if rolled_up else _document_metrics(model)
+    groups = list(split_by) + [f'{dimension}__name' for dimension in split_by if dimension != 'adjustment_type']
+    if group_by != 'total':
+        truncate = GRANULARITIES[group_by]
+        queryset = queryset.annotate(trunc_date=truncate(date_field) if truncate else F(date_field))
+        groups.insert(0, 'trunc_date')
+
+    rows = (
+        queryset.values(*groups)
+        .annotate(**{METRICS[metric]: available[metric] for metric in metrics})
+        .order_by(*groups[:len(split_by) + (group_by != 'total')])
+    )
+    results = []
+    for row in rows:
+        if row.get('total_value') is not None:
+            # Sums come back at whatever scale the database computed them in
+            row['total_value'] = row['total_value'].quantize(CENT)
+        results.append({key.replace('__name', '_name'): value for key, value in row.items()})
+    return results
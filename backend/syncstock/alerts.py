@@ -0,0 +1,85 @@
+"""
+Reorder-point alerts.
+
+A ReorderPoint holds the threshold of one balance and whether the balance is at
+or below it right now. The ledger calls check() with the balances it just
+changed, in the same transaction; a point whose balance moved across its
+threshold is flipped and a StockAlert is recorded for the crossing. Balances
+that move without crossing write nothing, so listing what is low is a lookup on
+(company, low) and the alerts are a feed of crossings only.
+
+The feed is read in the order alerts became visible, not the order they were
+created: a transaction that commits late would otherwise put its alerts behind
+a cursor that has already moved past them. Each alert therefore gets its
+company's next `sequence` once its transaction has committed, under a lock on
+the company, and the feed only shows alerts that have one.
+"""
+from django.db import connection, transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Company, ReorderPoint, StockAlert, TotalCurrentInventory
+
+BATCH_SIZE = 500
+
+
+def check(keys):
+    """
+    Flip the reorder points of the balances at `keys` that crossed their threshold and return the alerts recorded.
+
+    Keys are ledger balance keys, (product_id, location_id). Costs one read per
+    batch of keys, and one update and one insert when something crossed; the
+    alerts are sequenced when the transaction commits.
+    """
+    keys = sorted(set(keys))
+    on_hand = TotalCurrentInventory.objects.filter(
+        product=OuterRef('product'), location=OuterRef('location'),
+    ).values('total_current_inventory')[:1]
+    crossed = []
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start:start + BATCH_SIZE]
+        wanted = set(batch)
+        points = (
+            ReorderPoint.objects.filter(
+                product_id__in={key[0] for key in batch},
+                location_id__in={key[1] for key in batch},
+            )
+            .annotate(on_hand=Coalesce(Subquery(on_hand), Value(0)))
+            .filter(Q(low=False, on_hand__lte=F('threshold')) | Q(low=True, on_hand__gt=F('threshold')))
+        )
+        crossed.extend(point for point in points if (point.product_id, point.location_id) in wanted)
+    if not crossed:
+        return []
+
+    for point in crossed:
+        point.low = not point.low
+    ReorderPoint.objects.bulk_update(crossed, ['low'], batch_size=BATCH_SIZE)
+    company_ids = {point.company_id for point in crossed}
+    transaction.on_commit(lambda: sequence(company_ids))
+    return StockAlert.objects.bulk_create([
+        StockAlert(
+            company_id=point.company_id,
+            product_id=point.product_id,
+            location_id=point.location_id,
+            kind='low' if point.low else 'restored',
+            quantity=point.on_hand,
+            threshold=point.threshold,
+        )
+        for point in crossed
+    ], batch_size=BATCH_SIZE)
+
+
+def sequence(company_ids):
+    """Number the committed alerts of the companies that have no sequence yet, oldest first."""
+    with transaction.atomic():
+        # Sequencing one company at a time keeps its numbers in the order they became visible
+        companies = Company.objects.filter(pk__in=company_ids).order_by('pk')
+        if connection.features.has_select_for_update:
+            companies = companies.select_for_update()
+        for company_id in companies.values_list('pk', flat=True):
+            alerts = StockAlert.objects.filter(company_id=company_id)
+            last = alerts.aggregate(last=Max('sequence'))['last'] or 0
+            pending = list(alerts.filter(sequence__isnull=True).order_by('id').only('id'))
+            for number, alert in enumerate(pending, start=last + 1):
+                alert.sequence = number
+            StockAlert.objects.bulk_update(pending, ['sequence'], batch_size=BATCH_SIZE)
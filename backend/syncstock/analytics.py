@@ -0,0 +1,120 @@
+"""
+Per-SKU inventory analytics: turnover, days of cover, sell-through and ABC/XYZ classes.
+
+Two queries feed everything: the period's sales per product and day, and the
+current balances with their unit prices. Both are read straight from the
+cursor into DataFrames, and every figure is then computed column-wise, so a
+period with millions of sold adjustments costs one grouped scan in the
+database and a few vector operations here.
+
+- turnover: units sold in the period per unit on hand now
+- days_of_cover: days the stock on hand lasts at the period's average daily sales
+- sell_through: share of the units available (sold plus on hand) that sold
+- abc: A for the products making up the first 80% of sales value, B for the next 15%, C for the rest
+- xyz: X when weekly sales vary little (coefficient of variation up to 0.5), Y up to 1, Z above or without sales
+
+Ratios that are undefined (nothing on hand, or no sales to cover) are None.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+from django.db import connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import StockAdjustment, TotalCurrentInventory
+
+DAYS = 90
+ABC_LIMITS = (0.8, 0.95)
+XYZ_LIMITS = (0.5, 1.0)
+
+
+def period(today=None):
+    """The default period: the last DAYS days up to today."""
+    today = today or timezone.localdate()
+    return today - datetime.timedelta(days=DAYS - 1), today
+
+
+def _frame(queryset, columns):
+    # Rows straight from the cursor, without building a model instance or converting each value
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+
+def sales_frame(company, start_date, end_date):
+    """Units sold per product and day in the period, as columns product, date and sold."""
+    sales = (
+        StockAdjustment.objects.filter(company=company, adjustment_type='sold', date__gte=start_date, date__lte=end_date)
+        .values('product', 'date')
+        .annotate(sold=Sum('quantity'))
+        .order_by()
+        .values_list('product', 'date', 'sold')
+    )
+    frame = _frame(sales, ['product', 'date', 'sold'])
+    frame['date'] = pd.to_datetime(frame['date'])
+    frame['sold'] = frame['sold'].astype('int64')
+    return frame
+
+
+def stock_frame(company):
+    """Every balance of the company, as columns product, sku, item_name, on_hand and unit_price."""
+    balances = (
+        TotalCurrentInventory.objects.filter(company=company)
+        .valued()
+        .order_by()
+        .values_list('product', 'sku', 'item_name', 'total_current_inventory', 'unit_price')
+    )
+    frame = _frame(balances, ['product', 'sku', 'item_name', 'on_hand', 'unit_price'])
+    frame['on_hand'] = frame['on_hand'].astype('int64')
+    frame['unit_price'] = pd.to_numeric(frame['unit_price']).fillna(0).astype('float64')
+    return frame
+
+
+def compute(sales, stock, start_date, end_date):
+    """One row per product of the stock frame with its figures for the period, best sellers by value first."""
+    days = (end_date - start_date).days + 1
+    weeks = -(-days // 7)
+
+    products = stock.groupby('product', sort=False).agg(
+        sku=('sku', 'first'), item_name=('item_name', 'first'), on_hand=('on_hand', 'sum'), unit_price=('unit_price', 'max'),
+    )
+    products['sold'] = sales.groupby('product')['sold'].sum().reindex(products.index, fill_value=0)
+
+    sold, on_hand = products['sold'].astype('float64'), products['on_hand'].astype('float64')
+    daily = sold / days
+    with np.errstate(divide='ignore', invalid='ignore'):
+        products['turnover'] = (sold / on_hand).round(2)
+        products['days_of_cover'] = (on_hand / daily).round(1)
+        products['sell_through'] = (sold / (sold + on_hand)).round(3)
+
+    # ABC on sales value; a product is in the class where its value starts, so the best seller is always A
+    products['sales_value'] = (sold * products['unit_price']).round(2)
+    products = products.sort_values(['sales_value', 'sku'], ascending=[False, True])
+    total_value = products['sales_value'].sum()
+    before = products['sales_value'].cumsum().shift(fill_value=0) / total_value if total_value else 1.0
+    products['abc'] = np.select([before < ABC_LIMITS[0], before < ABC_LIMITS[1]], ['A', 'B'], 'C')
+
+    # XYZ on the variation of weekly sales, counting weeks without sales as zero
+    week = (sales['date'] - pd.Timestamp(start_date)).dt.days // 7
+    weekly = sales.groupby([sales['product'], week])['sold'].sum().unstack(fill_value=0)
+    weekly = weekly.reindex(index=products.index, columns=range(weeks), fill_value=0)
+    mean = weekly.mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variation = weekly.std(axis=1, ddof=0) / mean
+    products['xyz'] = np.select([variation <= XYZ_LIMITS[0], variation <= XYZ_LIMITS[1]], ['X', 'Y'], 'Z')
+
+    products['unit_price'] = products['unit_price'].round(2)
+    products = products.replace([np.inf, -np.inf], np.nan).reset_index()
+    columns = ['product', 'sku', 'item_name', 'on_hand', 'sold', 'unit_price', 'sales_value',
+               'turnover', 'days_of_cover', 'sell_through', 'abc', 'xyz']
+    return products[columns]
+
+
+def inventory_analytics(company, start_date, end_date):
+    """The company's per-SKU analytics for the period, as JSON-ready rows."""
+    products = compute(sales_frame(company, start_date, end_date), stock_frame(company), start_date, end_date)
+    products = products.astype(object).where(products.notna(), None)
+    return products.to_dict('records')
@@ -7,4 +7,5 @@ class SyncstockConfig(AppConfig):
     
     def ready(self):
         import syncstock.signals
+        import syncstock.reports  # registers its job handlers
 
@@ -0,0 +1,104 @@
+"""
+Batch stock adjustments.
+
+All lines of a batch are validated together: related rows are fetched with one
+query per model, and the balances they draw on are locked and checked with one
+query before the adjustments are bulk inserted and posted to the ledger.
+"""
+from django.db import transaction
+
+from .models import InventoryItem, StockAdjustment, Location, Category
+from .serializers import StockAdjustmentLineSerializer
+from . import ledger, search, rollups
+
+
+class StockAdjustmentBatch:
+    """Validates and books a list of stock adjustment lines for one company and user."""
+
+    def __init__(self, company, user):
+        self.company = company
+        self.user = user
+
+    def _resolve(self, lines):
+        # Returns ({line index: unsaved StockAdjustment}, {line index: errors})
+        adjustments, errors, validated = {}, {}, {}
+        for index, line in enumerate(lines):
+            serializer = StockAdjustmentLineSerializer(data=line)
+            if serializer.is_valid():
+                validated[index] = serializer.validated_data
+            else:
+                errors[index] = serializer.errors
+
+        def fetch(queryset, field):
+            ids = {data[field] for data in validated.values() if data.get(field) is not None}
+            return queryset.filter(company=self.company).in_bulk(ids)
+
+        # Lines without a category fall back to their item's, so it comes with the item
+        items = fetch(InventoryItem.objects.select_related('category'), 'item')
+        locations = fetch(Location.objects, 'location')
+        categories = fetch(Category.objects, 'category')
+
+        for index, data in validated.items():
+            item = items.get(data['item'])
+            location = locations.get(data['location'])
+            category = categories.get(data['category']) if data.get('category') is not None else None
+            line_errors = {}
+            if item is None:
+                line_errors['item'] = [f"Invalid pk \"{data['item']}\" - object does not exist."]
+            if location is None:
+                line_errors['location'] = [f"Invalid pk \"{data['location']}\" - object does not exist."]
+            if data.get('category') is not None and category is None:
+                line_errors['category'] = [f"Invalid pk \"{data['category']}\" - object does not exist."]
+            if line_errors:
+                errors[index] = line_errors
+                continue
+            adjustments[index] = StockAdjustment(
+                item=item,
+                product_id=item.product_id,
+                adjustment_type=data['adjustment_type'],
+                quantity=data['quantity'],
+                date=data['date'],
+                reason=data.get('reason'),
+                location=location,
+                category=category or item.category,
+                sku=item.sku,
+                product_code=item.product_code,
+                company=self.company,
+                user=self.user,
+            )
+        return adjustments, errors
+
+    def run(self, lines, mode='atomic'):
+        """
+        Book the lines and return (created adjustments, [{'line': n, 'errors': {...}}]).
+
+        In 'atomic' mode nothing is saved unless every line is valid and in stock;
+        in 'partial' mode each failing line is skipped and the rest are saved.
+        """
+        adjustments, errors = self._resolve(lines)
+
+        with transaction.atomic():
+            if adjustments:
+                keys = {index: ledger.balance_key(a.product_id, a.location_id) for index, a in adjustments.items()}
+                on_hand = ledger.available(set(keys.values()))
+                # Lines draw on their balance in the order they were sent
+                for index in sorted(adjustments):
+                    quantity = adjustments[index].quantity
+                    if on_hand[keys[index]] < quantity:
+                        errors[index] = {'quantity': [
+                            f"Insufficient stock, only {on_hand[keys[index]]} available for this line."
+                        ]}
+                    else:
+                        on_hand[keys[index]] -= quantity
+
+            if errors and mode == 'atomic':
+                created = []
+            else:
+                created = [adjustments[index] for index in sorted(adjustments) if index not in errors]
+                StockAdjustment.objects.bulk_create(created)
+                search.index(created)
+                rollups.add(created)
+                ledger.post([m for adjustment in created for m in ledger.adjustment_movements(adjustment)])
+
+        report = [{'line': index, 'errors': errors[index]} for index in sorted(errors)]
+        return created, report
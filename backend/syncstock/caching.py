@@ -0,0 +1,106 @@
+"""
+Versioned per-company caches.
+
+Cached entries are stored under keys that include the company's current
+version for their namespace. Bumping the version (signals do it after each
+relevant write commits) retires every entry of the company at once, without
+having to find and delete keys; the old entries simply expire.
+
+Versions live in the default cache, so deployments running several processes
+need a shared backend (Memcached, Redis, the database) for invalidation to
+reach all of them.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+TIMEOUT = 60 * 60
+
+_MISSING = object()
+
+
+def _version_key(namespace, company_id):
+    return f'syncstock:{namespace}:version:{company_id}'
+
+
+def version(namespace, company_id):
+    """Return the company's current version for namespace."""
+    key = _version_key(namespace, company_id)
+    current = cache.get(key)
+    if current is None:
+        # Start from the clock so a version lost to eviction never comes back as an older one
+        current = time.time_ns()
+        cache.add(key, current, timeout=None)
+        current = cache.get(key, current)
+    return current
+
+
+def bump(namespace, company_id):
+    """Retire the company's cached entries in namespace once the current transaction commits."""
+    def incr():
+        key = _version_key(namespace, company_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+    transaction.on_commit(incr)
+
+
+def fingerprint(company_id, current, params):
+    """Short stable hash of a company, its version and request parameters, for cache keys and ETags."""
+    text = f'{company_id}:{current}:' + '&'.join(f'{key}={params[key]}' for key in sorted(params))
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def cached(namespace, company_id, params, compute, timeout=TIMEOUT, depends_on=None):
+    """
+    Return (value, hit) for the cached value of (company, params), computing it on a miss.
+
+    Entries are kept at the company's current version of `depends_on`, the
+    namespace itself by default. If compute() raises, nothing is cached.
+    """
+    current = version(depends_on or namespace, company_id)
+    key = f'syncstock:{namespace}:{fingerprint(company_id, current, params)}'
+    value = cache.get(key, _MISSING)
+    hit = value is not _MISSING
+    _count(namespace, 'hits' if hit else 'misses')
+    if not hit:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value, hit
+
+
+def get_or_set(namespace, company_id, params, compute, timeout=TIMEOUT):
+    """Return the cached value for (company, params) at the current version, computing it on a miss."""
+    return cached(namespace, company_id, params, compute, timeout)[0]
+
+
+def _count(namespace, outcome):
+    key = f'syncstock:{namespace}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats(namespaces):
+    """Hit and miss counts of each namespace since the counters were last evicted or cleared."""
+    counts = cache.get_many([f'syncstock:{namespace}:{outcome}' for namespace in namespaces for outcome in ('hits', 'misses')])
+    result = {}
+    for namespace in namespaces:
+        hits = counts.get(f'syncstock:{namespace}:hits', 0)
+        misses = counts.get(f'syncstock:{namespace}:misses', 0)
+        result[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+    return result
+
+
+def etag(namespace, company_id, params):
+    """ETag of the cached entry for (company, params) at the current version."""
+    return f'"{fingerprint(company_id, version(namespace, company_id), params)}"'
@@ -0,0 +1,79 @@
+"""
+Key figures of a company's stock for the dashboard, in one request.
+
+kpis() reads everything inside one transaction from a handful of grouped
+queries: the balances are valued and grouped by location once, and the
+company-wide totals and low-stock count are summed from those rows; the
+period's adjustments come from the daily rollups and its top movers from the
+adjustments themselves.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import AdjustmentRollup, StockAdjustment, TotalCurrentInventory
+from .aggregation import CENT
+
+LOW_STOCK = 10    # a balance at or below this many units is low
+TOP_MOVERS = 5
+
+
+def period(today=None):
+    """The default period: the current month up to today."""
+    today = today or timezone.localdate()
+    return today.replace(day=1), today
+
+
+def kpis(company, start_date, end_date, low_stock=LOW_STOCK, top=TOP_MOVERS):
+    """The company's dashboard figures, with adjustments and top movers for start_date..end_date."""
+    in_period = {'date__gte': start_date, 'date__lte': end_date}
+    with transaction.atomic():
+        balances = TotalCurrentInventory.objects.filter(company=company)
+        locations = list(
+            balances.valued()
+            .values('location', 'location__name')
+            .annotate(
+                units=Sum('total_current_inventory'),
+                value=Sum('value'),
+                low_stock=Count('pk', filter=Q(total_current_inventory__lte=low_stock)),
+            )
+            .order_by('location__name', 'location')
+        )
+        adjustments = list(
+            AdjustmentRollup.objects.filter(company=company, lines__gt=0, **in_period)
+            .values('adjustment_type')
+            .annotate(quantity=Sum('quantity'), count=Sum('lines'))
+            .order_by('adjustment_type')
+        )
+        # Products the most units were taken out of stock of, whatever the reason
+        movers = list(
+            StockAdjustment.objects.filter(company=company, **in_period)
+            .values('product', 'product__sku', 'product__item_name')
+            .annotate(quantity=Sum('quantity'))
+            .order_by('-quantity', 'product')[:top]
+        )
+
+    locations = [
+        {'location': row['location'], 'location_name': row['location__name'], 'units': row['units'],
+         'value': row['value'].quantize(CENT), 'low_stock': row['low_stock']}
+        for row in locations
+    ]
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'total_units': sum(row['units'] for row in locations),
+        'total_value': sum((row['value'] for row in locations), Decimal('0.00')),
+        'low_stock': {
+            'threshold': low_stock,
+            'count': sum(row['low_stock'] for row in locations),
+        },
+        'adjustments_by_type': adjustments,
+        'top_movers': [
+            {'product': row['product'], 'sku': row['product__sku'], 'item_name': row['product__item_name'],
+             'quantity': row['quantity']}
+            for row in movers
+        ],
+        'locations': locations,
+    }
@@ -0,0 +1,183 @@
+"""
+File exports of the list endpoints.
+
+Rows are read with values_list() over a chunked iterator and written out as
+they arrive, so memory stays flat however many rows match and the first bytes
+leave before the query has been read to the end.
+"""
+import csv
+import json
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Echo:
+    # File-like object handing back what csv.writer writes instead of storing it
+    def write(self, value):
+        return value
+
+
+# Spreadsheet apps opening a CSV run text starting with these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_value(value):
+    # A leading quote makes it plain text, as the text cells of the workbooks do
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def ndjson_lines(headers, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(headers, row)), default=str) + '\n'
+
+
+WRITERS = {
+    'csv': csv_lines,
+    'ndjson': ndjson_lines,
+}
+
+
+def streaming_response(queryset, columns, fmt, name):
+    """Stream `queryset` as a CSV or NDJSON download of `columns`, [(header, model path)]."""
+    headers = [header for header, _ in columns]
+    rows = queryset.values_list(*[path for _, path in columns]).iterator(chunk_size=CHUNK_SIZE)
+    response = StreamingHttpResponse(WRITERS[fmt](headers, rows), content_type=CONTENT_TYPES[fmt])
+    filename = f'{name}-{timezone.localdate():%Y-%m-%d}.{fmt}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Excel workbooks
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+MAX_SHEET_ROWS = 1048576  # Excel's row limit, header included
+
+BALANCE_COLUMNS = [
+    ('SKU', 'sku'),
+    ('Item name', 'item_name'),
+    ('Product code', 'product_code'),
+    ('Category', 'category__name'),
+    ('Quantity', 'total_current_inventory'),
+]
+MOVEMENT_COLUMNS = [
+    ('Date', 'date'),
+    ('SKU', 'product__sku'),
+    ('Item name', 'product__item_name'),
+    ('Location', 'location__name'),
+    ('Category', 'category__name'),
+    ('Quantity', 'quantity'),
+    ('Source', 'source_type'),
+    ('Source id', 'source_id'),
+]
+
+
+def _sheet_title(name, taken):
+    # Excel titles are at most 31 characters, unique, and exclude []:*?/\
+    base = ''.join(ch for ch in name if ch not in '[]:*?/\\').strip("' ")[:31] or 'Sheet'
+    title, n = base, 1
+    while title.lower() in taken:
+        n += 1
+        suffix = f' ({n})'
+        title = base[:31 - len(suffix)] + suffix
+    taken.add(title.lower())
+    return title
+
+
+def _reference(title, cell):
+    return "'{}'!{}".format(title.replace("'", "''"), cell)
+
+
+def _cells(sheet, row):
+    # Text starting with '=' would otherwise be written as a formula
+    return [
+        _text_cell(sheet, value) if isinstance(value, str) and value.startswith('=') else value
+        for value in row
+    ]
+
+
+def _text_cell(sheet, value):
+    cell = WriteOnlyCell(sheet, value)
+    cell.data_type = 's'
+    return cell
+
+
+def stock_workbook(balances, movements):
+    """
+    Write a stock-levels workbook to a temporary file and return it, rewound.
+
+    There is a summary sheet, one sheet per location with the balances from
+    `balances` and a SUM row, and the journal rows from `movements` spread
+    over as many history sheets as Excel's row limit requires. The workbook
+    is in write-only mode, so rows go to disk as they are read from the
+    iterators.
+    """
+    workbook = Workbook(write_only=True)
+    taken = set()
+    summary = workbook.create_sheet(_sheet_title('Summary', taken))
+    summary.append(['Location', 'Lines', 'Quantity'])
+    quantity_column = get_column_letter(len(BALANCE_COLUMNS))
+
+    paths = ['location_id', 'location__name'] + [path for _, path in BALANCE_COLUMNS]
+    rows = balances.order_by('location__name', 'location_id', 'sku').values_list(*paths).iterator(chunk_size=CHUNK_SIZE)
+    locations = 0
+    for (_, location_name), group in groupby(rows, key=itemgetter(0, 1)):
+        sheet = workbook.create_sheet(_sheet_title(location_name, taken))
+        sheet.append([header for header, _ in BALANCE_COLUMNS])
+        last = 1
+        for row in group:
+            sheet.append(_cells(sheet, row[2:]))
+            last += 1
+        total = f'{quantity_column}{last + 1}'
+        sheet.append(['Total'] + [None] * (len(BALANCE_COLUMNS) - 2) + [f'=SUM({quantity_column}2:{quantity_column}{last})'])
+        summary.append([
+            _text_cell(summary, location_name),
+            f'=COUNTA({_reference(sheet.title, f"A2:A{last}")})',
+            f'={_reference(sheet.title, total)}',
+        ])
+        locations += 1
+    summary.append(['Total', f'=SUM(B2:B{locations + 1})', f'=SUM(C2:C{locations + 1})'])
+
+    rows = movements.order_by('date', 'id').values_list(*[path for _, path in MOVEMENT_COLUMNS]).iterator(chunk_size=CHUNK_SIZE)
+    sheet, written = None, MAX_SHEET_ROWS
+    for row in rows:
+        if written == MAX_SHEET_ROWS:
+            sheet = workbook.create_sheet(_sheet_title('Movements', taken))
+            sheet.append([header for header, _ in MOVEMENT_COLUMNS])
+            written = 1
+        sheet.append(_cells(sheet, row))
+        written += 1
+    if sheet is None:
+        workbook.create_sheet(_sheet_title('Movements', taken)).append([header for header, _ in MOVEMENT_COLUMNS])
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def workbook_response(balances, movements, name):
+    filename = f'{name}-{timezone.localdate():%Y-%m-%d}.xlsx'
+    return FileResponse(stock_workbook(balances, movements), as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
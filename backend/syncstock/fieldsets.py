@@ -0,0 +1,83 @@
+"""
+Sparse fieldsets: ?fields=a,b,c on list endpoints.
+
+Only the requested serializer fields (and the id) are rendered, so method
+fields nobody asked for never run, and the view loads only the columns and
+relations those fields read. Serializers name what their method fields read
+in `method_field_sources`; without an entry the queryset is left as is.
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+PARAM = 'fields'
+
+
+def requested_fields(request):
+    """Field names asked for with ?fields= on a read request, or None for all of them."""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    value = request.query_params.get(PARAM)
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()} | {'id'}
+
+
+class SparseFieldsetSerializerMixin:
+    # Model paths each SerializerMethodField reads, e.g. {'item_name': ['item__item_name']}
+    method_field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = requested_fields(self.context.get('request'))
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    def scope(self, **querysets):
+        """Set the querysets of related fields, skipping those left out by ?fields=."""
+        for name, queryset in querysets.items():
+            if name in self.fields:
+                self.fields[name].queryset = queryset
+
+    def model_paths(self, names):
+        """Model paths read by the named fields, or None when one of them can't be told."""
+        paths = set()
+        for name in names:
+            field = self.fields[name]
+            if isinstance(field, serializers.SerializerMethodField):
+                if name not in self.method_field_sources:
+                    return None
+                paths.update(self.method_field_sources[name])
+            elif field.source == '*':
+                return None
+            else:
+                paths.add(field.source.replace('.', '__'))
+        return paths
+
+
+class SparseFieldsetMixin:
+    """View mixin trimming the queryset to the columns behind ?fields=."""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        requested = requested_fields(self.request)
+        if requested is None:
+            return queryset
+
+        serializer = self.get_serializer()
+        unknown = requested - set(serializer.fields)
+        if unknown:
+            raise ValidationError({PARAM: [f"Unknown field(s): {', '.join(sorted(unknown))}."]})
+        paths = serializer.model_paths(requested)
+        if paths is None:
+            return queryset
+
+        # Keyset pagination reads its position from the last row
+        paths.update(getattr(self, 'cursor_ordering', ()))
+
+        # Every relation a path runs through is joined; everything else stays deferred
+        relations = {path.rsplit('__', 1)[0] for path in paths if '__' in path}
+        queryset = queryset.select_related(None)
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*paths)
@@ -1,6 +1,10 @@
+import logging
+
 import django_filters
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import InventoryItem, Category, Location, StockAdjustment, StockTransfer, TotalCurrentInventory
+from .models import InventoryItem, Category, Location, StockAdjustment, StockTransfer, TotalCurrentInventory, StockMovement
+
+logger = logging.getLogger(__name__)
 
 class InventoryItemFilterSet(django_filters.FilterSet):
     category = django_filters.ModelChoiceFilter(queryset=Category.objects.none())
@@ -23,8 +27,8 @@ class InventoryItemFilterSet(django_filters.FilterSet):
             self.filters['category'].queryset = Category.objects.filter(company=company)
             self.filters['location'].queryset = Location.objects.filter(company=company)
         else:
-            # Handle the case where request or company is not properly set
-            print("Request or company not set correctly")
+            # The choices stay empty rather than offering every company's rows
+            logger.warning("%s built without a request user's company", type(self).__name__)
 
 class StockAdjustmentFilterSet(django_filters.FilterSet):
     item = django_filters.ModelChoiceFilter(queryset=InventoryItem.objects.none())
@@ -47,8 +51,8 @@ class StockAdjustmentFilterSet(django_filters.FilterSet):
             self.filters['location'].queryset = Location.objects.filter(company=company)
             self.filters['category'].queryset = Category.objects.filter(company=company)
         else:
-            # Handle the case where request or company is not properly set
-            print("Request or company not set correctly")
+            # The choices stay empty rather than offering every company's rows
+            logger.warning("%s built without a request user's company", type(self).__name__)
 
 class StockTransferFilterSet(django_filters.FilterSet):
     item = django_filters.ModelChoiceFilter(queryset=InventoryItem.objects.none())
@@ -73,8 +77,8 @@ class StockTransferFilterSet(django_filters.FilterSet):
             self.filters['to_location'].queryset = Location.objects.filter(company=company)
             self.filters['category'].queryset = Category.objects.filter(company=company)
         else:
-            # Handle the case where request or company is not properly set
-            print("Request or company not set correctly")
+            # The choices stay empty rather than offering every company's rows
+            logger.warning("%s built without a request user's company", type(self).__name__)
 
 class TotalCurrentInventoryFilterSet(django_filters.FilterSet):
     item_name = django_filters.CharFilter(field_name='item_name', lookup_expr='icontains')
@@ -95,5 +99,27 @@ class TotalCurrentInventoryFilterSet(django_filters.FilterSet):
             self.filters['location'].queryset = Location.objects.filter(company=company)
             self.filters['category'].queryset = Category.objects.filter(company=company)
         else:
-            print("Request or company not set correctly")
+            # The choices stay empty rather than offering every company's rows
+            logger.warning("%s built without a request user's company", type(self).__name__)
+
+class StockMovementFilterSet(django_filters.FilterSet):
+    location = django_filters.ModelChoiceFilter(queryset=Location.objects.none())
+    category = django_filters.ModelChoiceFilter(queryset=Category.objects.none())
+    start_date = django_filters.DateFilter(field_name='date', lookup_expr='gte')
+    end_date = django_filters.DateFilter(field_name='date', lookup_expr='lte')
+
+    class Meta:
+        model = StockMovement
+        fields = ['location', 'category', 'start_date', 'end_date']
 
+    def __init__(self, *args, **kwargs):
+        request = kwargs.pop('request', None)
+        super().__init__(*args, **kwargs)
+
+        if request and request.user and hasattr(request.user, 'company'):
+            company = request.user.company
+            self.filters['location'].queryset = Location.objects.filter(company=company)
+            self.filters['category'].queryset = Category.objects.filter(company=company)
+        else:
+            # The choices stay empty rather than offering every company's rows
+            logger.warning("%s built without a request user's company", type(self).__name__)
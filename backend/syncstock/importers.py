@@ -0,0 +1,220 @@
+"""
+Bulk inventory import from CSV or XLSX files.
+
+Rows are streamed from the upload, validated against the company's categories
+and locations held in memory, and written with bulk_create in batches. Balances
+are booked once per (product, location) through the ledger after all rows are in.
+"""
+import csv
+import datetime
+import io
+from decimal import Decimal, InvalidOperation
+
+import openpyxl
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from .models import InventoryItem, Category, Location, Product
+from . import ledger, caching, search, rollups
+
+BATCH_SIZE = 1000
+
+REQUIRED_COLUMNS = ['item_name', 'sku', 'quantity', 'price', 'inventory_date', 'category', 'location']
+OPTIONAL_COLUMNS = ['product_code', 'supplier_name', 'additional_description', 'expiration_date']
+
+MAX_LENGTHS = {
+    'item_name': 255,
+    'sku': 50,
+    'product_code': 100,
+    'supplier_name': 255,
+}
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def _normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+
+def _csv_rows(upload):
+    reader = csv.reader(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''))
+    yield from reader
+
+
+def _xlsx_rows(upload):
+    try:
+        workbook = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+    except Exception as exc:
+        raise ImportFileError(f"Could not read the workbook: {exc}")
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_rows(upload):
+    """Yield (row_number, {column: value}) pairs from an uploaded CSV or XLSX file."""
+    name = (getattr(upload, 'name', '') or '').lower()
+    if name.endswith('.xlsx'):
+        rows = _xlsx_rows(upload)
+    elif name.endswith('.csv'):
+        rows = _csv_rows(upload)
+    else:
+        raise ImportFileError("Unsupported file type, upload a .csv or .xlsx file.")
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError("The file is empty.")
+    columns = [_normalize_header(value) for value in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ImportFileError(f"Missing required columns: {', '.join(missing)}.")
+
+    for row_number, values in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in values):
+            continue
+        yield row_number, dict(zip(columns, values))
+
+
+class InventoryImport:
+    """Validates and imports inventory rows for one company and user."""
+
+    def __init__(self, company, user):
+        self.company = company
+        self.user = user
+        self.categories = self._lookup(Category.objects.filter(company=company))
+        self.locations = self._lookup(Location.objects.filter(company=company))
+
+    @staticmethod
+    def _lookup(queryset):
+        # Rows may reference categories and locations by id or (case-insensitive) name
+        lookup = {}
+        for pk, name in queryset.values_list('pk', 'name'):
+            lookup[str(pk)] = pk
+            lookup.setdefault(name.strip().lower(), pk)
+        return lookup
+
+    def _text(self, row, column, errors, required=False):
+        value = row.get(column)
+        value = '' if value is None else str(value).strip()
+        if required and not value:
+            errors[column] = "This field is required."
+        elif column in MAX_LENGTHS and len(value) > MAX_LENGTHS[column]:
+            errors[column] = f"Ensure this field has no more than {MAX_LENGTHS[column]} characters."
+        return value
+
+    def _date(self, row, column, errors, required=False):
+        value = row.get(column)
+        if isinstance(value, datetime.datetime):
+            return value.date()
+        if isinstance(value, datetime.date):
+            return value
+        value = '' if value is None else str(value).strip()
+        if not value:
+            if required:
+                errors[column] = "This field is required."
+            return None
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            errors[column] = "Enter a valid date in YYYY-MM-DD format."
+        return parsed
+
+    def _reference(self, row, column, lookup, errors):
+        value = row.get(column)
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        value = '' if value is None else str(value).strip().lower()
+        pk = lookup.get(value)
+        if pk is None:
+            errors[column] = "This field is required." if not value else f"Unknown {column} '{row.get(column)}'."
+        return pk
+
+    def build_item(self, row):
+        """Return (InventoryItem, None) for a valid row or (None, errors)."""
+        errors = {}
+
+        try:
+            quantity = Decimal(str(row.get('quantity')).strip())
+            if quantity <= 0 or quantity != quantity.to_integral_value():
+                raise ValueError
+            quantity = int(quantity)
+        except (InvalidOperation, ValueError, OverflowError):
+            quantity = None
+            errors['quantity'] = "Quantity must be a positive whole number."
+
+        try:
+            price = Decimal(str(row.get('price')).strip()).quantize(Decimal('0.01'))
+            if price < 0:
+                errors['price'] = "Price cannot be negative."
+        except (InvalidOperation, ValueError):
+            price = None
+            errors['price'] = "A valid number is required."
+
+        item = InventoryItem(
+            item_name=self._text(row, 'item_name', errors, required=True),
+            sku=self._text(row, 'sku', errors, required=True),
+            product_code=self._text(row, 'product_code', errors),
+            supplier_name=self._text(row, 'supplier_name', errors),
+            additional_description=self._text(row, 'additional_description', errors) or None,
+            quantity=quantity,
+            price=price,
+            inventory_date=self._date(row, 'inventory_date', errors, required=True),
+            expiration_date=self._date(row, 'expiration_date', errors),
+            category_id=self._reference(row, 'category', self.categories, errors),
+            location_id=self._reference(row, 'location', self.locations, errors),
+            user=self.user,
+            company=self.company,
+        )
+        if errors:
+            return None, errors
+        return item, None
+
+    def run(self, upload):
+        """
+        Import every valid row of the upload in one transaction.
+
+        Invalid rows are skipped and reported as {'row': n, 'errors': {...}}.
+        """
+        created = 0
+        errors = []
+        receipts = {}
+        batch = []
+
+        def flush():
+            Product.objects.resolve_many(self.company.pk, batch)
+            InventoryItem.objects.bulk_create(batch)
+            search.index(batch)
+            rollups.add(batch)
+            movements = [movement for item in batch for movement in ledger.receipt_movements(item)]
+            ledger.record(movements)
+            # Net receipts per balance so the ledger books one movement per (product, location)
+            for movement in movements:
+                key = movement.key
+                if key in receipts:
+                    receipts[key] = receipts[key]._replace(quantity=receipts[key].quantity + movement.quantity)
+                else:
+                    receipts[key] = movement
+            batch.clear()
+
+        with transaction.atomic():
+            for row_number, row in read_rows(upload):
+                item, row_errors = self.build_item(row)
+                if row_errors:
+                    errors.append({'row': row_number, 'errors': row_errors})
+                    continue
+                batch.append(item)
+                created += 1
+                if len(batch) >= BATCH_SIZE:
+                    flush()
+            if batch:
+                flush()
+            ledger.post(list(receipts.values()), journal=False)
+            if created:
+                caching.bump('filters', self.company.pk)
+
+        return {'created': created, 'failed': len(errors), 'errors': errors}
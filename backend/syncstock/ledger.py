@@ -0,0 +1,420 @@
+"""
+Stock ledger: the single write path for stock balances.
+
+Every movement is appended to the StockMovement journal, and
+TotalCurrentInventory is kept as a projection of it that replay() can rebuild.
+Balances are keyed on (product_id, location_id).
+
+Each balance change is applied as one conditional UPDATE
+(``total_current_inventory = total_current_inventory + delta``) so concurrent
+writers never overwrite each other's changes, and debits only succeed while
+enough stock is on hand. Batches touching many balances are booked set-based:
+one locking SELECT, then one UPDATE and one INSERT per batch.
+
+Balances with a reorder point are checked after every booking, and an alert is
+recorded when one crosses its threshold (see alerts.py).
+
+Inside a coalesce() block, posted movements are held back and booked together
+when the block ends, so an operation that moves the same balance many times
+(deleting an item together with its adjustments and transfers, say) writes each
+balance once.
+"""
+import datetime
+import logging
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F, Max, Sum
+from django.db.models.functions import Greatest
+
+from .models import InventoryItem, StockAdjustment, StockTransfer, TotalCurrentInventory, StockMovement, Product
+from . import caching, alerts, upserts
+
+logger = logging.getLogger(__name__)
+
+INSUFFICIENT_STOCK = "Insufficient stock, cannot proceed."
+
+# Balances handled per statement when many are booked at once
+BATCH_SIZE = 500
+
+
+# Journal source_type for each kind of document that moves stock
+SOURCE_TYPES = {
+    'inventoryitem': 'receipt',
+    'stockadjustment': 'adjustment',
+    'stocktransfer': 'transfer',
+}
+
+
+class Movement(NamedTuple):
+    product_id: int
+    company_id: int
+    category_id: int    # category the document was booked under
+    location_id: int
+    quantity: int       # signed: positive adds stock, negative removes it
+    source: object      # document that caused the movement
+    date: datetime.date
+    reversal: bool = False  # undoing an earlier movement: never creates rows, clamps at zero
+
+    @property
+    def key(self):
+        return balance_key(self.product_id, self.location_id)
+
+
+class Correction(NamedTuple):
+    key: tuple
+    before: int         # None when the balance row did not exist
+    after: int
+    computed: int       # total according to history; negative means history is short
+
+
+def balance_key(product_id, location_id):
+    # Matches TotalCurrentInventory's unique_together
+    return (product_id, location_id)
+
+
+def receipt_movements(item):
+    return [Movement(item.product_id, item.company_id, item.category_id, item.location_id,
+                     item.quantity, item, item.inventory_date)]
+
+
+def adjustment_movements(adjustment):
+    return [Movement(adjustment.product_id, adjustment.company_id, adjustment.category_id, adjustment.location_id,
+                     -adjustment.quantity, adjustment, adjustment.date)]
+
+
+def transfer_movements(transfer):
+    return [
+        Movement(transfer.product_id, transfer.company_id, transfer.category_id, transfer.from_location_id,
+                 -transfer.quantity, transfer, transfer.date),
+        Movement(transfer.product_id, transfer.company_id, transfer.category_id, transfer.to_location_id,
+                 transfer.quantity, transfer, transfer.date),
+    ]
+
+
+def reverse(movements):
+    return [m._replace(quantity=-m.quantity, reversal=True) for m in movements]
+
+
+class _Net(NamedTuple):
+    # Movements on one balance netted together
+    movement: Movement  # representative, for the company and category of a new row
+    quantity: int
+    strict: bool        # a debit that must not overdraw the balance
+    creatable: bool     # a credit that may create the balance row
+    error_message: str  # raised when the strict debit fails
+
+
+# Movements held back by the coalesce() block open in this thread, if any
+_pending = threading.local()
+
+
+def _net(movements, error_message, net=None):
+    net = {} if net is None else net
+    for movement in movements:
+        current = net.get(movement.key, _Net(movement, 0, False, False, error_message))
+        strict = movement.quantity < 0 and not movement.reversal
+        net[movement.key] = _Net(
+            current.movement,
+            current.quantity + movement.quantity,
+            current.strict or strict,
+            current.creatable or (movement.quantity > 0 and not movement.reversal),
+            current.error_message if current.strict or not strict else error_message,
+        )
+    return net
+
+
+def post(movements, error_message=INSUFFICIENT_STOCK, journal=True):
+    """
+    Journal movements and apply them to their balances in one transaction.
+
+    Movements on the same balance are netted first, so editing a document books
+    only the difference. Raises ValidationError if any debit exceeds the stock on
+    hand; the caller's transaction is then rolled back as a whole. Callers that
+    have already journaled the movements themselves pass journal=False.
+
+    Inside a coalesce() block the movements are only collected; they are checked
+    and booked when the block ends.
+    """
+    movements = [movement for movement in movements if movement.quantity]
+    pending = getattr(_pending, 'block', None)
+    if pending is not None:
+        if journal:
+            _journal(movements, pending['journal'])
+        _net(movements, error_message, pending['net'])
+        return
+    _book(_journal(movements) if journal else {}, _net(movements, error_message))
+
+
+@contextmanager
+def coalesce():
+    """
+    Collect the movements posted inside the block and book them together on exit.
+
+    Each balance is written once with the net change of the whole block, in the
+    same transaction as the documents that caused it. Nested blocks join the
+    outermost one. Insufficient stock is only detected when the block ends, and
+    movements posted inside a savepoint that is rolled back while the block
+    carries on are booked all the same, so errors must not be swallowed inside it.
+    """
+    if getattr(_pending, 'block', None) is not None:
+        yield
+        return
+    with transaction.atomic():
+        _pending.block = {'journal': {}, 'net': {}}
+        try:
+            yield
+            block = _pending.block
+        finally:
+            _pending.block = None
+        _book(block['journal'], block['net'])
+
+
+def _book(journal, net):
+    net = {key: entry for key, entry in net.items() if entry.quantity}
+    if not net and not journal:
+        return
+
+    with transaction.atomic():
+        if journal:
+            _save_journal(journal)
+        if len(net) == 1:
+            _apply(*next(iter(net.items())))
+        elif net:
+            _apply_many(net)
+        alerts.check(net)
+
+
+def available(keys):
+    """
+    Lock the balances for `keys` and return {key: quantity on hand} in one query.
+
+    Missing balances count as zero, and movements still held back by a coalesce()
+    block are included. Call inside a transaction so the locks last until the
+    movements checked against them have been posted.
+    """
+    rows = _fetch_many(keys)
+    pending = getattr(_pending, 'block', None)
+    pending = pending['net'] if pending is not None else {}
+    return {
+        key: (rows[key].total_current_inventory if key in rows else 0)
+        + (pending[key].quantity if key in pending else 0)
+        for key in keys
+    }
+
+
+def record(movements):
+    """Append movements to the journal, one entry per balance, source document and date."""
+    _save_journal(_journal(movements))
+
+
+def _journal(movements, entries=None):
+    # Unsaved journal entries by (balance, source type, source id, date), read while the sources still have a pk
+    entries = {} if entries is None else entries
+    for movement in movements:
+        source = movement.source
+        journal_key = (movement.key, SOURCE_TYPES[source._meta.model_name], source.pk, movement.date)
+        entry = entries.get(journal_key)
+        if entry is None:
+            entries[journal_key] = StockMovement(
+                company_id=movement.company_id,
+                product_id=movement.product_id,
+                location_id=movement.location_id,
+                category_id=movement.category_id,
+                quantity=movement.quantity,
+                date=movement.date,
+                source_type=journal_key[1],
+                source_id=source.pk,
+            )
+        else:
+            entry.quantity += movement.quantity
+    return entries
+
+
+def _save_journal(entries):
+    entries = [entry for entry in entries.values() if entry.quantity]
+    StockMovement.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+    for company_id in {entry.company_id for entry in entries}:
+        caching.bump('stock', company_id)
+
+
+def replay(company, dry_run=False):
+    """Rebuild the company's balances from the journal, returning the corrections made."""
+    history = (
+        StockMovement.objects.filter(company=company)
+        .values_list('product_id', 'location_id')
+        .annotate(category_id=Max('category_id'), total=Sum('quantity'))
+        .order_by()
+    )
+    totals = {
+        balance_key(product_id, location_id): (category_id, total)
+        for product_id, location_id, category_id, total in history
+    }
+    return sync_balances(company, totals, dry_run)
+
+
+def document_totals(company_ids):
+    """
+    Compute balances straight from the source documents for several companies.
+
+    Runs one grouped query per kind of movement and returns
+    {company_id: {key: (category_id, quantity)}}.
+    """
+    queries = [
+        (InventoryItem.objects, 'location_id', 1),
+        (StockAdjustment.objects, 'location_id', -1),
+        (StockTransfer.objects, 'from_location_id', -1),
+        (StockTransfer.objects, 'to_location_id', 1),
+    ]
+
+    totals = {company_id: {} for company_id in company_ids}
+    for manager, location_field, sign in queries:
+        grouped = (
+            manager.filter(company_id__in=company_ids)
+            .values_list('company_id', 'product_id', location_field)
+            .annotate(category_id=Max('category_id'), total=Sum('quantity'))
+            .order_by()
+        )
+        for company_id, product_id, location_id, category_id, total in grouped:
+            key = balance_key(product_id, location_id)
+            known_category, quantity = totals[company_id].get(key, (category_id, 0))
+            totals[company_id][key] = (known_category, quantity + sign * total)
+    return totals
+
+
+def sync_balances(company_id, totals, dry_run=False):
+    """
+    Overwrite the company's balances with `totals`, {key: (category_id, quantity)}.
+
+    Balances missing from `totals` are set to zero and negative totals are stored
+    as zero. Returns a Correction for every balance whose value changed; with
+    dry_run the corrections are computed but nothing is written.
+    """
+    corrections, changed, missing = [], [], []
+    with transaction.atomic():
+        balances = TotalCurrentInventory.objects.filter(company_id=company_id)
+        if connection.features.has_select_for_update:
+            balances = balances.select_for_update()
+        rows = {balance_key(row.product_id, row.location_id): row for row in balances}
+
+        for key, (category_id, computed) in totals.items():
+            row = rows.pop(key, None)
+            after = max(0, computed)
+            if row is None:
+                if after:
+                    missing.append(Movement(key[0], company_id, category_id, key[1], after, None, None))
+                if computed:
+                    corrections.append(Correction(key, None, after, computed))
+            elif row.total_current_inventory != after or computed < 0:
+                corrections.append(Correction(key, row.total_current_inventory, after, computed))
+                row.total_current_inventory = after
+                changed.append(row)
+
+        # Balances with no history behind them at all
+        for key, row in rows.items():
+            if row.total_current_inventory:
+                corrections.append(Correction(key, row.total_current_inventory, 0, 0))
+                row.total_current_inventory = 0
+                changed.append(row)
+
+        if not dry_run:
+            TotalCurrentInventory.objects.bulk_update(changed, ['total_current_inventory'], batch_size=BATCH_SIZE)
+            TotalCurrentInventory.objects.bulk_create(_new_balances(missing), batch_size=BATCH_SIZE)
+            alerts.check([correction.key for correction in corrections])
+            if corrections:
+                caching.bump('stock', company_id)
+    return corrections
+
+
+def _new_balances(movements):
+    # Unsaved balance rows for credits to balances that do not exist yet
+    products = Product.objects.in_bulk({movement.product_id for movement in movements})
+    return [
+        TotalCurrentInventory(
+            company_id=movement.company_id,
+            product_id=movement.product_id,
+            location_id=movement.location_id,
+            category_id=movement.category_id,
+            item_name=products[movement.product_id].item_name,
+            product_code=products[movement.product_id].product_code,
+            sku=products[movement.product_id].sku,
+            total_current_inventory=movement.quantity,
+        )
+        for movement in movements
+    ]
+
+
+def _fetch_many(keys):
+    # Rows are locked in primary key order where supported so concurrent writers can't deadlock
+    rows = {}
+    keys = sorted(keys)
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start:start + BATCH_SIZE]
+        balances = TotalCurrentInventory.objects.filter(
+            product_id__in={key[0] for key in batch},
+            location_id__in={key[1] for key in batch},
+        ).order_by('pk')
+        if connection.features.has_select_for_update:
+            balances = balances.select_for_update()
+        wanted = set(batch)
+        for row in balances:
+            key = balance_key(row.product_id, row.location_id)
+            if key in wanted:
+                rows[key] = row
+    return rows
+
+
+def _apply_many(net):
+    rows = _fetch_many(net)
+    total = F('total_current_inventory')
+
+    for key, entry in net.items():
+        row = rows.get(key)
+        if entry.quantity >= 0 or (row is not None and row.total_current_inventory >= -entry.quantity):
+            continue
+        if entry.strict:
+            raise ValidationError(entry.error_message)
+        if row is not None:
+            logger.warning("Balance %s is short by %d on reversal; clamped at zero.",
+                           key, -entry.quantity - row.total_current_inventory)
+
+    changed, missing = [], []
+    for key, entry in net.items():
+        row = rows.get(key)
+        if row is not None:
+            if entry.quantity > 0 or entry.strict:
+                row.total_current_inventory = total + entry.quantity
+            else:
+                row.total_current_inventory = Greatest(total + entry.quantity, 0)
+            changed.append(row)
+        elif entry.quantity > 0 and entry.creatable:
+            missing.append(entry.movement._replace(quantity=entry.quantity))
+
+    created = dict(zip((movement.key for movement in missing), _new_balances(missing)))
+    upserts.bulk_upsert(
+        TotalCurrentInventory, changed, ['total_current_inventory'], created,
+        lambda key: _apply(key, net[key]), batch_size=BATCH_SIZE,
+    )
+
+
+def _apply(key, entry):
+    balances = TotalCurrentInventory.objects.filter(product_id=key[0], location_id=key[1])
+    total = F('total_current_inventory')
+    quantity = entry.quantity
+
+    if quantity > 0:
+        increments = {'total_current_inventory': total + quantity}
+        if entry.creatable:
+            upserts.add_or_create(balances, increments, lambda: _new_balances([entry.movement._replace(quantity=quantity)])[0])
+        else:
+            balances.update(**increments)
+    elif entry.strict:
+        if not balances.filter(total_current_inventory__gte=-quantity).update(total_current_inventory=total + quantity):
+            raise ValidationError(entry.error_message)
+    elif not balances.filter(total_current_inventory__gte=-quantity).update(total_current_inventory=total + quantity):
+        # The reversal exceeds what is on hand, so the balance had already drifted
+        if balances.update(total_current_inventory=Greatest(total + quantity, 0)):
+            logger.warning("Balance %s is short by more than %d on reversal; clamped at zero.", key, -quantity)
@@ -0,0 +1,86 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from syncstock import ledger
+from syncstock.management.workers import init_worker
+from syncstock.models import Company, Location, Product
+
+
+def _rebuild_chunk(company_ids, source, dry_run):
+    # Runs in the parent process or in a worker; returns picklable corrections per company
+    if source == 'journal':
+        return {company_id: ledger.replay(company_id, dry_run) for company_id in company_ids}
+    totals = ledger.document_totals(company_ids)
+    return {
+        company_id: ledger.sync_balances(company_id, totals[company_id], dry_run)
+        for company_id in company_ids
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute TotalCurrentInventory from inventory items, stock adjustments and "
+        "stock transfers (or from the stock movement journal) and report every corrected balance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', dest='companies',
+                            help="Company id to rebuild; repeat for several. Defaults to all companies.")
+        parser.add_argument('--source', choices=['documents', 'journal'], default='documents',
+                            help="Recompute from the source documents (default) or replay the journal.")
+        parser.add_argument('--chunk-size', type=int, default=50,
+                            help="Number of companies aggregated per batch of queries.")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Number of worker processes rebuilding chunks in parallel.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report the corrections without writing them.")
+
+    def handle(self, *args, **options):
+        company_ids = list(Company.objects.order_by('pk').values_list('pk', flat=True))
+        if options['companies']:
+            unknown = set(options['companies']) - set(company_ids)
+            if unknown:
+                raise CommandError(f"Unknown company id(s): {', '.join(map(str, sorted(unknown)))}")
+            company_ids = [pk for pk in company_ids if pk in options['companies']]
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size and --workers must be at least 1.")
+
+        size = options['chunk_size']
+        chunks = [company_ids[start:start + size] for start in range(0, len(company_ids), size)]
+        arguments = (options['source'], options['dry_run'])
+
+        if options['workers'] > 1 and len(chunks) > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+                results = pool.map(_rebuild_chunk, chunks, *([argument] * len(chunks) for argument in arguments))
+                corrected = sum(self._report(result) for result in results)
+        else:
+            corrected = sum(self._report(_rebuild_chunk(chunk, *arguments)) for chunk in chunks)
+
+        verb = "would be corrected" if options['dry_run'] else "corrected"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(company_ids)} companies checked, {corrected} balances {verb}."
+        ))
+
+    def _report(self, result):
+        keys = [correction.key for corrections in result.values() for correction in corrections]
+        locations = dict(Location.objects.filter(pk__in={key[1] for key in keys}).values_list('pk', 'name'))
+        products = Product.objects.in_bulk({key[0] for key in keys})
+
+        count = 0
+        for company_id, corrections in result.items():
+            for correction in corrections:
+                product_id, location_id = correction.key
+                product = products.get(product_id)
+                before = '-' if correction.before is None else correction.before
+                line = (
+                    f"company {company_id} | {product or product_id} @ "
+                    f"{locations.get(location_id, location_id)}: {before} -> {correction.after}"
+                )
+                if correction.computed < 0:
+                    line += f" (history is short by {-correction.computed})"
+                self.stdout.write(line)
+                count += 1
+        return count
@@ -0,0 +1,76 @@
+import os
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from syncstock import tasks
+from syncstock.management.workers import init_worker
+
+
+def _work_thread(worker, options, stop, counts):
+    try:
+        counts[worker] = tasks.work(worker, options['once'], options['poll_interval'], stop=stop)
+    finally:
+        connections.close_all()
+
+
+def _run_threads(options):
+    # Runs in the command's process or in a worker process; returns the number of jobs run
+    stop = threading.Event()
+    counts = {}
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(target=_work_thread, args=(f"{prefix}:{n}", options, stop, counts), daemon=True)
+        for n in range(options['threads'])
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        # Let the jobs in progress finish; leased jobs of a killed worker are retried once their lease expires
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return sum(counts.values())
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (reports and other long-running work) until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Number of worker processes.")
+        parser.add_argument('--threads', type=int, default=1,
+                            help="Number of worker threads in each process.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait before looking again when no job is due.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once no job is due instead of waiting for more.")
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['threads'] < 1:
+            raise CommandError("--processes and --threads must be at least 1.")
+        if options['poll_interval'] <= 0:
+            raise CommandError("--poll-interval must be positive.")
+
+        processes = options['processes']
+        settings = {key: options[key] for key in ('threads', 'poll_interval', 'once')}
+        self.stdout.write(f"Running {processes} process(es) with {settings['threads']} thread(s) each.")
+        if processes > 1:
+            connections.close_all()
+            try:
+                with ProcessPoolExecutor(max_workers=processes, initializer=init_worker) as pool:
+                    count = sum(pool.map(_run_threads, [settings] * processes))
+            except KeyboardInterrupt:
+                # The worker processes were interrupted too and have finished their jobs in progress
+                self.stdout.write("Stopped.")
+                return
+        else:
+            count = _run_threads(settings)
+        self.stdout.write(self.style.SUCCESS(f"{count} jobs run."))
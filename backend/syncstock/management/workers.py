@@ -0,0 +1,11 @@
+"""Helpers shared by the management commands that fan work out to worker processes."""
+import django
+from django.db import connections
+
+
+def init_worker():
+    """ProcessPoolExecutor initializer: set Django up in the new process."""
+    django.setup()
+    # Never share the parent's database connections with a worker process
+    for connection in connections.all(initialized_only=True):
+        connection.close()
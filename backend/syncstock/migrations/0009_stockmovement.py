@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_journal(apps, schema_editor):
+    # Journal the existing history so balances can be replayed from it
+    InventoryItem = apps.get_model('syncstock', 'InventoryItem')
+    StockAdjustment = apps.get_model('syncstock', 'StockAdjustment')
+    StockTransfer = apps.get_model('syncstock', 'StockTransfer')
+    StockMovement = apps.get_model('syncstock', 'StockMovement')
+
+    def entry(item, location_id, quantity, date, source_type, source_id):
+        return StockMovement(
+            company_id=item.company_id,
+            item_name=item.item_name,
+            product_code=item.product_code,
+            sku=item.sku,
+            location_id=location_id,
+            category_id=item.category_id,
+            quantity=quantity,
+            date=date,
+            source_type=source_type,
+            source_id=source_id,
+        )
+
+    def entries():
+        for item in InventoryItem.objects.iterator(chunk_size=2000):
+            yield entry(item, item.location_id, item.quantity, item.inventory_date, 'receipt', item.pk)
+        for adjustment in StockAdjustment.objects.select_related('item').iterator(chunk_size=2000):
+            yield entry(adjustment.item, adjustment.location_id, -adjustment.quantity, adjustment.date, 'adjustment', adjustment.pk)
+        for transfer in StockTransfer.objects.select_related('item').iterator(chunk_size=2000):
+            yield entry(transfer.item, transfer.from_location_id, -transfer.quantity, transfer.date, 'transfer', transfer.pk)
+            yield entry(transfer.item, transfer.to_location_id, transfer.quantity, transfer.date, 'transfer', transfer.pk)
+
+    batch = []
+    for movement in entries():
+        batch.append(movement)
+        if len(batch) >= 2000:
+            StockMovement.objects.bulk_create(batch)
+            batch = []
+    StockMovement.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0008_alter_inventoryitem_user_alter_stockadjustment_user_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_name', models.CharField(max_length=255)),
+                ('product_code', models.CharField(max_length=255)),
+                ('sku', models.CharField(max_length=50)),
+                ('quantity', models.IntegerField()),
+                ('date', models.DateField()),
+                ('source_type', models.CharField(choices=[('receipt', 'Receipt'), ('adjustment', 'Adjustment'), ('transfer', 'Transfer')], max_length=20)),
+                ('source_id', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.category')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.company')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.location')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'sku', 'location'], name='syncstock_s_company_9a6c03_idx'), models.Index(fields=['company', 'date'], name='syncstock_s_company_645dec_idx'), models.Index(fields=['source_type', 'source_id'], name='syncstock_s_source__84a652_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_journal, migrations.RunPython.noop),
+    ]
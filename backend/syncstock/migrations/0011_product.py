@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0010_transferdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sku', models.CharField(max_length=50)),
+                ('item_name', models.CharField(max_length=255)),
+                ('product_code', models.CharField(blank=True, max_length=100)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='syncstock.category')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.company')),
+            ],
+            options={
+                'unique_together': {('company', 'sku')},
+            },
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+        migrations.AddField(
+            model_name='stockadjustment',
+            name='product',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+        migrations.AddField(
+            model_name='stocktransfer',
+            name='product',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+        migrations.AddField(
+            model_name='totalcurrentinventory',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+
+def backfill_products(apps, schema_editor):
+    Product = apps.get_model('syncstock', 'Product')
+    InventoryItem = apps.get_model('syncstock', 'InventoryItem')
+    StockAdjustment = apps.get_model('syncstock', 'StockAdjustment')
+    StockTransfer = apps.get_model('syncstock', 'StockTransfer')
+    StockMovement = apps.get_model('syncstock', 'StockMovement')
+    TotalCurrentInventory = apps.get_model('syncstock', 'TotalCurrentInventory')
+
+    # One product per (company, sku); the most recent row decides its name
+    products = {}
+    sources = [
+        InventoryItem.objects.order_by('inventory_date', 'pk'),
+        TotalCurrentInventory.objects.order_by('pk'),
+        StockMovement.objects.order_by('date', 'pk'),
+    ]
+    for queryset in sources:
+        for company_id, sku, item_name, product_code, category_id in queryset.values_list(
+            'company_id', 'sku', 'item_name', 'product_code', 'category_id'
+        ).iterator(chunk_size=2000):
+            if (company_id, sku) not in products or queryset.model is InventoryItem:
+                products[(company_id, sku)] = Product(
+                    company_id=company_id,
+                    sku=sku,
+                    item_name=item_name,
+                    product_code=product_code or '',
+                    category_id=category_id,
+                )
+    Product.objects.bulk_create(products.values(), batch_size=1000)
+
+    def product_for(company_field, sku_field):
+        return Subquery(
+            Product.objects.filter(company_id=OuterRef(company_field), sku=OuterRef(sku_field)).values('pk')[:1]
+        )
+
+    InventoryItem.objects.update(product_id=product_for('company_id', 'sku'))
+    StockMovement.objects.update(product_id=product_for('company_id', 'sku'))
+    # Adjustments and transfers move stock of their item's product
+    item_product = Subquery(InventoryItem.objects.filter(pk=OuterRef('item_id')).values('product_id')[:1])
+    StockAdjustment.objects.update(product_id=item_product)
+    StockTransfer.objects.update(product_id=item_product)
+
+    # Balances used to be keyed on the names as well; merge rows that now share a product
+    TotalCurrentInventory.objects.update(product_id=product_for('company_id', 'sku'))
+    duplicates = (
+        TotalCurrentInventory.objects.values('product_id', 'location_id')
+        .annotate(total=Sum('total_current_inventory'), rows=Count('pk'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates:
+        rows = list(TotalCurrentInventory.objects.filter(
+            product_id=duplicate['product_id'], location_id=duplicate['location_id'],
+        ).order_by('pk'))
+        keep = rows[0]
+        keep.total_current_inventory = duplicate['total']
+        keep.save(update_fields=['total_current_inventory'])
+        TotalCurrentInventory.objects.filter(pk__in=[row.pk for row in rows[1:]]).delete()
+
+    # Display names follow the product
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    TotalCurrentInventory.objects.update(
+        item_name=Subquery(product.values('item_name')[:1]),
+        product_code=Subquery(product.values('product_code')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0011_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0012_backfill_products'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='stockmovement',
+            name='syncstock_s_company_9a6c03_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='totalcurrentinventory',
+            unique_together=set(),
+        ),
+        migrations.RemoveField(
+            model_name='stockmovement',
+            name='item_name',
+        ),
+        migrations.RemoveField(
+            model_name='stockmovement',
+            name='product_code',
+        ),
+        migrations.RemoveField(
+            model_name='stockmovement',
+            name='sku',
+        ),
+        migrations.AlterField(
+            model_name='inventoryitem',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+        migrations.AlterField(
+            model_name='stockadjustment',
+            name='product',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+        migrations.AlterField(
+            model_name='stocktransfer',
+            name='product',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+        migrations.AlterField(
+            model_name='totalcurrentinventory',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.product'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='totalcurrentinventory',
+            unique_together={('product', 'location')},
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'location'], name='syncstock_s_product_f08f26_idx'),
+        ),
+    ]
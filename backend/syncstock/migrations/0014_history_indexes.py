@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0013_product_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(fields=['company', 'inventory_date', 'id'], name='syncstock_i_company_93b2fa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockadjustment',
+            index=models.Index(fields=['company', 'date', 'id'], name='syncstock_s_company_af88ee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stocktransfer',
+            index=models.Index(fields=['company', 'date', 'id'], name='syncstock_s_company_f044b6_idx'),
+        ),
+    ]
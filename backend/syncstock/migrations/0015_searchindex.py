@@ -0,0 +1,47 @@
+from django.db import migrations, OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    # Only SQLite builds with FTS5 and the trigram tokenizer get the index; searches elsewhere use icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE syncstock_searchindex USING fts5("
+            "company_id UNINDEXED, body, tokenize='trigram')"
+        )
+    except OperationalError:
+        return
+    # rowid = pk * 4 + kind: 1 inventory item, 2 stock adjustment, 3 stock transfer
+    schema_editor.execute(
+        "INSERT INTO syncstock_searchindex (rowid, company_id, body) "
+        "SELECT id * 4 + 1, company_id, "
+        "TRIM(item_name || ' ' || sku || ' ' || product_code || ' ' || supplier_name) "
+        "FROM syncstock_inventoryitem"
+    )
+    schema_editor.execute(
+        "INSERT INTO syncstock_searchindex (rowid, company_id, body) "
+        "SELECT a.id * 4 + 2, a.company_id, TRIM(i.item_name || ' ' || i.sku || ' ' || i.product_code) "
+        "FROM syncstock_stockadjustment a JOIN syncstock_inventoryitem i ON i.id = a.item_id"
+    )
+    schema_editor.execute(
+        "INSERT INTO syncstock_searchindex (rowid, company_id, body) "
+        "SELECT t.id * 4 + 3, t.company_id, TRIM(i.item_name || ' ' || i.sku || ' ' || i.product_code || ' ' || t.date) "
+        "FROM syncstock_stocktransfer t JOIN syncstock_inventoryitem i ON i.id = t.item_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS syncstock_searchindex")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0014_history_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
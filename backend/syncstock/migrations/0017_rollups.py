@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0016_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdjustmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('adjustment_type', models.CharField(choices=[('remove', 'Remove'), ('missing', 'Missing'), ('damage', 'Damage'), ('expired', 'Expired'), ('sold', 'Sold')], max_length=10)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('lines', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.category')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.company')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.location')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'date'], name='syncstock_a_company_acb246_idx')],
+                'unique_together': {('location', 'category', 'adjustment_type', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ReceiptRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=24)),
+                ('lines', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.category')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.company')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.location')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'date'], name='syncstock_r_company_529cf6_idx')],
+                'unique_together': {('location', 'category', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TransferRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=24)),
+                ('lines', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.category')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.company')),
+                ('from_location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='syncstock.location')),
+                ('to_location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='syncstock.location')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'date'], name='syncstock_t_company_b1357a_idx')],
+                'unique_together': {('from_location', 'to_location', 'category', 'date')},
+            },
+        ),
+    ]
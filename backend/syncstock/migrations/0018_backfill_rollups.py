@@ -0,0 +1,45 @@
+from django.db import migrations
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+
+def backfill_rollups(apps, schema_editor):
+    sources = [
+        ('InventoryItem', 'ReceiptRollup', 'inventory_date', ['location_id', 'category_id'], True),
+        ('StockAdjustment', 'AdjustmentRollup', 'date', ['location_id', 'category_id', 'adjustment_type'], False),
+        ('StockTransfer', 'TransferRollup', 'date', ['from_location_id', 'to_location_id', 'category_id'], True),
+    ]
+    for document_name, rollup_name, date_field, dimensions, valued in sources:
+        Document = apps.get_model('syncstock', document_name)
+        Rollup = apps.get_model('syncstock', rollup_name)
+        # Named apart from the document fields, which the value expression refers to
+        totals = {'day_quantity': Sum('quantity'), 'day_lines': Count('pk')}
+        if valued:
+            value = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=24, decimal_places=2))
+            totals['day_value'] = Sum(value)
+        days = (
+            Document.objects.values('company_id', date_field, *dimensions)
+            .annotate(**totals)
+            .order_by()
+            .iterator(chunk_size=2000)
+        )
+        rows = []
+        for day in days:
+            day['date'] = day.pop(date_field)
+            for name in totals:
+                day[name[len('day_'):]] = day.pop(name)
+            rows.append(Rollup(**day))
+            if len(rows) == 1000:
+                Rollup.objects.bulk_create(rows)
+                rows = []
+        Rollup.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0017_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
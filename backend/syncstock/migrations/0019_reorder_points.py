@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0018_backfill_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold', models.PositiveIntegerField()),
+                ('low', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.company')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.location')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'low'], name='syncstock_r_company_596a5d_idx')],
+                'unique_together': {('product', 'location')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('low', 'Low'), ('restored', 'Restored')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('threshold', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.company')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.location')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='syncstock.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company', 'created_at', 'id'], name='syncstock_s_company_4914c2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+import importlib
+
+from django.db import migrations, OperationalError
+
+
+def create_search_columns(apps, schema_editor):
+    # One column per field, so a trigram match cannot span the end of one field and the start of the next
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS syncstock_searchindex")
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE syncstock_searchindex USING fts5("
+            "company_id UNINDEXED, item_name, sku, product_code, extra, tokenize='trigram')"
+        )
+    except OperationalError:
+        return
+    # rowid = pk * 4 + kind: 1 inventory item, 2 stock adjustment, 3 stock transfer
+    schema_editor.execute(
+        "INSERT INTO syncstock_searchindex (rowid, company_id, item_name, sku, product_code, extra) "
+        "SELECT id * 4 + 1, company_id, item_name, sku, COALESCE(product_code, ''), COALESCE(supplier_name, '') "
+        "FROM syncstock_inventoryitem"
+    )
+    schema_editor.execute(
+        "INSERT INTO syncstock_searchindex (rowid, company_id, item_name, sku, product_code, extra) "
+        "SELECT a.id * 4 + 2, a.company_id, i.item_name, i.sku, COALESCE(i.product_code, ''), '' "
+        "FROM syncstock_stockadjustment a JOIN syncstock_inventoryitem i ON i.id = a.item_id"
+    )
+    schema_editor.execute(
+        "INSERT INTO syncstock_searchindex (rowid, company_id, item_name, sku, product_code, extra) "
+        "SELECT t.id * 4 + 3, t.company_id, i.item_name, i.sku, COALESCE(i.product_code, ''), t.date "
+        "FROM syncstock_stocktransfer t JOIN syncstock_inventoryitem i ON i.id = t.item_id"
+    )
+
+
+def create_search_body(apps, schema_editor):
+    previous = importlib.import_module('syncstock.migrations.0015_searchindex')
+    previous.drop_search_index(apps, schema_editor)
+    previous.create_search_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0019_reorder_points'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_columns, create_search_body),
+    ]
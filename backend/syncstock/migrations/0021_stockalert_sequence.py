@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:46
+
+from django.db import migrations, models
+
+
+def number_alerts(apps, schema_editor):
+    # Alerts recorded so far are all committed; they keep the order the feed showed them in
+    StockAlert = apps.get_model('syncstock', 'StockAlert')
+    alerts = list(StockAlert.objects.order_by('company_id', 'created_at', 'id').only('id', 'company_id'))
+    company_id, number = None, 0
+    for alert in alerts:
+        if alert.company_id != company_id:
+            company_id, number = alert.company_id, 0
+        number += 1
+        alert.sequence = number
+    StockAlert.objects.bulk_update(alerts, ['sequence'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('syncstock', '0020_searchindex_columns'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='stockalert',
+            name='syncstock_s_company_4914c2_idx',
+        ),
+        migrations.AddField(
+            model_name='stockalert',
+            name='sequence',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(number_alerts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(fields=['company', 'sequence', 'id'], name='syncstock_s_company_f63a56_idx'),
+        ),
+    ]
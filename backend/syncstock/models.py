@@ -1,5 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 import uuid
 import datetime
@@ -35,7 +37,110 @@ class Location(models.Model):
     def __str__(self):
         return self.name
 
-class InventoryItem(models.Model):
+class ProductManager(models.Manager):
+    def resolve(self, company_id, sku, item_name, product_code='', category_id=None):
+        """Return the catalog product for a SKU, creating it or refreshing its name as needed."""
+        product, created = self.get_or_create(
+            company_id=company_id,
+            sku=sku,
+            defaults={'item_name': item_name, 'product_code': product_code, 'category_id': category_id},
+        )
+        if not created and (product.item_name, product.product_code) != (item_name, product_code):
+            product.item_name, product.product_code = item_name, product_code
+            product.save(update_fields=['item_name', 'product_code'])
+            # Balances only carry the names for display, the product is their key
+            TotalCurrentInventory.objects.filter(product=product).update(item_name=item_name, product_code=product_code)
+        return product
+
+    def resolve_many(self, company_id, items):
+        """Set the product of many unsaved inventory items with a few queries; the last row names the product."""
+        latest = {item.sku: item for item in items}
+        products = {product.sku: product for product in self.filter(company_id=company_id, sku__in=latest)}
+        self.bulk_create([
+            self.model(company_id=company_id, sku=sku, item_name=item.item_name,
+                       product_code=item.product_code, category_id=item.category_id)
+            for sku, item in latest.items() if sku not in products
+        ])
+        renamed = []
+        for product in products.values():
+            item = latest[product.sku]
+            if (product.item_name, product.product_code) != (item.item_name, item.product_code):
+                product.item_name, product.product_code = item.item_name, item.product_code
+                renamed.append(product)
+        self.bulk_update(renamed, ['item_name', 'product_code'])
+        for product in renamed:
+            TotalCurrentInventory.objects.filter(product=product).update(
+                item_name=product.item_name, product_code=product.product_code,
+            )
+        products = {product.sku: product for product in self.filter(company_id=company_id, sku__in=latest)}
+        for item in items:
+            item.product = products[item.sku]
+
+class Product(models.Model):
+    # Catalog entry shared by every receipt, adjustment, transfer and balance of one SKU
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    sku = models.CharField(max_length=50)
+    item_name = models.CharField(max_length=255)
+    product_code = models.CharField(max_length=100, blank=True)
+    category = models.ForeignKey('Category', on_delete=models.SET_NULL, null=True, blank=True)
+
+    objects = ProductManager()
+
+    class Meta:
+        unique_together = ('company', 'sku')
+
+    def __str__(self):
+        return f"{self.item_name} [{self.sku}]"
+
+class TrackedModel(models.Model):
+    """
+    Remembers the field values a row was loaded with, so a save can tell what
+    changed without reading the row back from the database.
+    """
+    # Fields that decide the stock movements of the row
+    LEDGER_FIELDS = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_values()
+
+    def _remember_values(self):
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def has_changed(self, *fields):
+        """True unless every field still holds the value it was loaded with (new rows always changed)."""
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return True
+        return any(field not in loaded or loaded[field] != getattr(self, field) for field in fields)
+
+    def loaded_copy(self):
+        """Return an unsaved copy of the row as it was loaded, or None if it was not loaded in full."""
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return None
+        if any(field.attname not in loaded for field in self._meta.concrete_fields):
+            return None
+        return type(self)(**loaded)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_values()
+
+class InventoryItem(TrackedModel):
     item_name = models.CharField(max_length=255)
     sku = models.CharField(max_length=50)
     product_code = models.CharField(max_length=100, blank=True)
@@ -49,10 +154,29 @@ class InventoryItem(models.Model):
     category = models.ForeignKey('Category', on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.PROTECT)  
     company = models.ForeignKey(Company, on_delete=models.CASCADE) 
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+
+    LEDGER_FIELDS = ('product_id', 'location_id', 'quantity', 'inventory_date')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the receipt history
+            models.Index(fields=['company', 'inventory_date', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The row and its ledger movement (posted by signals) commit together
+        with transaction.atomic():
+            if not self.product_id or self.has_changed('company_id', 'sku', 'item_name', 'product_code'):
+                self.product = Product.objects.resolve(
+                    self.company_id, self.sku, self.item_name, self.product_code, self.category_id
+                )
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return self.item_name
 
-class StockAdjustment(models.Model):
+class StockAdjustment(TrackedModel):
     ADJUSTMENT_TYPES = [
         ('remove', 'Remove'),
         ('missing', 'Missing'),
@@ -72,23 +196,47 @@ class StockAdjustment(models.Model):
     product_code = models.CharField(max_length=100, editable=False)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     category = models.ForeignKey('Category', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, editable=False)
+
+    LEDGER_FIELDS = ('product_id', 'location_id', 'quantity', 'date')
 
     class Meta:
         ordering = ['date']
+        indexes = [
+            # Keyset pagination of the adjustment history
+            models.Index(fields=['company', 'date', 'id']),
+        ]
 
     def save(self, *args, **kwargs):
         # Automatically inherit SKU and product_code from the related InventoryItem
-        if self.item:
+        if self.item_id and (not self.sku or self.has_changed('item_id')):
             if not self.sku:
                 self.sku = self.item.sku
             if not self.product_code:
                 self.product_code = self.item.product_code
-        super().save(*args, **kwargs)  # Call save method once
+            self.product_id = self.item.product_id
+        # The row and its ledger movement (posted by signals) commit together
+        with transaction.atomic():
+            super().save(*args, **kwargs)  # Call save method once
 
     def __str__(self):
         return f"{self.adjustment_type} - {self.item.item_name}"
 
-class StockTransfer(models.Model):
+class TransferDocument(models.Model):
+    # Header of a multi-line transfer; its lines are StockTransfer rows
+    company = models.ForeignKey('Company', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.PROTECT)
+    from_location = models.ForeignKey('Location', related_name='transfer_documents_from', on_delete=models.CASCADE)
+    to_location = models.ForeignKey('Location', related_name='transfer_documents_to', on_delete=models.CASCADE)
+    date = models.DateField()
+    reference = models.CharField(max_length=100, blank=True)
+    notes = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Transfer document {self.reference or self.pk} from {self.from_location.name} to {self.to_location.name}"
+
+class StockTransfer(TrackedModel):
     from_location = models.ForeignKey('Location', related_name='transfers_from', on_delete=models.CASCADE)
     to_location = models.ForeignKey('Location', related_name='transfers_to', on_delete=models.CASCADE)
     item = models.ForeignKey(InventoryItem, on_delete=models.CASCADE) 
@@ -104,6 +252,24 @@ class StockTransfer(models.Model):
     price = models.DecimalField(max_digits=20, decimal_places=2)
     expiration_date = models.DateField(blank=True, null=True)
     category = models.ForeignKey('Category', on_delete=models.CASCADE)
+    document = models.ForeignKey(TransferDocument, related_name='lines', on_delete=models.CASCADE, null=True, blank=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, editable=False)
+
+    LEDGER_FIELDS = ('product_id', 'from_location_id', 'to_location_id', 'quantity', 'date')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the transfer history
+            models.Index(fields=['company', 'date', 'id']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Transfers move stock of their item's product
+        if self.item_id and (not self.product_id or self.has_changed('item_id')):
+            self.product_id = self.item.product_id
+        # The row and its ledger movement (posted by signals) commit together
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Transfer from {self.from_location.name} to {self.to_location.name}"
@@ -118,6 +284,17 @@ class Category(models.Model):
         return self.name
 
 
+class TotalCurrentInventoryQuerySet(models.QuerySet):
+    def valued(self):
+        """Annotate each balance with `unit_price`, the price of its product's latest receipt, and `value`."""
+        latest_price = InventoryItem.objects.filter(product=models.OuterRef('product')).order_by('-inventory_date', '-id').values('price')[:1]
+        return self.annotate(unit_price=models.Subquery(latest_price)).annotate(
+            value=models.ExpressionWrapper(
+                models.F('total_current_inventory') * Coalesce('unit_price', models.Value(0), output_field=models.DecimalField()),
+                output_field=models.DecimalField(max_digits=24, decimal_places=2),
+            ),
+        )
+
 class TotalCurrentInventory(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
     item_name = models.CharField(max_length=255)
@@ -126,9 +303,167 @@ class TotalCurrentInventory(models.Model):
     total_current_inventory = models.PositiveIntegerField()
     sku = models.CharField(max_length=50)
     category = models.ForeignKey('Category', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
     # Add any other relevant fields
 
+    objects = TotalCurrentInventoryQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('product', 'location')
+
+
+
+
+class StockMovement(models.Model):
+    # Append-only journal of every change to a balance; TotalCurrentInventory is its projection
+    SOURCE_TYPES = [
+        ('receipt', 'Receipt'),
+        ('adjustment', 'Adjustment'),
+        ('transfer', 'Transfer'),
+    ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    location = models.ForeignKey('Location', on_delete=models.CASCADE)
+    category = models.ForeignKey('Category', on_delete=models.CASCADE)
+    quantity = models.IntegerField()  # signed: positive adds stock, negative removes it
+    date = models.DateField()
+    source_type = models.CharField(max_length=20, choices=SOURCE_TYPES)
+    source_id = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'location']),
+            models.Index(fields=['company', 'date']),
+            models.Index(fields=['source_type', 'source_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.source_type} {self.source_id}: {self.quantity:+d} {self.product}"
+
+
+# Daily totals of the documents behind the chart endpoints, kept up to date by rollups.py
+
+class ReceiptRollup(models.Model):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    date = models.DateField()
+    location = models.ForeignKey('Location', on_delete=models.CASCADE)
+    category = models.ForeignKey('Category', on_delete=models.CASCADE)
+    quantity = models.BigIntegerField(default=0)
+    value = models.DecimalField(max_digits=24, decimal_places=2, default=0)  # quantity x price
+    lines = models.IntegerField(default=0)  # number of documents
+
+    class Meta:
+        unique_together = ('location', 'category', 'date')
+        indexes = [models.Index(fields=['company', 'date'])]
+
+
+class AdjustmentRollup(models.Model):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    date = models.DateField()
+    location = models.ForeignKey('Location', on_delete=models.CASCADE)
+    category = models.ForeignKey('Category', on_delete=models.CASCADE)
+    adjustment_type = models.CharField(max_length=10, choices=StockAdjustment.ADJUSTMENT_TYPES)
+    quantity = models.BigIntegerField(default=0)
+    lines = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('location', 'category', 'adjustment_type', 'date')
+        indexes = [models.Index(fields=['company', 'date'])]
+
+
+class TransferRollup(models.Model):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    date = models.DateField()
+    from_location = models.ForeignKey('Location', related_name='+', on_delete=models.CASCADE)
+    to_location = models.ForeignKey('Location', related_name='+', on_delete=models.CASCADE)
+    category = models.ForeignKey('Category', on_delete=models.CASCADE)
+    quantity = models.BigIntegerField(default=0)
+    value = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+    lines = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('from_location', 'to_location', 'category', 'date')
+        indexes = [models.Index(fields=['company', 'date'])]
+
+
+class Job(models.Model):
+    # A unit of background work, claimed by run_worker processes under a time-limited lease
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True)
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=255, blank=True, default='')  # unfinished jobs with the same key are enqueued once
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    priority = models.SmallIntegerField(default=0)  # higher runs first
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    leased_until = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at']),
+            models.Index(fields=['key', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+class ReorderPoint(models.Model):
+    # Threshold of one balance; the ledger flips `low` only when the balance crosses it
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    location = models.ForeignKey('Location', on_delete=models.CASCADE)
+    threshold = models.PositiveIntegerField()  # the balance is low at or below this many units
+    low = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
-        unique_together = ('company', 'item_name', 'product_code', 'sku', 'location')
+        unique_together = ('product', 'location')
+        indexes = [
+            # What is low right now
+            models.Index(fields=['company', 'low']),
+        ]
 
+    def __str__(self):
+        return f"{self.product} at {self.location}: {self.threshold}"
+
+
+class StockAlert(models.Model):
+    # A balance crossing its reorder point, in either direction
+    KINDS = [
+        ('low', 'Low'),
+        ('restored', 'Restored'),
+    ]
 
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    location = models.ForeignKey('Location', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    quantity = models.IntegerField()   # on hand right after the crossing
+    threshold = models.PositiveIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    sequence = models.PositiveBigIntegerField(null=True, blank=True)  # set once the alert's transaction commits
+
+    class Meta:
+        indexes = [
+            # The alert feed, read with a cursor
+            models.Index(fields=['company', 'sequence', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.product} at {self.location} ({self.quantity}/{self.threshold})"
@@ -0,0 +1,123 @@
+"""
+Opt-in keyset pagination for the history lists.
+
+By default the lists keep their page-number pagination, which the frontend's
+page controls rely on. A request with ?paginate=cursor is paginated on the
+view's `cursor_ordering` columns instead, e.g. (date, id): each page is read
+with a range condition on an index rather than an OFFSET, and no COUNT(*) is
+run. The response links to neighbouring pages through an opaque ?cursor=.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class HistoryPagination(PageNumberPagination):
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = (
+            request.query_params.get('paginate') == 'cursor' or self.cursor_query_param in request.query_params
+        )
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.fields = view.cursor_ordering
+        # Newest first, unless the list is explicitly ordered on its date ascending
+        self.descending = request.query_params.get('ordering') != self.fields[0]
+        page_size = self.get_page_size(request)
+
+        position, backwards = self.decode_cursor(request)
+        # Reading backwards walks the same order in reverse and flips the page afterwards
+        descending = self.descending != backwards
+        queryset = queryset.order_by(*[('-' if descending else '') + field for field in self.fields])
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(position, descending))
+            except (ValidationError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+
+        # Rows past the page in the direction we read exist; the other direction exists if we came from there
+        has_next, has_previous = (position is not None, more) if backwards else (more, position is not None)
+        self.next_position = self.position(rows[-1]) if rows and has_next else None
+        self.previous_position = self.position(rows[0]) if rows and has_previous else None
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.cursor_link(self.next_position, backwards=False),
+            'previous': self.cursor_link(self.previous_position, backwards=True),
+            'results': data,
+        })
+
+    def after(self, position, descending):
+        # Rows strictly past `position` in the (field1, field2) order
+        (first, second), (value, tiebreak) = self.fields, position
+        lookup = 'lt' if descending else 'gt'
+        return Q(**{f'{first}__{lookup}': value}) | Q(**{first: value, f'{second}__{lookup}': tiebreak})
+
+    def position(self, row):
+        return [str(getattr(row, field)) for field in self.fields]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            position, backwards = cursor['p'], bool(cursor['r'])
+            if len(position) != len(self.fields):
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, backwards
+
+    def cursor_link(self, position, backwards):
+        if position is None:
+            return None
+        cursor = base64.urlsafe_b64encode(json.dumps({'p': position, 'r': int(backwards)}).encode()).decode()
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+
+class FeedPagination(HistoryPagination):
+    """
+    Cursor pagination for a feed that clients poll: oldest first, always by
+    cursor, and the `next` link is given on the last page too, so a client keeps
+    it and later reads the entries added since.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = True
+        self.request = request
+        self.fields = view.cursor_ordering
+        position, _ = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.fields)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(position, descending=False))
+            except (ValidationError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:self.get_page_size(request)])
+        # Past the last entry read, or still where the client was when nothing is new
+        self.next_position = self.position(rows[-1]) if rows else position
+        self.previous_position = None
+        return rows
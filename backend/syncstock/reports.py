@@ -0,0 +1,227 @@
+"""
+PDF stock reports, rendered by the job queue and kept on disk.
+
+A report is stored under the company, a hash of its filters and the company's
+'stock' data version, which the ledger and signals bump whenever balances,
+prices or names change. A repeat request for the same filters is served from
+the file until the data changes; then the next request renders a new file and
+the outdated one is removed.
+
+The version is read where the report is requested and the resulting name goes
+into the job, so the worker writes exactly the file the requesting process
+looks for even when its own cache holds another version.
+"""
+import datetime
+import os
+import threading
+
+from django.conf import settings
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from .models import TotalCurrentInventory, StockMovement
+from . import caching, tasks
+
+MARGIN = 40
+LINE_HEIGHT = 14
+
+# Query parameters of a report and the lookups they stand for; the view validates them first
+BALANCE_FILTERS = {
+    'item_name': 'item_name__icontains',
+    'location': 'location_id',
+    'category': 'category_id',
+}
+MOVEMENT_FILTERS = {
+    'location': 'location_id',
+    'category': 'category_id',
+    'start_date': 'date__gte',
+    'end_date': 'date__lte',
+}
+
+
+def report_root():
+    return getattr(settings, 'SYNCSTOCK_REPORT_ROOT', os.path.join(settings.BASE_DIR, 'reports'))
+
+
+def report_path(company_id, params):
+    """Path of the company's report for `params` at the current data version."""
+    name = caching.fingerprint(company_id, '', params)
+    current = caching.version('stock', company_id)
+    return os.path.join(report_root(), str(company_id), f'{name}-{current}.pdf')
+
+
+def open_report(company_id, params):
+    """Return the report for `params` at the current data version, opened for reading, or None."""
+    try:
+        return open(report_path(company_id, params), 'rb')
+    except FileNotFoundError:
+        return None
+
+
+def schedule(company, params):
+    """Queue rendering of the report for `params`, once however often it is requested; returns the Job."""
+    name = os.path.basename(report_path(company.pk, params))
+    return tasks.enqueue(
+        'stock_report', {'params': params, 'name': name},
+        company=company, priority=1, key=f'stock_report:{company.pk}:{name}',
+    )
+
+
+@tasks.task('stock_report', atomic=False)
+def render_stock_report(job):
+    company, params = job.company, job.payload['params']
+    if 'name' in job.payload:
+        path = os.path.join(report_root(), str(company.pk), job.payload['name'])
+    else:
+        # Queued before the name was part of the payload
+        path = report_path(company.pk, params)
+    if not os.path.exists(path):
+        balances = TotalCurrentInventory.objects.filter(
+            company=company, **{BALANCE_FILTERS[key]: value for key, value in params.items() if key in BALANCE_FILTERS}
+        )
+        movements = StockMovement.objects.filter(
+            company=company, **{MOVEMENT_FILTERS[key]: value for key, value in params.items() if key in MOVEMENT_FILTERS}
+        )
+        render(path, company, params, balances, movements)
+    return {'report': os.path.basename(path)}
+
+
+def render(path, company, params, balances, movements):
+    """Write the report to `path`, replacing older versions of it."""
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    partial = f'{path}.{threading.get_ident()}.part'
+    writer = _ReportWriter(partial)
+    writer.title(f'Stock report - {company.name}', params)
+    _write_valuation(writer, balances)
+    _write_movements(writer, movements)
+    writer.save()
+    os.replace(partial, path)
+
+    # Only versions below this one: a newer report may already be served by another process
+    stem, current = _split_name(name)
+    for entry in os.listdir(directory):
+        entry_stem, version = _split_name(entry)
+        if entry_stem == stem and version is not None and version < current:
+            os.remove(os.path.join(directory, entry))
+
+
+def _split_name(name):
+    # '<fingerprint>-<version>.pdf' -> (fingerprint, version); version is None for anything else
+    stem, _, version = name.removesuffix('.pdf').rpartition('-')
+    if not name.endswith('.pdf') or not version.isdigit():
+        return name, None
+    return stem, int(version)
+
+
+def _write_valuation(writer, balances):
+    # Stock is valued at the price of the product's latest receipt
+    rows = (
+        balances.valued()
+        .order_by('location__name', 'location_id', 'sku')
+        .values_list('location__name', 'sku', 'item_name', 'total_current_inventory', 'unit_price')
+        .iterator(chunk_size=2000)
+    )
+    columns = [('SKU', 0), ('Item', 90), ('Quantity', 330), ('Unit price', 400), ('Value', 480)]
+    writer.heading('Stock valuation')
+    location, subtotal, total = None, 0, 0
+    for location_name, sku, item_name, quantity, unit_price in rows:
+        if location_name != location:
+            if location is not None:
+                writer.total(f'Total {location}', subtotal, columns)
+            location, subtotal = location_name, 0
+            writer.subheading(location_name)
+            writer.header(columns)
+        value = quantity * (unit_price or 0)
+        subtotal += value
+        total += value
+        writer.row([sku, item_name[:40], quantity, f'{unit_price or 0:.2f}', f'{value:.2f}'], columns)
+    if location is not None:
+        writer.total(f'Total {location}', subtotal, columns)
+    writer.total('Total stock value', total, columns)
+
+
+def _write_movements(writer, movements):
+    rows = (
+        movements.order_by('date', 'id')
+        .values_list('date', 'product__sku', 'product__item_name', 'location__name', 'quantity', 'source_type')
+        .iterator(chunk_size=2000)
+    )
+    columns = [('Date', 0), ('SKU', 70), ('Item', 160), ('Location', 330), ('Quantity', 430), ('Source', 480)]
+    writer.heading('Movements')
+    writer.header(columns)
+    for date, sku, item_name, location_name, quantity, source_type in rows:
+        writer.row([date.isoformat(), sku, item_name[:30], location_name[:18], quantity, source_type], columns)
+
+
+class _ReportWriter:
+    # A reportlab canvas written top to bottom, starting new pages as it fills up
+
+    def __init__(self, path):
+        self.canvas = canvas.Canvas(path, pagesize=letter)
+        self.width, self.height = letter
+        self.columns = None
+        self.page = 1
+        self.y = self.height - MARGIN
+
+    def _line(self, height=LINE_HEIGHT):
+        if self.y - height < MARGIN:
+            self._footer()
+            self.canvas.showPage()
+            self.page += 1
+            self.y = self.height - MARGIN
+            if self.columns:
+                self.header(self.columns)
+        self.y -= height
+
+    def _footer(self):
+        self.canvas.setFont('Helvetica', 8)
+        self.canvas.drawRightString(self.width - MARGIN, MARGIN / 2, f'Page {self.page}')
+
+    def title(self, text, params):
+        self.canvas.setTitle(text)
+        self._line(20)
+        self.canvas.setFont('Helvetica-Bold', 16)
+        self.canvas.drawString(MARGIN, self.y, text)
+        self._line()
+        self.canvas.setFont('Helvetica', 9)
+        generated = datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
+        filters = ', '.join(f'{key}={params[key]}' for key in sorted(params)) or 'none'
+        self.canvas.drawString(MARGIN, self.y, f'Generated {generated}. Filters: {filters}')
+
+    def heading(self, text):
+        self.columns = None
+        self._line(28)
+        self.canvas.setFont('Helvetica-Bold', 13)
+        self.canvas.drawString(MARGIN, self.y, text)
+
+    def subheading(self, text):
+        self.columns = None
+        self._line(20)
+        self.canvas.setFont('Helvetica-Bold', 11)
+        self.canvas.drawString(MARGIN, self.y, text)
+
+    def header(self, columns):
+        self.columns = None
+        self._line()
+        self.canvas.setFont('Helvetica-Bold', 9)
+        for label, x in columns:
+            self.canvas.drawString(MARGIN + x, self.y, label)
+        self.columns = columns
+
+    def row(self, values, columns):
+        self._line()
+        self.canvas.setFont('Helvetica', 9)
+        for value, (_, x) in zip(values, columns):
+            self.canvas.drawString(MARGIN + x, self.y, str(value))
+
+    def total(self, label, value, columns):
+        self.columns = None
+        self._line()
+        self.canvas.setFont('Helvetica-Bold', 9)
+        self.canvas.drawString(MARGIN, self.y, label)
+        self.canvas.drawString(MARGIN + columns[-1][1], self.y, f'{value:.2f}')
+
+    def save(self):
+        self._footer()
+        self.canvas.save()
@@ -0,0 +1,184 @@
+"""
+Daily rollups of receipts, adjustments and transfers for the chart endpoints.
+
+Each rollup row holds the day's totals of one company's documents for one
+combination of dimensions (location, category, adjustment type, or the two
+locations of a transfer). Every write path calls add() or remove() with the
+documents it saves or deletes, in the same transaction, so the rollups always
+match the documents. Charts then sum a few rows per day instead of scanning
+the document tables; weekly, monthly and yearly series are truncated from the
+daily rows.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import DateField, F
+
+from .models import InventoryItem, StockAdjustment, StockTransfer
+from .models import ReceiptRollup, AdjustmentRollup, TransferRollup
+from . import upserts
+
+BATCH_SIZE = 500
+
+_date = DateField()
+
+
+class _Spec(NamedTuple):
+    rollup: type          # rollup model
+    date_field: str       # document date the rollup is kept by
+    dimensions: tuple     # document fields the rollup is split by, named the same on the rollup
+    price_field: str      # document price for the rollup's value, if it has one
+    filters: dict         # filterset field -> rollup lookup, for the filters a rollup can answer
+
+    @property
+    def metrics(self):
+        # Metrics the rollup can answer (see aggregation.py)
+        return ('quantity', 'count', 'value') if self.price_field else ('quantity', 'count')
+
+    @property
+    def fields(self):
+        # Document fields whose change moves the document to another rollup row or changes its totals
+        return (self.date_field, *self.dimensions, 'quantity') + ((self.price_field,) if self.price_field else ())
+
+
+SPECS = {
+    InventoryItem: _Spec(
+        ReceiptRollup, 'inventory_date', ('location_id', 'category_id'), 'price',
+        {'location': 'location', 'category': 'category', 'start_date': 'date__gte', 'end_date': 'date__lte'},
+    ),
+    StockAdjustment: _Spec(
+        AdjustmentRollup, 'date', ('location_id', 'category_id', 'adjustment_type'), '',
+        {'location': 'location', 'category': 'category', 'adjustment_type': 'adjustment_type',
+         'start_date': 'date__gte', 'end_date': 'date__lte'},
+    ),
+    StockTransfer: _Spec(
+        TransferRollup, 'date', ('from_location_id', 'to_location_id', 'category_id'), 'price',
+        {'from_location': 'from_location', 'to_location': 'to_location', 'category': 'category',
+         'start_date': 'date__gte', 'end_date': 'date__lte'},
+    ),
+}
+
+
+def add(documents, sign=1):
+    """Add the documents to their rollups (or take them out with sign=-1)."""
+    apply(deltas(documents, sign))
+
+
+def remove(documents):
+    add(documents, -1)
+
+
+def deltas(documents, sign=1, net=None):
+    """Net changes per rollup row, {(document model, key): [quantity, value, lines]}, for `documents`."""
+    net = defaultdict(lambda: [0, Decimal(0), 0]) if net is None else net
+    for document in documents:
+        spec = SPECS[type(document)]
+        # Documents saved straight from create() may still hold their dates and prices as strings
+        date = _date.to_python(getattr(document, spec.date_field))
+        key = (document.company_id, date) + tuple(getattr(document, f) for f in spec.dimensions)
+        entry = net[type(document), key]
+        entry[0] += sign * document.quantity
+        if spec.price_field:
+            entry[1] += sign * document.quantity * Decimal(str(getattr(document, spec.price_field)))
+        entry[2] += sign
+    return net
+
+
+def apply(net):
+    """Book net changes from deltas() onto the rollup rows, creating the rows that are missing."""
+    by_model = defaultdict(dict)
+    for (model, key), entry in net.items():
+        if any(entry):
+            by_model[model][key] = entry
+    if not by_model:
+        return
+    with transaction.atomic():
+        for model, entries in by_model.items():
+            _apply_many(SPECS[model], entries)
+
+
+def _key(spec, row):
+    return (row.company_id, row.date) + tuple(getattr(row, f) for f in spec.dimensions)
+
+
+def _fetch_many(spec, keys):
+    rows = {}
+    keys = sorted(keys)
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start:start + BATCH_SIZE]
+        wanted = set(batch)
+        candidates = spec.rollup.objects.filter(
+            company_id__in={key[0] for key in batch},
+            date__in={key[1] for key in batch},
+            **{f'{field}__in': {key[2 + i] for key in batch} for i, field in enumerate(spec.dimensions)},
+        )
+        for row in candidates:
+            key = _key(spec, row)
+            if key in wanted:
+                rows[key] = row
+    return rows
+
+
+def _values(spec, entry):
+    quantity, value, lines = entry
+    values = {'quantity': quantity, 'lines': lines}
+    if spec.price_field:
+        values['value'] = value
+    return values
+
+
+def _increments(spec, entry):
+    # As expressions, so concurrent writers add up instead of overwriting each other
+    return {field: F(field) + amount for field, amount in _values(spec, entry).items()}
+
+
+def _new_row(spec, key, entry):
+    dimensions = dict(zip(spec.dimensions, key[2:]))
+    return spec.rollup(company_id=key[0], date=key[1], **dimensions, **_values(spec, entry))
+
+
+def _apply_many(spec, entries):
+    rows = _fetch_many(spec, entries)
+    changed, missing = [], []
+    for key, entry in entries.items():
+        row = rows.get(key)
+        if row is not None:
+            for field, total in _increments(spec, entry).items():
+                setattr(row, field, total)
+            changed.append(row)
+        elif entry[2] > 0:
+            # Only new documents create rows; a row that is gone went with its location or category
+            missing.append(key)
+
+    upserts.bulk_upsert(
+        spec.rollup, changed, list(_values(spec, (0, 0, 0))),
+        {key: _new_row(spec, key, entries[key]) for key in missing},
+        lambda key: _apply(spec, key, entries[key]), batch_size=BATCH_SIZE,
+    )
+
+
+def _apply(spec, key, entry):
+    rows = spec.rollup.objects.filter(company_id=key[0], date=key[1], **dict(zip(spec.dimensions, key[2:])))
+    upserts.add_or_create(rows, _increments(spec, entry), lambda: _new_row(spec, key, entry))
+
+
+def source(filterset, company, dimensions=(), metrics=('quantity',)):
+    """
+    The queryset to aggregate the filterset's documents from, its date field, and whether it is the rollup.
+
+    That is the document's rollup when it keeps everything the filters, the
+    `dimensions` to split by and the `metrics` need; otherwise the filtered
+    documents.
+    """
+    spec = SPECS[filterset._meta.model]
+    data = {name: value for name, value in filterset.form.cleaned_data.items() if value not in (None, '')}
+    if (
+        all(name in spec.filters for name in data)
+        and all(f'{dimension}_id' in spec.dimensions or dimension in spec.dimensions for dimension in dimensions)
+        and all(metric in spec.metrics for metric in metrics)
+    ):
+        rollups = spec.rollup.objects.filter(company=company, lines__gt=0, **{spec.filters[name]: value for name, value in data.items()})
+        return rollups, 'date', True
+    return filterset.qs.filter(company=company), spec.date_field, False
@@ -0,0 +1,145 @@
+"""
+Full-text search index for inventory items, stock adjustments and stock transfers.
+
+On SQLite the searchable fields of every document are kept in an FTS5 table
+with the trigram tokenizer, one column per field, so ?search= terms of three or
+more characters are matched as substrings (what icontains did) through the index
+instead of a full scan, and never across the boundary of two fields.
+
+When no document contains the terms, the search falls back to documents with a
+field sharing at least half of each term's trigrams, which tolerates small
+typos. That fallback is a suggestion list rather than a full result: it ranks
+the SYNCSTOCK_SEARCH_FUZZY_CANDIDATES documents sharing the most trigrams with
+the terms (500 by default), and returns at most SYNCSTOCK_SEARCH_FUZZY_LIMIT of
+those that pass (50 by default), best ranked first.
+
+The index is kept in sync by signals, and by the bulk writers that bypass
+them. On other databases, or for shorter terms, IndexedSearchFilter falls back
+to DRF's regular icontains search.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+TABLE = 'syncstock_searchindex'
+
+# Documents of every kind share the index; rowid = pk * SLOTS + kind
+KINDS = {'inventoryitem': 1, 'stockadjustment': 2, 'stocktransfer': 3}
+SLOTS = 4
+
+# Indexed fields; `extra` is the supplier of an item and the date of a transfer
+COLUMNS = ('item_name', 'sku', 'product_code', 'extra')
+
+# Shortest term the trigram index can match
+MIN_TERM_LENGTH = 3
+
+_enabled = {}
+
+
+def enabled():
+    """True when the current database has the search index table."""
+    name = connection.settings_dict['NAME']
+    if name not in _enabled:
+        _enabled[name] = connection.vendor == 'sqlite' and TABLE in connection.introspection.table_names()
+    return _enabled[name]
+
+
+def fuzzy_candidates():
+    return getattr(settings, 'SYNCSTOCK_SEARCH_FUZZY_CANDIDATES', 500)
+
+
+def fuzzy_limit():
+    return getattr(settings, 'SYNCSTOCK_SEARCH_FUZZY_LIMIT', 50)
+
+
+def document_fields(document):
+    # The fields the views used to search with icontains, in COLUMNS order
+    kind = document._meta.model_name
+    item = document if kind == 'inventoryitem' else document.item
+    extra = ''
+    if kind == 'inventoryitem':
+        extra = item.supplier_name
+    elif kind == 'stocktransfer':
+        extra = str(document.date)
+    return (item.item_name, item.sku, item.product_code or '', extra or '')
+
+
+def _rowid(document):
+    return document.pk * SLOTS + KINDS[document._meta.model_name]
+
+
+def index(documents):
+    """Add or refresh documents of any indexed kind."""
+    documents = [document for document in documents if document.pk is not None]
+    if not documents or not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(_rowid(d),) for d in documents])
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, company_id, {", ".join(COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)',
+            [(_rowid(d), d.company_id, *document_fields(d)) for d in documents],
+        )
+
+
+def remove(documents):
+    """Drop deleted documents from the index; call before their pk is cleared."""
+    documents = [document for document in documents if document.pk is not None]
+    if not documents or not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(_rowid(d),) for d in documents])
+
+
+def _quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def matching(model, company_id, terms):
+    """
+    Return the pks of `model` documents matching every term, as a subquery for pk__in.
+
+    When no document contains them all, falls back to a list of at most
+    fuzzy_limit() documents with, for every term, a field sharing at least half
+    of its trigrams.
+    """
+    kind = KINDS[model._meta.model_name]
+    select = (
+        f'SELECT rowid / {SLOTS} FROM {TABLE} '
+        f'WHERE {TABLE} MATCH %s AND company_id = %s AND rowid %% {SLOTS} = %s'
+    )
+    exact = ' '.join(_quote(term) for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(select + ' LIMIT 1', [exact, company_id, kind])
+        if cursor.fetchone():
+            return RawSQL(select, [exact, company_id, kind])
+
+    # Candidates sharing any trigram, best ranked first; keep those with a field sharing at least half of every term's
+    terms = [
+        {term[start:start + 3].lower() for start in range(len(term) - 2)}
+        for term in terms
+    ]
+    fuzzy = ' OR '.join(_quote(trigram) for trigram in sorted(set().union(*terms)))
+    found = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            select.replace('SELECT rowid', f'SELECT {", ".join(COLUMNS)}, rowid') + ' ORDER BY rank LIMIT %s',
+            [fuzzy, company_id, kind, fuzzy_candidates()],
+        )
+        for *fields, pk in cursor.fetchall():
+            fields = [(field or '').lower() for field in fields]
+            if all(any(2 * sum(trigram in field for trigram in term) >= len(term) for field in fields) for term in terms):
+                found.append(pk)
+                if len(found) == fuzzy_limit():
+                    break
+    return found
+
+
+class IndexedSearchFilter(filters.SearchFilter):
+    """SearchFilter answered from the search index where it can be."""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not enabled() or min(len(term) for term in terms) < MIN_TERM_LENGTH:
+            return super().filter_queryset(request, queryset, view)
+        return queryset.filter(pk__in=matching(queryset.model, request.user.company.pk, terms))
@@ -6,7 +6,11 @@ from rest_framework import serializers
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
 from .models import User, InventoryItem, StockAdjustment, StockTransfer, Location, Category, Company
-from .models import TotalCurrentInventory
+from .models import TotalCurrentInventory, TransferDocument, Job, ReorderPoint, StockAlert
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from . import ledger, search, rollups
+from .fieldsets import SparseFieldsetSerializerMixin
 
 class CompanyRegistrationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -113,10 +117,15 @@ class ChangePasswordSerializer(serializers.Serializer):
     old_password = serializers.CharField(required=True)
     new_password = serializers.CharField(required=True)
 
-class InventoryItemSerializer(serializers.ModelSerializer):
+class InventoryItemSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     category_name = serializers.SerializerMethodField()
     location_name = serializers.SerializerMethodField()
 
+    method_field_sources = {
+        'category_name': ['category__name'],
+        'location_name': ['location__name'],
+    }
+
     class Meta:
         model = InventoryItem
         fields = ['id', 'item_name', 'sku', 'product_code', 'supplier_name', 'additional_description', 'quantity', 'price', 'inventory_date', 'expiration_date', 'category', 'location', 'category_name', 'location_name', 'user', 'company']
@@ -134,12 +143,14 @@ class InventoryItemSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request and request.user and hasattr(request.user, 'company'):
             company = request.user.company
-            self.fields['category'].queryset = Category.objects.filter(company=company)
-            self.fields['location'].queryset = Location.objects.filter(company=company)
+            self.scope(
+                category=Category.objects.filter(company=company),
+                location=Location.objects.filter(company=company),
+            )
 
 
 
-class StockAdjustmentSerializer(serializers.ModelSerializer):
+class StockAdjustmentSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     item_name = serializers.SerializerMethodField()
     location_name = serializers.SerializerMethodField()
     category_name = serializers.SerializerMethodField()
@@ -155,6 +166,13 @@ class StockAdjustmentSerializer(serializers.ModelSerializer):
     sku = serializers.SerializerMethodField(read_only=True)
     product_code = serializers.SerializerMethodField(read_only=True)
 
+    method_field_sources = {
+        'item_name': ['item__item_name'],
+        'location_name': ['location__name'],
+        'category_name': ['category__name'],
+        'sku': ['item__sku'],
+        'product_code': ['item__product_code'],
+    }
 
     class Meta:
         model = StockAdjustment
@@ -181,14 +199,37 @@ class StockAdjustmentSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request and request.user and hasattr(request.user, 'company'):
             company = request.user.company
-            self.fields['item'].queryset = InventoryItem.objects.filter(company=company)
-            self.fields['location'].queryset = Location.objects.filter(company=company)
-            self.fields['category'].queryset = Category.objects.filter(company=company)
+            self.scope(
+                item=InventoryItem.objects.filter(company=company),
+                location=Location.objects.filter(company=company),
+                category=Category.objects.filter(company=company),
+            )
         else:
             print("Request or company not set correctly")
 
 
-class StockTransferSerializer(serializers.ModelSerializer):
+class StockAdjustmentLineSerializer(serializers.Serializer):
+    # One line of a batch; related ids are resolved for the whole batch at once
+    item = serializers.IntegerField()
+    adjustment_type = serializers.ChoiceField(choices=StockAdjustment.ADJUSTMENT_TYPES)
+    quantity = serializers.IntegerField(min_value=1)
+    date = serializers.DateField()
+    reason = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    location = serializers.IntegerField()
+    category = serializers.IntegerField(required=False, allow_null=True)
+
+
+class StockAdjustmentBatchSerializer(serializers.Serializer):
+    MODES = [
+        ('atomic', 'All lines or none'),
+        ('partial', 'Each line on its own'),
+    ]
+
+    lines = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=1000)
+    mode = serializers.ChoiceField(choices=MODES, default='atomic')
+
+
+class StockTransferSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     item_name = serializers.SerializerMethodField()
     item = serializers.PrimaryKeyRelatedField(queryset=InventoryItem.objects.none())
     from_location_name = serializers.SerializerMethodField()
@@ -199,6 +240,15 @@ class StockTransferSerializer(serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(read_only=True)
     category_name = serializers.SerializerMethodField()
 
+    method_field_sources = {
+        'item_name': ['item__item_name'],
+        'sku': ['item__sku'],
+        'product_code': ['item__product_code'],
+        'category_name': ['item__category__name'],
+        'from_location_name': ['from_location__name'],
+        'to_location_name': ['to_location__name'],
+    }
+
     class Meta:
         model = StockTransfer
         fields = ['id', 'item', 'item_name', 'quantity', 'sku', 'product_code', 'date', 'from_location', 'to_location', 'from_location_name', 'to_location_name', 'category', 'supplier_name', 'price', 'expiration_date', 'category_name']
@@ -231,28 +281,114 @@ class StockTransferSerializer(serializers.ModelSerializer):
         if request and request.user and hasattr(request.user, 'company'):
             company = request.user.company
 
-            # Retrieve items filtered by the company
-            items = InventoryItem.objects.filter(company=company)
+            # One item per product can be transferred: its first receipt. The queryset stays lazy,
+            # so it only runs when a write validates the item, as one index probe for that pk.
+            earlier_receipts = InventoryItem.objects.filter(product_id=OuterRef('product_id'), pk__lt=OuterRef('pk'))
+            self.scope(
+                item=InventoryItem.objects.filter(company=company).exclude(Exists(earlier_receipts)),
+                # Set queryset for locations
+                from_location=Location.objects.filter(company=company),
+                to_location=Location.objects.filter(company=company),
+            )
+
+    def validate(self, data):
+        """Ensure from_location and to_location are not the same."""
+        if data.get('from_location') == data.get('to_location'):
+            raise serializers.ValidationError("The from_location and to_location cannot be the same.")
+        return data
+
+
+class TransferDocumentLineSerializer(serializers.ModelSerializer):
+    # Items are resolved for the whole document at once in TransferDocumentSerializer.validate
+    item = serializers.IntegerField(source='item_id')
+    item_name = serializers.CharField(source='item.item_name', read_only=True)
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = StockTransfer
+        fields = ['id', 'item', 'item_name', 'sku', 'product_code', 'quantity']
+        read_only_fields = ['sku', 'product_code']
+
 
-            # Manually filter unique items based on item_name
-            unique_items = {}
-            for item in items:
-                if item.item_name not in unique_items:
-                    unique_items[item.item_name] = item
+class TransferDocumentSerializer(serializers.ModelSerializer):
+    lines = TransferDocumentLineSerializer(many=True)
+    from_location_name = serializers.CharField(source='from_location.name', read_only=True)
+    to_location_name = serializers.CharField(source='to_location.name', read_only=True)
+
+    class Meta:
+        model = TransferDocument
+        fields = ['id', 'reference', 'notes', 'date', 'from_location', 'to_location', 'from_location_name', 'to_location_name', 'lines', 'created_at']
+        read_only_fields = ['created_at']
 
-            # Set queryset to include only unique items based on item_name
-            self.fields['item'].queryset = InventoryItem.objects.filter(pk__in=[item.pk for item in unique_items.values()])
-            
-            # Set queryset for locations
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request and request.user and hasattr(request.user, 'company'):
+            company = request.user.company
             self.fields['from_location'].queryset = Location.objects.filter(company=company)
             self.fields['to_location'].queryset = Location.objects.filter(company=company)
 
     def validate(self, data):
-        """Ensure from_location and to_location are not the same."""
         if data.get('from_location') == data.get('to_location'):
             raise serializers.ValidationError("The from_location and to_location cannot be the same.")
+        if not data.get('lines'):
+            raise serializers.ValidationError({'lines': ["A transfer document needs at least one line."]})
+
+        company = self.context['request'].user.company
+        items = InventoryItem.objects.filter(company=company).in_bulk({line['item_id'] for line in data['lines']})
+        errors = []
+        for line in data['lines']:
+            line['item'] = items.get(line['item_id'])
+            errors.append({} if line['item'] else {'item': [f"Invalid pk \"{line['item_id']}\" - object does not exist."]})
+        if any(errors):
+            raise serializers.ValidationError({'lines': errors})
         return data
 
+    def create(self, validated_data):
+        lines = validated_data.pop('lines')
+        with transaction.atomic():
+            document = TransferDocument.objects.create(**validated_data)
+            transfers = [
+                StockTransfer(
+                    document=document,
+                    item=line['item'],
+                    product_id=line['item'].product_id,
+                    quantity=line['quantity'],
+                    date=document.date,
+                    from_location=document.from_location,
+                    to_location=document.to_location,
+                    company=document.company,
+                    user=document.user,
+                    sku=line['item'].sku,
+                    product_code=line['item'].product_code,
+                    supplier_name=(line['item'].supplier_name or '')[:25],
+                    additional_description=line['item'].additional_description,
+                    price=line['item'].price,
+                    expiration_date=line['item'].expiration_date,
+                    category_id=line['item'].category_id,
+                )
+                for line in lines
+            ]
+
+            # The whole document fails if any line is short at the source location
+            keys = [ledger.balance_key(transfer.product_id, transfer.from_location_id) for transfer in transfers]
+            on_hand = ledger.available(set(keys))
+            errors = []
+            for key, transfer in zip(keys, transfers):
+                if on_hand[key] < transfer.quantity:
+                    errors.append({'quantity': [f"Insufficient stock, only {on_hand[key]} available for this line."]})
+                else:
+                    errors.append({})
+                on_hand[key] -= transfer.quantity
+            if any(errors):
+                raise serializers.ValidationError({'lines': errors})
+
+            StockTransfer.objects.bulk_create(transfers)
+            search.index(transfers)
+            rollups.add(transfers)
+            ledger.post([movement for transfer in transfers for movement in ledger.transfer_movements(transfer)])
+        return document
+
 
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -292,10 +428,15 @@ class CategorySerializer(serializers.ModelSerializer):
         return instance
 
 
-class TotalCurrentInventorySerializer(serializers.ModelSerializer):
+class TotalCurrentInventorySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     category_name = serializers.SerializerMethodField()
     location_name = serializers.SerializerMethodField()
 
+    method_field_sources = {
+        'category_name': ['category__name'],
+        'location_name': ['location__name'],
+    }
+
     class Meta:
         model = TotalCurrentInventory
         fields = ['id', 'item_name', 'product_code', 'sku', 'total_current_inventory', 'category_name', 'location_name']
@@ -309,6 +450,64 @@ class TotalCurrentInventorySerializer(serializers.ModelSerializer):
 
 
 
+class ReorderPointSerializer(serializers.ModelSerializer):
+    # Set on an item; the point belongs to the item's product at the location
+    item = serializers.PrimaryKeyRelatedField(queryset=InventoryItem.objects.none(), write_only=True)
+    sku = serializers.CharField(source='product.sku', read_only=True)
+    item_name = serializers.CharField(source='product.item_name', read_only=True)
+    location_name = serializers.CharField(source='location.name', read_only=True)
+
+    class Meta:
+        model = ReorderPoint
+        fields = ['id', 'item', 'sku', 'item_name', 'location', 'location_name', 'threshold', 'low', 'updated_at']
+        read_only_fields = ['low', 'updated_at']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request and request.user and hasattr(request.user, 'company'):
+            company = request.user.company
+            self.fields['item'].queryset = InventoryItem.objects.filter(company=company)
+            self.fields['location'].queryset = Location.objects.filter(company=company)
+
+    def validate(self, data):
+        item = data.pop('item', None)
+        if item is not None:
+            data['product'] = item.product
+        product = data.get('product', getattr(self.instance, 'product', None))
+        location = data.get('location', getattr(self.instance, 'location', None))
+        others = ReorderPoint.objects.filter(product=product, location=location)
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError("This item already has a reorder point at this location.")
+        return data
+
+
+class StockAlertSerializer(serializers.ModelSerializer):
+    sku = serializers.CharField(source='product.sku', read_only=True)
+    item_name = serializers.CharField(source='product.item_name', read_only=True)
+    location_name = serializers.CharField(source='location.name', read_only=True)
+
+    class Meta:
+        model = StockAlert
+        fields = ['id', 'kind', 'sku', 'item_name', 'location', 'location_name', 'quantity', 'threshold', 'created_at']
+        read_only_fields = fields
+
+
+class JobSerializer(serializers.ModelSerializer):
+    error = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'task', 'status', 'attempts', 'max_attempts', 'result', 'error', 'created_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_error(self, obj):
+        # The last line of the traceback; the full one stays in the admin
+        return obj.error.strip().splitlines()[-1] if obj.error else None
+
+
 class AggregatedInventoryItemSerializer(serializers.Serializer):
     trunc_date = serializers.CharField()  # Using CharField to handle various formats like week numbers, month names, and years
     total_quantity = serializers.IntegerField()
@@ -319,4 +518,18 @@ class AggregatedStockAdjustmentSerializer(serializers.Serializer):
 
 class AggregatedStockTransferSerializer(serializers.Serializer):
     trunc_date = serializers.CharField()  # Using CharField to handle various formats like week numbers, month names, and years
-    total_quantity = serializers.IntegerField()
\ No newline at end of file
+    total_quantity = serializers.IntegerField()
+
+class PeriodParamsSerializer(serializers.Serializer):
+    # Query parameters of a report over a period; each view has its own default period
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('start_date') and data.get('end_date') and data['start_date'] > data['end_date']:
+            raise serializers.ValidationError({'end_date': "End date must not be before start date."})
+        return data
+
+class DashboardParamsSerializer(PeriodParamsSerializer):
+    low_stock = serializers.IntegerField(required=False, min_value=0)
+    top = serializers.IntegerField(required=False, min_value=1, max_value=50)
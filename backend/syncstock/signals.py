@@ -1,253 +1,188 @@
 from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models import QuerySet
 from django.dispatch import receiver
-from django.core.exceptions import ValidationError
-from .models import InventoryItem, StockAdjustment, StockTransfer, TotalCurrentInventory
+from .models import InventoryItem, StockAdjustment, StockTransfer, Company, Location, Category
+from . import ledger, caching, search, rollups
+
+ADJUSTMENT_ERROR = "Insufficient stock, cannot proceed with the adjustment."
+TRANSFER_ERROR = "Insufficient stock, cannot proceed with the transfer."
+
+
+def _remember_previous(sender, instance):
+    # Keep the stored version of the row so post_save can book only the difference.
+    # Rows loaded in full carry a snapshot of their values, so only deferred or
+    # bulk-created rows need to be read back.
+    instance._ledger_previous = None
+    if instance.pk is None:
+        return
+    if not instance.has_changed(*sender.LEDGER_FIELDS):
+        instance._ledger_unchanged = True
+        return
+    previous = instance.loaded_copy()
+    if previous is None:
+        previous = sender.objects.filter(pk=instance.pk).first()
+    instance._ledger_previous = previous
+
+
+def _post_changes(instance, movements_for, error_message=ledger.INSUFFICIENT_STOCK):
+    previous = instance.__dict__.pop('_ledger_previous', None)
+    if instance.__dict__.pop('_ledger_unchanged', False):
+        return
+    movements = movements_for(instance)
+    if previous is not None:
+        movements += ledger.reverse(movements_for(previous))
+    ledger.post(movements, error_message)
+
+
+def _post_reversal(instance, movements_for, origin):
+    movements = movements_for(instance)
+    owner = origin.model if isinstance(origin, QuerySet) else type(origin)
+    # Balances and journal entries of a deleted company, category or location go with it
+    if issubclass(owner, (Company, Category)):
+        return
+    if issubclass(owner, Location):
+        deleted = set(origin.values_list('pk', flat=True)) if isinstance(origin, QuerySet) else {origin.pk}
+        movements = [movement for movement in movements if movement.location_id not in deleted]
+    ledger.post(ledger.reverse(movements))
 
 # InventoryItem signals
 
 @receiver(pre_save, sender=InventoryItem)
 def handle_inventory_item_pre_save(sender, instance, **kwargs):
-    if instance.pk:
-        old_instance = InventoryItem.objects.get(pk=instance.pk)
-        try:
-            old_total_inventory = TotalCurrentInventory.objects.get(
-                company=old_instance.company,
-                item_name=old_instance.item_name,
-                product_code=old_instance.product_code,
-                sku=old_instance.sku,
-                location=old_instance.location
-            )
-            old_total_inventory.total_current_inventory -= old_instance.quantity
-            old_total_inventory.total_current_inventory = max(0, old_total_inventory.total_current_inventory)
-            old_total_inventory.save()
-        except TotalCurrentInventory.DoesNotExist:
-            pass
+    _remember_previous(sender, instance)
+
+def _move_to_product(item):
+    # An item that now resolves to another product takes its adjustments and transfers along
+    for model, movements_for in ((StockAdjustment, ledger.adjustment_movements), (StockTransfer, ledger.transfer_movements)):
+        documents = list(model.objects.filter(item=item).exclude(product_id=item.product_id))
+        if not documents:
+            continue
+        movements = []
+        for document in documents:
+            movements += ledger.reverse(movements_for(document))
+            document.product_id = item.product_id
+            movements += movements_for(document)
+        model.objects.filter(pk__in=[document.pk for document in documents]).update(product_id=item.product_id)
+        ledger.post(movements)
 
 @receiver(post_save, sender=InventoryItem)
 def update_total_current_inventory(sender, instance, created, **kwargs):
-    # Check if the record exists
-    total_inventory, created = TotalCurrentInventory.objects.get_or_create(
-        company=instance.company,
-        item_name=instance.item_name,
-        product_code=instance.product_code,
-        sku=instance.sku,
-        location=instance.location,
-        category=instance.category,
-        defaults={'total_current_inventory': 0}
-    )
-    
-    if not created:
-        total_inventory.total_current_inventory += instance.quantity
-    else:
-        total_inventory.total_current_inventory = instance.quantity
-    
-    total_inventory.save()
+    previous = instance.__dict__.get('_ledger_previous')
+    if previous is None or previous.product_id == instance.product_id:
+        _post_changes(instance, ledger.receipt_movements)
+        return
+    # Book the receipt and its dependents' move together, so each balance is written once
+    with ledger.coalesce():
+        _post_changes(instance, ledger.receipt_movements)
+        _move_to_product(instance)
 
 @receiver(post_delete, sender=InventoryItem)
-def handle_inventory_item_delete(sender, instance, **kwargs):
-    try:
-        total_inventory = TotalCurrentInventory.objects.get(
-            company=instance.company,
-            item_name=instance.item_name,
-            product_code=instance.product_code,
-            sku=instance.sku,
-            location=instance.location,
-            category=instance.category
-        )
-        total_inventory.total_current_inventory -= instance.quantity
-        total_inventory.total_current_inventory = max(0, total_inventory.total_current_inventory)
-        total_inventory.save()
-    except TotalCurrentInventory.DoesNotExist:
-        pass
+def handle_inventory_item_delete(sender, instance, origin=None, **kwargs):
+    _post_reversal(instance, ledger.receipt_movements, origin)
 
 # StockAdjustment signals
 
 @receiver(pre_save, sender=StockAdjustment)
 def handle_stock_adjustment_pre_save(sender, instance, **kwargs):
-    if instance.pk:
-        old_instance = StockAdjustment.objects.get(pk=instance.pk)
-        try:
-            old_total_inventory = TotalCurrentInventory.objects.get(
-                company=old_instance.company,
-                item_name=old_instance.item.item_name,
-                product_code=old_instance.item.product_code,
-                sku=old_instance.item.sku,
-                location=old_instance.location,
-                category=old_instance.item.category
-            )
-            old_total_inventory.total_current_inventory += old_instance.quantity
-            old_total_inventory.save()
-        except TotalCurrentInventory.DoesNotExist:
-            pass
-
-    # New validation for current stock level
-    try:
-        total_inventory = TotalCurrentInventory.objects.get(
-            company=instance.company,
-            item_name=instance.item.item_name,
-            product_code=instance.item.product_code,
-            sku=instance.item.sku,
-            location=instance.location,
-            category=instance.item.category
-        )
-        if total_inventory.total_current_inventory < instance.quantity:
-            raise ValidationError("Insufficient stock, cannot proceed with the adjustment.")
-    except TotalCurrentInventory.DoesNotExist:
-        raise ValidationError("Insufficient stock, cannot proceed with the adjustment.")
+    _remember_previous(sender, instance)
 
 @receiver(post_save, sender=StockAdjustment)
 def update_total_current_inventory_after_adjustment(sender, instance, created, **kwargs):
-    total_inventory, created = TotalCurrentInventory.objects.get_or_create(
-        company=instance.company,
-        item_name=instance.item.item_name,
-        product_code=instance.item.product_code,
-        sku=instance.sku,
-        location=instance.location,
-        category=instance.item.category,
-        defaults={'total_current_inventory': 0}
-    )
-
-    if not created:
-        total_inventory.total_current_inventory -= instance.quantity
-        total_inventory.total_current_inventory = max(0, total_inventory.total_current_inventory)
-    else:
-        total_inventory.total_current_inventory = max(0, -instance.quantity)
-
-    total_inventory.save()
+    _post_changes(instance, ledger.adjustment_movements, ADJUSTMENT_ERROR)
 
 @receiver(post_delete, sender=StockAdjustment)
-def handle_stock_adjustment_delete(sender, instance, **kwargs):
-    try:
-        total_inventory = TotalCurrentInventory.objects.get(
-            company=instance.company,
-            item_name=instance.item.item_name,
-            product_code=instance.item.product_code,
-            sku=instance.sku,
-            location=instance.location,
-            category=instance.item.category
-        )
-        total_inventory.total_current_inventory += instance.quantity
-        total_inventory.save()
-    except TotalCurrentInventory.DoesNotExist:
-        pass
+def handle_stock_adjustment_delete(sender, instance, origin=None, **kwargs):
+    _post_reversal(instance, ledger.adjustment_movements, origin)
 
 # StockTransfer signals
 
 @receiver(pre_save, sender=StockTransfer)
 def pre_save_stock_transfer(sender, instance, **kwargs):
-    if instance.pk:  # Instance already exists, so it's an update
-        previous = StockTransfer.objects.get(pk=instance.pk)
-        
-        # Reverse the effects of the previous transfer
-        if previous.quantity != instance.quantity or previous.from_location != instance.from_location:
-            # Adjust TotalCurrentInventory for the previous 'from_location'
-            try:
-                total_inventory = TotalCurrentInventory.objects.get(
-                    company=previous.company,
-                    item_name=previous.item.item_name,
-                    product_code=previous.item.product_code,
-                    sku=previous.item.sku,
-                    location=previous.from_location,
-                    category=previous.item.category,
-                )
-                total_inventory.total_current_inventory += previous.quantity
-                total_inventory.save()
-            except TotalCurrentInventory.DoesNotExist:
-                pass  # In case the record was manually altered or deleted
-
-            # Adjust TotalCurrentInventory for the previous 'to_location'
-            try:
-                total_inventory = TotalCurrentInventory.objects.get(
-                    company=previous.company,
-                    item_name=previous.item.item_name,
-                    product_code=previous.item.product_code,
-                    sku=previous.item.sku,
-                    location=previous.to_location,
-                    category=previous.item.category,
-                )
-                total_inventory.total_current_inventory -= previous.quantity
-                total_inventory.total_current_inventory = max(0, total_inventory.total_current_inventory)
-                total_inventory.save()
-            except TotalCurrentInventory.DoesNotExist:
-                pass  # In case the record was manually altered or deleted
-
-    # New validation for stock level at 'from_location'
-    try:
-        total_inventory = TotalCurrentInventory.objects.get(
-            company=instance.company,
-            item_name=instance.item.item_name,
-            product_code=instance.item.product_code,
-            sku=instance.item.sku,
-            location=instance.from_location,
-            category=instance.item.category
-        )
-        if total_inventory.total_current_inventory < instance.quantity:
-            raise ValidationError("Insufficient stock, cannot proceed with the transfer.")
-    except TotalCurrentInventory.DoesNotExist:
-        raise ValidationError("Insufficient stock, cannot proceed with the transfer.")
+    _remember_previous(sender, instance)
 
 @receiver(post_save, sender=StockTransfer)
 def post_save_stock_transfer(sender, instance, created, **kwargs):
-    # Adjust TotalCurrentInventory for the new 'from_location'
-    total_inventory, created = TotalCurrentInventory.objects.get_or_create(
-        company=instance.company,
-        item_name=instance.item.item_name,
-        product_code=instance.item.product_code,
-        sku=instance.item.sku,
-        location=instance.from_location,
-        category=instance.item.category,
-        defaults={'total_current_inventory': 0},
-    )
-    if not created:
-        total_inventory.total_current_inventory -= instance.quantity
-        total_inventory.total_current_inventory = max(0, total_inventory.total_current_inventory)
-    else:
-        total_inventory.total_current_inventory = max(0, -instance.quantity)
-    total_inventory.save()
-
-    # Adjust TotalCurrentInventory for the new 'to_location'
-    total_inventory, created = TotalCurrentInventory.objects.get_or_create(
-        company=instance.company,
-        item_name=instance.item.item_name,
-        product_code=instance.item.product_code,
-        sku=instance.item.sku,
-        location=instance.to_location,
-        category=instance.item.category,
-        defaults={'total_current_inventory': instance.quantity},
-    )
-    if not created:
-        total_inventory.total_current_inventory += instance.quantity
-    total_inventory.save()
+    _post_changes(instance, ledger.transfer_movements, TRANSFER_ERROR)
 
 @receiver(post_delete, sender=StockTransfer)
-def post_delete_stock_transfer(sender, instance, **kwargs):
-    # Revert TotalCurrentInventory for the deleted 'from_location'
-    try:
-        total_inventory = TotalCurrentInventory.objects.get(
-            company=instance.company,
-            item_name=instance.item.item_name,
-            product_code=instance.item.product_code,
-            sku=instance.item.sku,
-            location=instance.from_location,
-            category=instance.item.category,
-        )
-        total_inventory.total_current_inventory += instance.quantity
-        total_inventory.save()
-    except TotalCurrentInventory.DoesNotExist:
-        pass
-
-    # Revert TotalCurrentInventory for the deleted 'to_location'
-    try:
-        total_inventory = TotalCurrentInventory.objects.get(
-            company=instance.company,
-            item_name=instance.item.item_name,
-            product_code=instance.item.product_code,
-            sku=instance.item.sku,
-            location=instance.to_location,
-            category=instance.item.category,
-        )
-        total_inventory.total_current_inventory -= instance.quantity
-        total_inventory.total_current_inventory = max(0, total_inventory.total_current_inventory)
-        total_inventory.save()
-    except TotalCurrentInventory.DoesNotExist:
-        pass
+def post_delete_stock_transfer(sender, instance, origin=None, **kwargs):
+    _post_reversal(instance, ledger.transfer_movements, origin)
+
+# Daily rollups
+
+@receiver(pre_save, sender=InventoryItem)
+@receiver(pre_save, sender=StockAdjustment)
+@receiver(pre_save, sender=StockTransfer)
+def remember_rolled_up(sender, instance, **kwargs):
+    instance._rollup_previous = None
+    if instance.pk is None or not instance.has_changed(*rollups.SPECS[sender].fields):
+        return
+    # Reuse the stored version the ledger read, if it needed one
+    previous = instance.__dict__.get('_ledger_previous') or instance.loaded_copy()
+    if previous is None:
+        previous = sender.objects.filter(pk=instance.pk).first()
+    instance._rollup_previous = previous
+
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_save, sender=StockAdjustment)
+@receiver(post_save, sender=StockTransfer)
+def update_rollups(sender, instance, created, **kwargs):
+    previous = instance.__dict__.pop('_rollup_previous', None)
+    if not created and previous is None:
+        return
+    net = rollups.deltas([instance])
+    if previous is not None:
+        rollups.deltas([previous], -1, net)
+    rollups.apply(net)
+
+@receiver(post_delete, sender=InventoryItem)
+@receiver(post_delete, sender=StockAdjustment)
+@receiver(post_delete, sender=StockTransfer)
+def remove_from_rollups(sender, instance, **kwargs):
+    rollups.remove([instance])
+
+# Filter choices cache
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=InventoryItem)
+def invalidate_filter_choices(sender, instance, **kwargs):
+    caching.bump('filters', instance.company_id)
+
+# Company data version, for the report and analytics caches. The ledger also
+# bumps it for the bulk write paths, which send no signals.
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=InventoryItem)
+@receiver([post_save, post_delete], sender=StockAdjustment)
+@receiver([post_save, post_delete], sender=StockTransfer)
+def invalidate_stock_data(sender, instance, **kwargs):
+    caching.bump('stock', instance.company_id)
+
+# Search index
+
+@receiver(post_save, sender=InventoryItem)
+def index_inventory_item(sender, instance, created, **kwargs):
+    if created or instance.has_changed('item_name', 'sku', 'product_code', 'supplier_name'):
+        search.index([instance])
+    # Adjustments and transfers are found by their item's names
+    if not created and instance.has_changed('item_name', 'sku', 'product_code'):
+        search.index(instance.stockadjustment_set.select_related('item'))
+        search.index(instance.stocktransfer_set.select_related('item'))
+
+@receiver(post_save, sender=StockAdjustment)
+def index_stock_adjustment(sender, instance, created, **kwargs):
+    if created or instance.has_changed('item_id'):
+        search.index([instance])
+
+@receiver(post_save, sender=StockTransfer)
+def index_stock_transfer(sender, instance, created, **kwargs):
+    if created or instance.has_changed('item_id', 'date'):
+        search.index([instance])
+
+@receiver(post_delete, sender=InventoryItem)
+@receiver(post_delete, sender=StockAdjustment)
+@receiver(post_delete, sender=StockTransfer)
+def unindex_document(sender, instance, **kwargs):
+    search.remove([instance])
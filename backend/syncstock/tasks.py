@@ -0,0 +1,162 @@
+"""
+Background jobs, queued in the database and run by `manage.py run_worker`.
+
+A worker claims a job by leasing it: one conditional UPDATE marks the row
+running until `leased_until`, so two workers never claim the same job, and a
+job whose lease ran out (its worker died) is claimed again. While a handler
+runs, a heartbeat thread renews the lease every third of it, so a long job
+keeps its worker however long it takes. Due jobs are
+claimed highest priority first, then oldest first. A job that raises is
+retried with exponential backoff until it has used max_attempts, then marked
+failed with the traceback.
+
+Handlers are registered with @task(name), take the Job and return a
+JSON-serialisable result. They run in a transaction, so a failed attempt
+leaves nothing half-written behind; a handler that only reads the database is
+registered with atomic=False instead, so it holds no transaction open.
+
+The heartbeat writes from its own connection while the handler runs. On SQLite
+that needs the database in WAL mode (see settings), where readers do not block
+a writer; a handler that keeps a write transaction open still blocks it until
+it commits.
+"""
+import contextlib
+import datetime
+import logging
+import threading
+import traceback
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+LEASE = datetime.timedelta(minutes=5)
+RETRY_DELAY = datetime.timedelta(seconds=30)  # doubled after every failed attempt
+UNFINISHED = ['queued', 'running']
+
+_handlers = {}
+
+
+def task(name, atomic=True):
+    """Register the decorated function as the handler of jobs named `name`, run in a transaction unless not atomic."""
+    def register(handler):
+        _handlers[name] = (handler, atomic)
+        return handler
+    return register
+
+
+def enqueue(name, payload=None, company=None, priority=0, max_attempts=3, key='', delay=None):
+    """
+    Queue a job and return it.
+
+    With a `key`, a job with the same key that has not finished yet is
+    returned instead of queueing another one.
+    """
+    if key:
+        existing = Job.objects.filter(key=key, status__in=UNFINISHED).order_by('pk').first()
+        if existing is not None:
+            return existing
+    return Job.objects.create(
+        task=name,
+        payload=payload or {},
+        company=company,
+        key=key,
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + (delay or datetime.timedelta()),
+    )
+
+
+def _claimable(now):
+    return Q(status='queued', run_at__lte=now) | Q(status='running', leased_until__lt=now)
+
+
+def claim(worker, lease=LEASE, limit=10):
+    """Lease the next due job to `worker` and return it, or None when nothing is due."""
+    now = timezone.now()
+    candidates = Job.objects.filter(_claimable(now)).order_by('-priority', 'run_at', 'pk').values_list('pk', flat=True)
+    for pk in candidates[:limit]:
+        # Another worker may have claimed it since it was read; the update then matches nothing
+        claimed = Job.objects.filter(_claimable(now), pk=pk).update(
+            status='running', leased_until=now + lease, worker=worker, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def renew(job, lease=LEASE):
+    """Extend the lease of a running job; False when it has passed to another worker."""
+    return bool(
+        Job.objects.filter(pk=job.pk, status='running', worker=job.worker)
+        .update(leased_until=timezone.now() + lease)
+    )
+
+
+def _heartbeat(job, lease, done):
+    # Runs in its own thread, with its own database connection, until the handler is done
+    try:
+        while not done.wait(lease.total_seconds() / 3):
+            try:
+                if not renew(job, lease):
+                    return
+            except DatabaseError:
+                logger.warning("Could not renew the lease of job %s", job, exc_info=True)
+    finally:
+        connection.close()
+
+
+def run(job, lease=LEASE):
+    """Run a claimed job and record its outcome, unless its lease has passed to another worker."""
+    mine = Job.objects.filter(pk=job.pk, status='running', worker=job.worker)
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job, lease, done), daemon=True)
+    try:
+        if job.attempts > job.max_attempts:
+            raise RuntimeError(f"Lease expired on each of {job.max_attempts} attempts.")
+        if job.task not in _handlers:
+            raise LookupError(f"No handler registered for task {job.task!r}.")
+        handler, atomic = _handlers[job.task]
+        heartbeat.start()
+        try:
+            with transaction.atomic() if atomic else contextlib.nullcontext():
+                result = handler(job)
+        finally:
+            done.set()
+            heartbeat.join()
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception("Job %s failed on attempt %s", job, job.attempts)
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+            mine.update(status='queued', run_at=now + delay, leased_until=None, error=error)
+        else:
+            mine.update(status='failed', finished_at=now, leased_until=None, error=error)
+        return False
+    mine.update(status='done', result=result, finished_at=timezone.now(), leased_until=None, error='')
+    return True
+
+
+def work(worker, once=False, poll_interval=1.0, lease=LEASE, stop=None):
+    """
+    Claim and run jobs until `stop` is set, returning the number of jobs run.
+
+    With once, return as soon as no job is due instead of polling for more.
+    """
+    stop = stop or threading.Event()
+    count = 0
+    while not stop.is_set():
+        job = claim(worker, lease)
+        if job is None:
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        run(job, lease)
+        count += 1
+    return count
@@ -1,3 +1,1010 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import Company, User, Location, Category, InventoryItem, StockAdjustment, StockTransfer, TransferDocument
+from .models import Job, ReorderPoint, StockAlert, StockMovement, TotalCurrentInventory
+from .pagination import HistoryPagination
+from . import caching, importers, ledger, rollups, tasks
+
+
+class StockTestCase(TestCase):
+    """
+    A company with a user, a warehouse, a shop and a category, created once per
+    class. Each test starts with an empty cache and a client logged in as the
+    user; the helpers book stock through the same paths the app uses.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Acme', company_email='acme@example.com')
+        cls.user = User.objects.create_user('alice', password='secret123', company=cls.company)
+        cls.warehouse = Location.objects.create(company=cls.company, name='Warehouse', address='1 Dock Road')
+        cls.shop = Location.objects.create(company=cls.company, name='Shop', address='2 High Street')
+        cls.hardware = Category.objects.create(company=cls.company, name='Hardware')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def receive(self, item_name, sku, quantity=10, price=1, date=datetime.date(2024, 1, 1), location=None, category=None):
+        return InventoryItem.objects.create(
+            item_name=item_name, sku=sku, quantity=quantity, price=price, inventory_date=date,
+            location=location or self.warehouse, category=category or self.hardware, user=self.user, company=self.company,
+        )
+
+    def adjust(self, item, quantity, adjustment_type='sold', date='2024-01-02', location=None):
+        # Through the batch endpoint, as the app books adjustments
+        response = self.client.post('/api/stock-adjustments/batch/', {'lines': [
+            {'item': item.pk, 'adjustment_type': adjustment_type, 'quantity': quantity, 'date': date,
+             'location': (location or self.warehouse).pk},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response
+
+    def transfer(self, lines, date='2024-01-04', from_location=None, to_location=None):
+        # A transfer document moving (item, quantity) lines, by default from the warehouse to the shop
+        response = self.client.post('/api/transfer-documents/', {
+            'date': date, 'from_location': (from_location or self.warehouse).pk, 'to_location': (to_location or self.shop).pk,
+            'lines': [{'item': item.pk, 'quantity': quantity} for item, quantity in lines],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response
+
+    def balance(self, item, location=None):
+        balance = TotalCurrentInventory.objects.filter(product_id=item.product_id, location=location or self.warehouse).first()
+        return balance.total_current_inventory if balance else None
+
+
+class LedgerTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.item = self.receive('Hammer', 'HAM-1')
+
+    def movement(self, quantity, location=None):
+        return ledger.Movement(self.item.product_id, self.company.pk, self.hardware.pk, (location or self.warehouse).pk,
+                               quantity, None, datetime.date(2024, 1, 2))
+
+    def test_debit_beyond_stock_on_hand_is_refused(self):
+        with self.assertRaisesMessage(ValidationError, 'Insufficient stock'), transaction.atomic():
+            StockAdjustment.objects.create(
+                item=self.item, adjustment_type='sold', quantity=11, date=datetime.date(2024, 1, 2),
+                location=self.warehouse, category=self.hardware, company=self.company, user=self.user,
+            )
+        self.assertEqual((self.balance(self.item), StockAdjustment.objects.count()), (10, 0))
+
+        # Set-based path: one overdrawn balance fails the whole posting
+        with self.assertRaises(ValidationError), transaction.atomic():
+            ledger.post([self.movement(-4), self.movement(-1, self.shop)], journal=False)
+        self.assertEqual(self.balance(self.item), 10)
+
+    def test_movements_on_one_balance_are_netted(self):
+        # Taken alone the debit overdraws; netted with the credit it books the difference
+        ledger.post([self.movement(-15), self.movement(10)], journal=False)
+        self.assertEqual(self.balance(self.item), 5)
+
+    def test_reversal_beyond_stock_on_hand_clamps_at_zero(self):
+        TotalCurrentInventory.objects.update(total_current_inventory=3)
+        with self.assertLogs('syncstock.ledger', 'WARNING') as logs:
+            self.item.delete()
+        self.assertIn('clamped at zero', logs.output[0])
+        self.assertEqual(self.balance(self.item), 0)
+
+
+class ImportTests(StockTestCase):
+    ROWS = [
+        'item_name,sku,quantity,price,inventory_date,category,location',
+        'Hammer,HAM-1,5,2.50,2024-01-01,Hardware,Warehouse',
+        'Hammer,HAM-1,-2,2.50,2024-01-01,Hardware,Warehouse',
+        'Hammer,HAM-1,7,2.50,2024-01-02,hardware,Warehouse',
+        'Saw,SAW-1,3,9.00,2024-01-02,Hardware,Attic',
+    ]
+
+    def upload(self, rows):
+        return SimpleUploadedFile('items.csv', '\n'.join(rows).encode(), content_type='text/csv')
+
+    def test_invalid_rows_are_reported_by_row_number(self):
+        response = self.client.post('/api/inventory-items/import/', {'file': self.upload(self.ROWS)}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 2))
+        self.assertEqual(response.data['errors'], [
+            {'row': 3, 'errors': {'quantity': 'Quantity must be a positive whole number.'}},
+            {'row': 5, 'errors': {'location': "Unknown location 'Attic'."}},
+        ])
+        self.assertEqual(self.balance(InventoryItem.objects.first()), 12)
+
+    def test_import_is_one_transaction(self):
+        # Rows already flushed in earlier batches go too when booking the balances fails
+        with mock.patch.object(importers, 'BATCH_SIZE', 1), \
+                mock.patch.object(ledger, 'post', side_effect=ValidationError('boom')), \
+                self.assertRaises(ValidationError):
+            importers.InventoryImport(self.company, self.user).run(self.upload(self.ROWS))
+        self.assertEqual((InventoryItem.objects.count(), StockMovement.objects.count()), (0, 0))
+
+
+class JournalTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.item = self.receive('Hammer', 'HAM-1')
+        self.adjustment = StockAdjustment.objects.create(
+            item=self.item, adjustment_type='damage', quantity=3, date=datetime.date(2024, 1, 2),
+            location=self.warehouse, category=self.hardware, company=self.company, user=self.user,
+        )
+        self.key = ledger.balance_key(self.item.product_id, self.warehouse.pk)
+
+    def test_every_change_is_journaled(self):
+        self.adjustment.quantity = 5
+        self.adjustment.save()
+        self.adjustment.delete()
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('source_type', 'quantity')),
+            [('receipt', 10), ('adjustment', -3), ('adjustment', -2), ('adjustment', 5)],
+        )
+        self.assertEqual(self.balance(self.item), 10)
+
+    def test_replay_rebuilds_balances_from_the_journal(self):
+        TotalCurrentInventory.objects.update(total_current_inventory=99)
+        self.assertEqual(ledger.replay(self.company, dry_run=True), [ledger.Correction(self.key, 99, 7, 7)])
+        self.assertEqual(self.balance(self.item), 99)
+        self.assertEqual(ledger.replay(self.company), [ledger.Correction(self.key, 99, 7, 7)])
+        self.assertEqual(self.balance(self.item), 7)
+        self.assertEqual(ledger.replay(self.company), [])
+
+
+class RebuildInventoryTotalsTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.item = self.receive('Hammer', 'HAM-1')
+        StockAdjustment.objects.create(
+            item=self.item, adjustment_type='damage', quantity=3, date=datetime.date(2024, 1, 2),
+            location=self.warehouse, category=self.hardware, company=self.company, user=self.user,
+        )
+        # Drift the balance, and lose the adjustment from the journal so the two sources disagree
+        TotalCurrentInventory.objects.update(total_current_inventory=99)
+        StockMovement.objects.filter(source_type='adjustment').delete()
+
+    def rebuild(self, *args):
+        out = io.StringIO()
+        call_command('rebuild_inventory_totals', *args, stdout=out)
+        return out.getvalue().splitlines()
+
+    def test_dry_run_reports_without_writing(self):
+        self.assertEqual(self.rebuild('--dry-run'), [
+            f'company {self.company.pk} | Hammer [HAM-1] @ Warehouse: 99 -> 7',
+            '1 companies checked, 1 balances would be corrected.',
+        ])
+        self.assertEqual(self.balance(self.item), 99)
+
+    def test_source_documents_or_journal(self):
+        self.assertEqual(self.rebuild('--source', 'journal')[0], f'company {self.company.pk} | Hammer [HAM-1] @ Warehouse: 99 -> 10')
+        self.assertEqual(self.balance(self.item), 10)
+        self.assertEqual(self.rebuild('--source', 'documents', '--company', str(self.company.pk))[0], f'company {self.company.pk} | Hammer [HAM-1] @ Warehouse: 10 -> 7')
+        self.assertEqual(self.balance(self.item), 7)
+        self.assertEqual(self.rebuild(), ['1 companies checked, 0 balances corrected.'])
+
+    def test_short_history_is_flagged(self):
+        StockMovement.objects.filter(source_type='receipt').update(quantity=-4)
+        self.assertEqual(
+            self.rebuild('--source', 'journal')[0],
+            f'company {self.company.pk} | Hammer [HAM-1] @ Warehouse: 99 -> 0 (history is short by 4)',
+        )
+        self.assertEqual(self.balance(self.item), 0)
+
+
+class BatchAdjustmentTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.items = [
+            self.receive(f'Item {n}', f'SKU-{n}', category=Category.objects.create(company=self.company, name=f'Category {n}'))
+            for n in range(4)
+        ]
+
+    def post(self, quantities, mode='atomic', date='2024-01-02'):
+        return self.client.post('/api/stock-adjustments/batch/', {'mode': mode, 'lines': [
+            {'item': item.pk, 'adjustment_type': 'sold', 'quantity': quantity, 'date': date, 'location': self.warehouse.pk}
+            for item, quantity in zip(self.items, quantities)
+        ]}, format='json')
+
+    def test_atomic_batch_saves_nothing_when_a_line_fails(self):
+        response = self.post([4, 11])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], [])
+        self.assertEqual([error['line'] for error in response.data['errors']], [1])
+        self.assertEqual([self.balance(item) for item in self.items[:2]], [10, 10])
+
+    def test_partial_batch_skips_failing_lines(self):
+        response = self.post([4, 11], mode='partial')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([line['item'] for line in response.data['created']], [self.items[0].pk])
+        self.assertEqual(response.data['errors'][0]['errors']['quantity'], ['Insufficient stock, only 10 available for this line.'])
+        self.assertEqual([self.balance(item) for item in self.items[:2]], [6, 10])
+
+    def test_query_count_does_not_grow_with_the_lines(self):
+        # Two lines and more book their balances set-based, one line takes the single-row path
+        for lines, date in ((2, '2024-01-02'), (4, '2024-01-03')):
+            with self.assertNumQueries(20):
+                response = self.post([1] * lines, date=date)
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'][3]['category_name'], 'Category 3')
+
+
+class TransferDocumentTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hammer = self.receive('Hammer', 'HAM-1')
+        self.saw = self.receive('Saw', 'SAW-1')
+
+    def test_document_with_a_short_line_moves_nothing(self):
+        # Lines on the same item draw on one balance in order
+        response = self.client.post('/api/transfer-documents/', {
+            'date': '2024-01-04', 'from_location': self.warehouse.pk, 'to_location': self.shop.pk,
+            'lines': [{'item': self.hammer.pk, 'quantity': 4}, {'item': self.saw.pk, 'quantity': 2}, {'item': self.hammer.pk, 'quantity': 8}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['lines'], [{}, {}, {'quantity': ['Insufficient stock, only 6 available for this line.']}])
+        self.assertEqual((TransferDocument.objects.count(), StockTransfer.objects.count()), (0, 0))
+        self.assertEqual([self.balance(self.hammer), self.balance(self.saw), self.balance(self.hammer, self.shop)], [10, 10, None])
+
+    def test_deleting_a_document_reverses_every_line(self):
+        document = self.transfer([(self.hammer, 4), (self.saw, 2), (self.hammer, 1)]).data
+        self.assertEqual([self.balance(self.hammer), self.balance(self.hammer, self.shop), self.balance(self.saw, self.shop)], [5, 5, 2])
+        self.assertEqual(self.client.delete(f"/api/transfer-documents/{document['id']}/").status_code, 204)
+        self.assertEqual([self.balance(self.hammer), self.balance(self.hammer, self.shop), self.balance(self.saw, self.shop)], [10, 0, 0])
+
+
+class ProductTests(StockTestCase):
+    def balances(self):
+        return sorted(TotalCurrentInventory.objects.values_list('sku', 'location__name', 'total_current_inventory'))
+
+    def test_new_sku_moves_adjustments_and_transfers_to_the_new_product(self):
+        item = self.receive('Hammer', 'HAM-1', quantity=20)
+        self.adjust(item, 3)
+        self.transfer([(item, 5)])
+        with self.assertNoLogs('syncstock.ledger', 'WARNING'):
+            item.sku = 'HAM-2'
+            item.save()
+        self.assertEqual(self.balances(), [('HAM-1', 'Shop', 0), ('HAM-1', 'Warehouse', 0), ('HAM-2', 'Shop', 5), ('HAM-2', 'Warehouse', 12)])
+        self.assertEqual(set(StockAdjustment.objects.values_list('product_id', flat=True)), {item.product_id})
+        self.assertEqual(set(StockTransfer.objects.values_list('product_id', flat=True)), {item.product_id})
+
+        # Reversals now land on the new product's balances
+        with self.assertNoLogs('syncstock.ledger', 'WARNING'):
+            StockAdjustment.objects.get().delete()
+            StockTransfer.objects.get().delete()
+        self.assertEqual(self.balances(), [('HAM-1', 'Shop', 0), ('HAM-1', 'Warehouse', 0), ('HAM-2', 'Shop', 0), ('HAM-2', 'Warehouse', 20)])
+        self.assertEqual(ledger.replay(self.company), [])
+
+
+class ProductMigrationTests(TransactionTestCase):
+    before = [('syncstock', '0011_product')]
+    after = [('syncstock', '0012_backfill_products')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_balances_of_one_sku_are_merged(self):
+        apps = self.migrate(self.before)
+        Company = apps.get_model('syncstock', 'Company')
+        Location = apps.get_model('syncstock', 'Location')
+        Category = apps.get_model('syncstock', 'Category')
+        TotalCurrentInventory = apps.get_model('syncstock', 'TotalCurrentInventory')
+        company = Company.objects.create(name='Acme', company_email='acme@example.com')
+        location = Location.objects.create(company=company, name='Warehouse', address='1 Dock Road')
+        category = Category.objects.create(company=company, name='Hardware')
+        # Balances used to be keyed on the names too, so a renamed item got a second row
+        for item_name, quantity in (('Hammer', 4), ('Claw hammer', 6)):
+            TotalCurrentInventory.objects.create(
+                company=company, item_name=item_name, product_code='', sku='HAM-1', location=location,
+                category=category, total_current_inventory=quantity,
+            )
+
+        apps = self.migrate(self.after)
+        Product = apps.get_model('syncstock', 'Product')
+        TotalCurrentInventory = apps.get_model('syncstock', 'TotalCurrentInventory')
+        product = Product.objects.get()
+        self.assertEqual((product.sku, product.item_name), ('HAM-1', 'Hammer'))
+        self.assertEqual(
+            list(TotalCurrentInventory.objects.values_list('product_id', 'item_name', 'total_current_inventory')),
+            [(product.pk, 'Hammer', 10)],
+        )
+
+
+class TrackedSaveTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.item = self.receive('Hammer', 'HAM-1')
+        self.adjust(self.item, 3)
+        self.adjustment = StockAdjustment.objects.get()
+
+    def test_edit_books_only_the_difference_without_reading_the_row_back(self):
+        self.adjustment.quantity = 5
+        with CaptureQueriesContext(connection) as queries:
+            self.adjustment.save()
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT "syncstock_stockadjustment"')])
+        self.assertEqual(self.balance(self.item), 5)
+        self.assertEqual(StockMovement.objects.filter(source_type='adjustment').order_by('id').last().quantity, -2)
+
+        self.adjustment.location = self.shop
+        with self.assertRaisesMessage(ValidationError, 'Insufficient stock'), transaction.atomic():
+            self.adjustment.save()
+        self.assertEqual(self.balance(self.item), 5)
+
+    def test_edit_outside_the_ledger_fields_books_nothing(self):
+        self.adjustment.reason = 'Counted again'
+        self.adjustment.save()
+        self.assertEqual(StockMovement.objects.count(), 2)
+        self.assertEqual(self.balance(self.item), 7)
+
+
+class CoalesceTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.item = self.receive('Hammer', 'HAM-1')
+
+    def add_adjustment(self, quantity):
+        return StockAdjustment.objects.create(
+            item=self.item, adjustment_type='sold', quantity=quantity, date=datetime.date(2024, 1, 2),
+            location=self.warehouse, category=self.hardware, company=self.company, user=self.user,
+        )
+
+    def balance_writes(self, queries):
+        return [query for query in queries if query['sql'].startswith('UPDATE "syncstock_totalcurrentinventory"')]
+
+    def test_block_books_each_balance_once_when_it_ends(self):
+        with CaptureQueriesContext(connection) as queries, ledger.coalesce():
+            adjustment = self.add_adjustment(3)
+            adjustment.quantity = 5
+            adjustment.save()
+            self.add_adjustment(2)
+            self.assertEqual(self.balance(self.item), 10)
+        self.assertEqual(len(self.balance_writes(queries)), 1)
+        self.assertEqual(self.balance(self.item), 3)
+        self.assertEqual(StockMovement.objects.filter(source_type='adjustment').count(), 2)
+
+    def test_insufficient_stock_is_raised_when_the_block_ends(self):
+        with self.assertRaises(ValidationError):
+            with ledger.coalesce():
+                self.add_adjustment(6)
+                self.add_adjustment(6)
+        self.assertEqual((self.balance(self.item), StockAdjustment.objects.count()), (10, 0))
+
+    def test_api_writes_are_coalesced(self):
+        response = self.client.post('/api/stock-adjustments/', {
+            'item': self.item.pk, 'adjustment_type': 'sold', 'quantity': 11, 'date': '2024-01-02',
+            'location': self.warehouse.pk, 'category': self.hardware.pk,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, ['Insufficient stock, cannot proceed with the adjustment.'])
+
+        self.adjust(self.item, 2)
+        self.transfer([(self.item, 3)])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.delete(f'/api/inventory-items/{self.item.pk}/').status_code, 204)
+        self.assertEqual(len(self.balance_writes(queries)), 1)
+        self.assertEqual(list(TotalCurrentInventory.objects.values_list('total_current_inventory', flat=True)), [0, 0])
+
+
+class CursorPaginationTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(HistoryPagination, 'page_size', 2))
+        item = self.receive('Hammer', 'HAM-1')
+        # Five adjustments on one day, so every page boundary falls on the id tie-break
+        self.ids = [
+            StockAdjustment.objects.create(
+                item=item, adjustment_type='sold', quantity=1, date=datetime.date(2024, 1, 2),
+                location=self.warehouse, category=self.hardware, company=self.company, user=self.user,
+            ).pk
+            for _ in range(5)
+        ]
+
+    def walk(self, params):
+        pages, response = [], self.client.get('/api/stock-adjustments/', {'paginate': 'cursor', **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            if not response.data['next']:
+                return pages, response
+            response = self.client.get(response.data['next'])
+
+    def test_pages_follow_the_id_tie_break_both_ways(self):
+        pages, last = self.walk({})
+        self.assertEqual(pages, [self.ids[4:2:-1], self.ids[2:0:-1], self.ids[:1]])
+        self.assertNotIn('count', last.data)
+        previous = self.client.get(last.data['previous']).data
+        self.assertEqual([row['id'] for row in previous['results']], self.ids[2:0:-1])
+        self.assertEqual([row['id'] for row in self.client.get(previous['previous']).data['results']], self.ids[4:2:-1])
+
+    def test_ascending_order_reverses_the_direction(self):
+        pages, _ = self.walk({'ordering': 'date'})
+        self.assertEqual(pages, [self.ids[:2], self.ids[2:4], self.ids[4:]])
+
+    def test_malformed_cursor_is_not_found(self):
+        bad_date = base64.urlsafe_b64encode(json.dumps({'p': ['yesterday', '1'], 'r': 0}).encode()).decode()
+        for cursor in ('garbage', base64.urlsafe_b64encode(b'{"p": ["2024-01-02"]}').decode(), bad_date):
+            self.assertEqual(self.client.get('/api/stock-adjustments/', {'cursor': cursor}).status_code, 404)
+
+
+class QueryCountTests(StockTestCase):
+    """
+    List and detail endpoints run a fixed number of queries, however many rows
+    they return. A count growing with the page size means a serializer is
+    loading relations lazily that the view should select_related.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.rows = 0
+        self.add_rows(1)
+
+    def add_rows(self, count):
+        # Each row gets its own category and item, with one adjustment and one transfer document line
+        with self.captureOnCommitCallbacks(execute=True):
+            self._add_rows(count)
+
+    def _add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            category = Category.objects.create(company=self.company, name=f'Category {self.rows}')
+            item = self.receive(f'Item {self.rows}', f'SKU-{self.rows}', category=category)
+            StockAdjustment.objects.create(
+                item=item, adjustment_type='damage', quantity=1, date=datetime.date(2024, 1, 2),
+                location=self.warehouse, category=category, company=self.company, user=self.user,
+            )
+            document = TransferDocument.objects.create(
+                company=self.company, user=self.user, from_location=self.warehouse, to_location=self.shop,
+                date=datetime.date(2024, 1, 3),
+            )
+            StockTransfer.objects.create(
+                item=item, quantity=1, date=datetime.date(2024, 1, 3), from_location=self.warehouse,
+                to_location=self.shop, company=self.company, user=self.user, category=category, price=1,
+                document=document,
+            )
+
+    def assertQueryCount(self, url, expected):
+        # Once with a single row, then with a full page of rows
+        for rows in (1, 10):
+            self.add_rows(rows - self.rows)
+            with self.assertNumQueries(expected):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_inventory_item_list(self):
+        self.assertQueryCount('/api/inventory-items/', 2)
+
+    def test_inventory_item_detail(self):
+        self.assertQueryCount(f'/api/inventory-items/{InventoryItem.objects.first().pk}/', 1)
+
+    def test_stock_adjustment_list(self):
+        self.assertQueryCount('/api/stock-adjustments/', 2)
+
+    def test_stock_adjustment_detail(self):
+        self.assertQueryCount(f'/api/stock-adjustments/{StockAdjustment.objects.first().pk}/', 1)
+
+    def test_stock_transfer_list(self):
+        self.assertQueryCount('/api/stock-transfers/', 2)
+
+    def test_stock_transfer_detail(self):
+        self.assertQueryCount(f'/api/stock-transfers/{StockTransfer.objects.first().pk}/', 1)
+
+    def test_transfer_document_list(self):
+        self.assertQueryCount('/api/transfer-documents/', 4)
+
+    def test_transfer_document_detail(self):
+        self.assertQueryCount(f'/api/transfer-documents/{TransferDocument.objects.first().pk}/', 3)
+
+    def test_sparse_fieldset(self):
+        self.assertQueryCount('/api/stock-transfers/?fields=item_name,to_location_name', 2)
+        response = self.client.get('/api/stock-transfers/?fields=item_name,to_location_name')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'item_name', 'to_location_name'})
+        response = self.client.get('/api/stock-transfers/?fields=item_name,margin')
+        self.assertEqual((response.status_code, response.data['fields']), (400, ['Unknown field(s): margin.']))
+
+    def test_total_current_inventory_list(self):
+        self.assertQueryCount('/api/total-current-inventory/', 2)
+
+    def test_filter_choices(self):
+        self.assertQueryCount('/api/filters/', 3)
+
+    def test_location_list(self):
+        self.assertQueryCount('/api/locations/', 2)
+
+    def test_category_list(self):
+        self.assertQueryCount('/api/categories/', 2)
+
+
+class FilterChoicesCacheTests(StockTestCase):
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.client.get('/api/filters/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/filters/')
+        self.assertEqual(second.data, first.data)
+
+    def test_unchanged_choices_return_not_modified(self):
+        etag = self.client.get('/api/filters/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/filters/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_new_location_invalidates_cache(self):
+        etag = self.client.get('/api/filters/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Location.objects.create(company=self.company, name='Store', address='3 Market Square')
+        response = self.client.get('/api/filters/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([location['name'] for location in response.data['locations']], ['Shop', 'Store', 'Warehouse'])
+
+
+class SearchTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.widget = self.receive('Blue Widget', 'WID-001')
+        self.receive('Red Gadget', 'GAD-002')
+
+    def search(self, url, term):
+        response = self.client.get(url, {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [row['item_name'] for row in response.data['results']]
+
+    def test_substring_and_prefix(self):
+        self.assertEqual(self.search('/api/inventory-items/', 'widg'), ['Blue Widget'])
+        self.assertEqual(self.search('/api/inventory-items/', 'gad-0'), ['Red Gadget'])
+
+    def test_typo_falls_back_to_closest_documents(self):
+        self.assertEqual(self.search('/api/inventory-items/', 'widgte')[:1], ['Blue Widget'])
+        self.receive('Green Widget', 'WID-002')
+        with override_settings(SYNCSTOCK_SEARCH_FUZZY_LIMIT=1):
+            self.assertEqual(len(self.search('/api/inventory-items/', 'widgte')), 1)
+
+    def test_terms_do_not_match_across_fields(self):
+        # 'Blue Widget' followed by 'WID-001' used to be one text
+        self.assertEqual(self.search('/api/inventory-items/', '"get wid-0"'), [])
+        self.assertEqual(self.search('/api/inventory-items/', '"blue widget"'), ['Blue Widget'])
+
+    def test_renamed_item_is_found_through_its_adjustments(self):
+        StockAdjustment.objects.create(
+            item=self.widget, adjustment_type='damage', quantity=1, date=datetime.date(2024, 1, 2),
+            location=self.warehouse, category=self.hardware, company=self.company, user=self.user,
+        )
+        self.widget.item_name = 'Green Sprocket'
+        self.widget.save()
+        self.assertEqual(self.search('/api/stock-adjustments/', 'sprock'), ['Green Sprocket'])
+        self.assertEqual(self.search('/api/stock-adjustments/', 'widget'), [])
+
+
+class ExportTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.receive('Blue Widget', 'WID-001')
+        self.receive('Red Gadget', 'GAD-002')
+
+    def export(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_applies_list_filters(self):
+        lines = self.export('/api/inventory-items/export.csv', {'search': 'widg'}).splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'item_name', 'sku'])
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['Blue Widget'])
+
+    def test_csv_export_escapes_formulas(self):
+        for n, name in enumerate(['=HYPERLINK("http://example.com")', '+1', '-1', '@SUM(A1)']):
+            self.receive(name, f'FRM-{n}')
+        rows = list(csv.reader(io.StringIO(self.export('/api/inventory-items/export.csv', {'ordering': 'inventory_date'}))))
+        self.assertEqual(
+            sorted(row[1] for row in rows[1:]),
+            ["'+1", "'-1", "'=HYPERLINK(\"http://example.com\")", "'@SUM(A1)", 'Blue Widget', 'Red Gadget'],
+        )
+
+    def test_ndjson_export_writes_one_object_per_row(self):
+        rows = [json.loads(line) for line in self.export('/api/inventory-items/export.ndjson', {'ordering': 'inventory_date'}).splitlines()]
+        self.assertEqual(sorted(row['sku'] for row in rows), ['GAD-002', 'WID-001'])
+        self.assertEqual(rows[0]['location'], 'Warehouse')
+
+    def test_workbook_has_a_sheet_per_location_and_summary_formulas(self):
+        self.receive('=Formula', 'FRM-003', quantity=4, date=datetime.date(2024, 1, 2), location=self.shop)
+        response = self.client.get('/api/total-current-inventory/export.xlsx')
+        self.assertEqual(response.status_code, 200)
+        workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(workbook.sheetnames, ['Summary', 'Shop', 'Warehouse', 'Movements'])
+        self.assertEqual(workbook['Warehouse']['E4'].value, '=SUM(E2:E3)')
+        self.assertEqual(workbook['Summary']['C3'].value, "='Warehouse'!E4")
+        self.assertEqual(workbook['Shop']['B2'].data_type, 's')
+        self.assertEqual(workbook['Movements'].max_row, 4)
+
+
+class StockReportTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.item = self.receive('Blue Widget', 'WID-001', price=2)
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.enterContext(override_settings(SYNCSTOCK_REPORT_ROOT=root.name))
+
+    def get_report(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get('/api/reports/stock.pdf', {'location': self.warehouse.pk})
+
+    def test_report_is_rendered_once_and_served_until_data_changes(self):
+        response = self.get_report()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.get_report().data['id'], response.data['id'])
+        self.assertEqual(tasks.work('test', once=True), 1)
+        self.assertEqual(self.client.get(response['Location']).data['status'], 'done')
+        response = self.get_report()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.price = 3
+            self.item.save()
+        self.assertEqual(self.get_report().status_code, 202)
+        tasks.work('test', once=True)
+        self.assertEqual(self.get_report().status_code, 200)
+        self.assertEqual(len(os.listdir(os.path.join(settings.SYNCSTOCK_REPORT_ROOT, str(self.company.pk)))), 1)
+
+    def test_worker_renders_the_version_the_request_resolved(self):
+        # The worker's process has its own cache, so it may read another data version
+        response = self.get_report()
+        self.assertEqual(response.status_code, 202)
+        with mock.patch.object(caching, 'version', return_value=1):
+            self.assertEqual(tasks.work('test', once=True), 1)
+        self.assertEqual(self.get_report().status_code, 200)
+
+    def test_invalid_filters_are_rejected_before_queueing(self):
+        for url in ('/api/reports/stock.pdf', '/api/total-current-inventory/export.xlsx'):
+            response = self.client.get(url, {'start_date': 'soon'})
+            self.assertEqual((response.status_code, list(response.data)), (400, ['start_date']))
+        self.assertFalse(Job.objects.exists())
+
+
+attempts_seen = []
+
+@tasks.task('tests.flaky')
+def flaky(job):
+    attempts_seen.append(job.attempts)
+    if job.attempts < job.payload['succeed_on']:
+        raise ValueError('not yet')
+    return {'attempts': job.attempts}
+
+
+@tasks.task('tests.slow')
+def slow(job):
+    # Reads first, so the transaction it runs in holds the database's read lock while it sleeps
+    Job.objects.get(pk=job.pk)
+    time.sleep(job.payload['seconds'])
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        attempts_seen.clear()
+
+    def run_due(self):
+        # Make every queued job due now, as if its backoff had passed
+        Job.objects.filter(status='queued').update(run_at=timezone.now())
+        return tasks.work('test', once=True)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = tasks.enqueue('tests.flaky', {'succeed_on': 2})
+        with self.assertLogs('syncstock.tasks', 'ERROR'):
+            self.assertEqual(tasks.work('test', once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('not yet', job.error)
+
+        self.run_due()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result, job.error), ('done', {'attempts': 2}, ''))
+
+    def test_job_fails_after_max_attempts(self):
+        job = tasks.enqueue('tests.flaky', {'succeed_on': 5}, max_attempts=2)
+        with self.assertLogs('syncstock.tasks', 'ERROR'):
+            self.run_due()
+            self.run_due()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(attempts_seen, [1, 2])
+
+    def test_higher_priority_runs_first_and_expired_leases_are_reclaimed(self):
+        low = tasks.enqueue('tests.flaky', {'succeed_on': 1})
+        high = tasks.enqueue('tests.flaky', {'succeed_on': 1}, priority=5)
+        self.assertEqual(tasks.claim('crashed').pk, high.pk)
+        self.assertEqual(tasks.claim('other').pk, low.pk)
+        self.assertIsNone(tasks.claim('other'))
+
+        Job.objects.filter(pk=high.pk).update(leased_until=timezone.now() - datetime.timedelta(seconds=1))
+        reclaimed = tasks.claim('other')
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (high.pk, 2))
+        self.assertTrue(tasks.run(reclaimed))
+
+    def test_lease_is_renewed_only_by_its_worker(self):
+        job = tasks.enqueue('tests.flaky', {'succeed_on': 1})
+        lease = datetime.timedelta(seconds=5)
+        claimed = tasks.claim('first', lease)
+        self.assertTrue(tasks.renew(claimed, datetime.timedelta(hours=1)))
+        job.refresh_from_db()
+        self.assertGreater(job.leased_until, timezone.now() + datetime.timedelta(minutes=59))
+
+        Job.objects.filter(pk=job.pk).update(leased_until=timezone.now() - datetime.timedelta(seconds=1))
+        tasks.claim('second', lease)
+        self.assertFalse(tasks.renew(claimed))
+        job.refresh_from_db()
+        self.assertEqual(job.worker, 'second')
+
+
+
+class LeaseRenewalTests(TransactionTestCase):
+    # Committed rows and a second connection, as in a worker: the heartbeat writes while the handler's transaction reads
+
+    def test_lease_is_renewed_while_the_handler_transaction_is_open(self):
+        tasks.enqueue('tests.slow', {'seconds': 0.5})
+        renewals = []
+        renew = tasks.renew
+
+        def recorded(job, lease):
+            renewals.append(renew(job, lease))
+            return renewals[-1]
+
+        with mock.patch.object(tasks, 'renew', side_effect=recorded), self.assertNoLogs('syncstock.tasks', 'WARNING'):
+            self.assertEqual(tasks.work('test', once=True, lease=datetime.timedelta(seconds=0.3)), 1)
+        self.assertGreaterEqual(len(renewals), 2)
+        self.assertTrue(all(renewals))
+        self.assertEqual(Job.objects.get().status, 'done')
+
+
+class RollupTests(StockTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tools = Category.objects.create(company=cls.company, name='Tools')
+
+    def setUp(self):
+        super().setUp()
+        self.items = [
+            self.receive(f'Item {n}', f'SKU-{n}', quantity=20, price='2.50', date=datetime.date(2024, 1, n))
+            for n in (1, 2)
+        ]
+
+    def assertRollupsMatchDocuments(self):
+        for model, spec in rollups.SPECS.items():
+            documents = {
+                (self.company.pk, getattr(document, spec.date_field)) + tuple(getattr(document, f) for f in spec.dimensions)
+                for document in model.objects.all()
+            }
+            expected = {key: list(entry) for (_, key), entry in rollups.deltas(model.objects.all()).items()}
+            actual = {
+                rollups._key(spec, row): [row.quantity, getattr(row, 'value', 0), row.lines]
+                for row in spec.rollup.objects.filter(lines__gt=0)
+            }
+            self.assertEqual(set(actual), documents, spec.rollup.__name__)
+            self.assertEqual(actual, expected, spec.rollup.__name__)
+
+    def test_rollups_follow_every_write_path(self):
+        first, second = self.items
+        adjustment = StockAdjustment.objects.create(
+            item=first, adjustment_type='damage', quantity=2, date=datetime.date(2024, 1, 3),
+            location=self.warehouse, category=self.hardware, company=self.company, user=self.user,
+        )
+        self.adjust(second, 3, date='2024-01-03')
+        self.transfer([(first, 4), (second, 5)])
+        self.assertRollupsMatchDocuments()
+
+        first.category = self.tools
+        first.price = '3.00'
+        first.save()
+        adjustment.adjustment_type = 'expired'
+        adjustment.date = datetime.date(2024, 1, 5)
+        adjustment.save()
+        self.assertRollupsMatchDocuments()
+
+        second.delete()
+        self.assertRollupsMatchDocuments()
+
+    def test_chart_reads_rollups_unless_filtered_by_item(self):
+        StockAdjustment.objects.create(
+            item=self.items[0], adjustment_type='damage', quantity=2, date=datetime.date(2024, 1, 3),
+            location=self.warehouse, category=self.hardware, company=self.company, user=self.user,
+        )
+        # The location filter's lookup, then one query on the rollups
+        with self.assertNumQueries(2):
+            yearly = self.client.get('/api/aggregated-inventory-items/', {'group_by': 'yearly', 'location': self.warehouse.pk})
+        self.assertEqual(yearly.json(), [{'trunc_date': '2024-01-01', 'total_quantity': 40}])
+        by_item = self.client.get('/api/aggregated-stock-adjusments/', {'item': self.items[0].pk})
+        self.assertEqual(by_item.json(), [{'trunc_date': '2024-01-03', 'total_quantity': 2}])
+
+    def test_metrics_split_by_dimension_match_between_rollups_and_documents(self):
+        self.transfer([(self.items[0], 4), (self.items[1], 5)])
+        params = {'group_by': 'monthly', 'metrics': 'quantity,value,count', 'split_by': 'to_location'}
+        from_rollups = self.client.get('/api/aggregated-stock-transfers/', params).json()
+        self.assertEqual(from_rollups, [{
+            'trunc_date': '2024-01-01', 'to_location': self.shop.pk, 'to_location_name': 'Shop',
+            'total_quantity': 9, 'total_value': '22.50', 'count': 2,
+        }])
+        # Distinct SKUs do not add up across days, so they are counted on the documents
+        with_skus = self.client.get('/api/aggregated-stock-transfers/', {**params, 'metrics': 'quantity,value,count,skus'}).json()
+        self.assertEqual(with_skus, [{**from_rollups[0], 'distinct_skus': 2}])
+
+    def test_unknown_metric_is_rejected(self):
+        response = self.client.get('/api/aggregated-inventory-items/', {'metrics': 'quantity,margin'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('metrics', response.data)
+
+    def test_series_are_cached_until_the_data_changes(self):
+        url, params = '/api/aggregated-inventory-items/', {'group_by': 'monthly', 'location': self.warehouse.pk}
+        self.assertEqual(self.client.get(url, params)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(url, params)
+        self.assertEqual((response['X-Cache'], response.json()[0]['total_quantity']), ('HIT', 40))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.items[0].quantity = 25
+            self.items[0].save()
+        response = self.client.get(url, params)
+        self.assertEqual((response['X-Cache'], response.json()[0]['total_quantity']), ('MISS', 45))
+        self.assertEqual(caching.stats(['analytics'])['analytics'], {'hits': 1, 'misses': 2, 'hit_rate': 0.333})
+
+
+class DashboardTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.items = [
+            self.receive(f'Item {n}', f'SKU-{n}', quantity=20, price='2.50', date=datetime.date(2024, 1, n))
+            for n in (1, 2)
+        ]
+        self.adjust(self.items[0], 2, adjustment_type='damage', date='2024-01-03')
+        self.adjust(self.items[1], 5, date='2024-01-04')
+        self.transfer([(self.items[0], 4)])
+
+    def test_dashboard_figures_in_one_request(self):
+        params = {'start_date': '2024-01-01', 'end_date': '2024-01-31'}
+        with self.assertNumQueries(5):  # savepoint, three queries, release
+            response = self.client.get('/api/dashboard/', params)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        figures = response.json()
+        self.assertEqual(
+            (figures['total_units'], figures['total_value'], figures['low_stock']),
+            (33, '82.50', {'threshold': 10, 'count': 1}),
+        )
+        self.assertEqual(figures['adjustments_by_type'], [
+            {'adjustment_type': 'damage', 'quantity': 2, 'count': 1},
+            {'adjustment_type': 'sold', 'quantity': 5, 'count': 1},
+        ])
+        self.assertEqual([(row['sku'], row['quantity']) for row in figures['top_movers']], [('SKU-2', 5), ('SKU-1', 2)])
+        self.assertEqual(figures['locations'], [
+            {'location': self.shop.pk, 'location_name': 'Shop', 'units': 4, 'value': '10.00', 'low_stock': 1},
+            {'location': self.warehouse.pk, 'location_name': 'Warehouse', 'units': 29, 'value': '72.50', 'low_stock': 0},
+        ])
+        self.assertEqual(self.client.get('/api/dashboard/', params)['X-Cache'], 'HIT')
+
+        response = self.client.get('/api/dashboard/', {'start_date': '2024-02-01', 'end_date': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class InventoryAnalyticsTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.items = {
+            sku: self.receive(f'Item {sku}', sku, quantity=20, price=price)
+            for sku, price in (('A', '10.00'), ('B', '1.00'), ('C', '5.00'))
+        }
+
+    def sell(self, sku, quantity, date):
+        self.adjust(self.items[sku], quantity, date=date)
+
+    def test_turnover_cover_and_classes(self):
+        self.sell('A', 5, '2024-01-02')
+        self.sell('A', 5, '2024-01-09')
+        self.sell('B', 10, '2024-01-03')
+        params = {'start_date': '2024-01-01', 'end_date': '2024-01-14'}
+        response = self.client.get('/api/analytics/inventory/', params)
+        self.assertEqual((response.status_code, response['X-Cache']), (200, 'MISS'))
+        rows = {row['sku']: row for row in response.json()['products']}
+        self.assertEqual(list(rows), ['A', 'B', 'C'])
+        self.assertEqual(
+            {key: rows['A'][key] for key in ('on_hand', 'sold', 'sales_value', 'turnover', 'days_of_cover', 'sell_through', 'abc', 'xyz')},
+            {'on_hand': 10, 'sold': 10, 'sales_value': 100.0, 'turnover': 1.0, 'days_of_cover': 14.0, 'sell_through': 0.5, 'abc': 'A', 'xyz': 'X'},
+        )
+        self.assertEqual((rows['B']['abc'], rows['B']['xyz']), ('B', 'Y'))
+        self.assertEqual(
+            (rows['C']['turnover'], rows['C']['days_of_cover'], rows['C']['sell_through'], rows['C']['abc'], rows['C']['xyz']),
+            (0.0, None, 0.0, 'C', 'Z'),
+        )
+        self.assertEqual(self.client.get('/api/analytics/inventory/', params)['X-Cache'], 'HIT')
+
+
+class ReorderPointTests(StockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.item = self.restock(20)
+
+    def sell(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.adjust(self.item, quantity)
+
+    def restock(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.receive('Hammer', 'HAM-1', quantity=quantity, price='2.50')
+
+    def test_alerts_are_recorded_only_on_crossings(self):
+        response = self.client.post('/api/reorder-points/', {'item': self.item.pk, 'location': self.warehouse.pk, 'threshold': 5}, format='json')
+        self.assertEqual((response.status_code, response.data['low']), (201, False))
+        response = self.client.post('/api/reorder-points/', {'item': self.item.pk, 'location': self.warehouse.pk, 'threshold': 8}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.sell(14)  # 6 left: above the threshold
+        self.sell(2)   # 4 left: crosses it
+        self.sell(1)   # 3 left: still low, nothing new
+        self.restock(10)
+        self.assertEqual(
+            list(StockAlert.objects.order_by('id').values_list('kind', 'quantity')),
+            [('low', 4), ('restored', 13)],
+        )
+        self.assertEqual(self.client.get('/api/reorder-points/', {'low': 'true'}).data['count'], 0)
+
+        # Raising the threshold above what is on hand is a crossing too
+        point = ReorderPoint.objects.get()
+        response = self.client.patch(f'/api/reorder-points/{point.pk}/', {'threshold': 15}, format='json')
+        self.assertEqual((response.status_code, response.data['low']), (200, True))
+        low = self.client.get('/api/reorder-points/', {'low': 'true'}).data
+        self.assertEqual([(row['sku'], row['threshold']) for row in low['results']], [('HAM-1', 15)])
+
+    def test_feed_follows_new_crossings_from_a_cursor(self):
+        self.client.post('/api/reorder-points/', {'item': self.item.pk, 'location': self.warehouse.pk, 'threshold': 5}, format='json')
+        self.sell(16)
+        feed = self.client.get('/api/stock-alerts/').data
+        self.assertEqual([(row['kind'], row['quantity']) for row in feed['results']], [('low', 4)])
+
+        # Nothing new yet: the cursor stays where it was
+        caught_up = self.client.get(feed['next']).data
+        self.assertEqual((caught_up['results'], caught_up['next']), ([], feed['next']))
+
+        self.restock(6)
+        newer = self.client.get(caught_up['next']).data
+        self.assertEqual([(row['kind'], row['quantity']) for row in newer['results']], [('restored', 10)])
+
+    def test_feed_shows_alerts_committed_late_after_the_cursor(self):
+        self.client.post('/api/reorder-points/', {'item': self.item.pk, 'location': self.warehouse.pk, 'threshold': 5}, format='json')
+        self.sell(16)
+        feed = self.client.get('/api/stock-alerts/').data
+
+        # The restock's transaction has not committed yet when the feed is read
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.receive('Hammer', 'HAM-1', quantity=6, price='2.50')
+        pending = self.client.get(feed['next']).data
+        self.assertEqual((pending['results'], pending['next']), ([], feed['next']))
+
+        for callback in callbacks:
+            callback()
+        newer = self.client.get(pending['next']).data
+        self.assertEqual([(row['kind'], row['quantity']) for row in newer['results']], [('restored', 10)])
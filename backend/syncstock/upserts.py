@@ -0,0 +1,44 @@
+"""
+Upserts of counter rows, shared by the balances and the rollups.
+
+Both keep one row per key and add onto it from concurrent writers: an update
+with F() expressions when the row exists, an insert when it does not. Two
+writers may both find a row missing and both insert it; the unique constraint
+turns the second insert into an IntegrityError, and the loser adds onto the
+winner's row instead.
+"""
+from django.db import IntegrityError, transaction
+
+BATCH_SIZE = 500
+
+
+def bulk_upsert(model, changed, fields, created, fallback, batch_size=BATCH_SIZE):
+    """
+    Save `fields` of the `changed` rows and insert the `created` ones, in batches.
+
+    `created` maps each key to its unsaved row. When another writer inserted
+    some of them since they were found missing, the whole insert is rolled back
+    and fallback(key) books each of them one at a time.
+    """
+    model.objects.bulk_update(changed, fields, batch_size=batch_size)
+    if not created:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(list(created.values()), batch_size=batch_size)
+    except IntegrityError:
+        # Another writer created some of the rows in the meantime; book those one by one
+        for key in created:
+            fallback(key)
+
+
+def add_or_create(rows, increments, new_row):
+    """Add `increments` onto the row `rows` selects, or insert new_row() when there is none yet."""
+    if rows.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            new_row().save(force_insert=True)
+    except IntegrityError:
+        # Another writer created the row in the meantime; add onto theirs
+        rows.update(**increments)
@@ -1,4 +1,4 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from . import views
 from .views import *
 from rest_framework.routers import DefaultRouter
@@ -9,6 +9,7 @@ router = DefaultRouter()
 router.register(r'locations', LocationViewSet)
 router.register(r'categories', CategoryViewSet)
 router.register(r'inventory-items', InventoryItemViewSet)
+router.register(r'reorder-points', ReorderPointViewSet)
 
 
 urlpatterns = [
@@ -24,15 +25,26 @@ urlpatterns = [
 
     # Stock adjustment
     path('api/stock-adjustments/', StockAdjustmentListCreateView.as_view(), name='stock-adjustment-list'),
+    path('api/stock-adjustments/batch/', StockAdjustmentBatchView.as_view(), name='stock-adjustment-batch'),
     path('api/stock-adjustments/<int:pk>/', StockAdjustmentDetailView.as_view(), name='stock-adjustment-detail'),
     
     # Stock transfer
     path('api/stock-transfers/', StockTransferCreateView.as_view(), name='stock-transfer-list'),
     path('api/stock-transfers/<int:pk>/', StockTransferDetailView.as_view(), name='stock-transfer-detail'),
+    path('api/transfer-documents/', TransferDocumentListCreateView.as_view(), name='transfer-document-list'),
+    path('api/transfer-documents/<int:pk>/', TransferDocumentDetailView.as_view(), name='transfer-document-detail'),
 
 
     path('api/total-current-inventory/', TotalCurrentInventoryView.as_view(), name='total-current-inventory'),
 
+    # Streaming exports of the list endpoints, ahead of the router's detail routes
+    re_path(r'^api/inventory-items/export\.(?P<fmt>csv|ndjson)$', InventoryItemExportView.as_view(), name='inventory-item-export'),
+    re_path(r'^api/stock-adjustments/export\.(?P<fmt>csv|ndjson)$', StockAdjustmentExportView.as_view(), name='stock-adjustment-export'),
+    re_path(r'^api/stock-transfers/export\.(?P<fmt>csv|ndjson)$', StockTransferExportView.as_view(), name='stock-transfer-export'),
+    path('api/total-current-inventory/export.xlsx', StockLevelsWorkbookView.as_view(), name='stock-levels-workbook'),
+    path('api/reports/stock.pdf', StockReportView.as_view(), name='stock-report'),
+    path('api/jobs/<int:pk>/', JobDetailView.as_view(), name='job-detail'),
+
     # Include the router's URLs for Location and Category management
     path('', include(router.urls)),
     path('api/', include(router.urls)),
@@ -41,7 +53,11 @@ urlpatterns = [
 
     path('api/aggregated-inventory-items/', AggregatedInventoryItemView.as_view(), name='aggregate-inventory-items'),
     path('api/aggregated-stock-adjusments/', AggregatedStockAdjustmentView.as_view(), name='aggregate-stock-adjustments'),
-    path('api/aggregated-stock-transfers/', AggregatedStockTransferView.as_view, name='aggregated-stock-transfers'),
+    path('api/aggregated-stock-transfers/', AggregatedStockTransferView.as_view(), name='aggregated-stock-transfers'),
+    path('api/dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('api/stock-alerts/', StockAlertFeedView.as_view(), name='stock-alerts'),
+    path('api/analytics/inventory/', InventoryAnalyticsView.as_view(), name='inventory-analytics'),
+    path('api/cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
 
 ]
 
@@ -1,17 +1,18 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
-from django.http import HttpResponseRedirect, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.http import HttpResponseRedirect, HttpResponse, HttpResponseForbidden, JsonResponse, FileResponse
 from django.urls import reverse
 
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.decorators import login_required, permission_required
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.db.models import Sum
 from django.db.models import F
+from django.db.models import Exists, OuterRef
 from django.core.cache import cache
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.storage import default_storage
 from django.contrib.auth import update_session_auth_hash
 
@@ -26,33 +27,38 @@ from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import ValidationError
 from rest_framework import filters
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.generics import UpdateAPIView 
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser, FormParser
 
 
 from .serializers import UserRegistrationSerializer, UserLoginSerializer, CompanyRegistrationSerializer, UserLogoutSerializer, UserUpdateSerializer, ChangePasswordSerializer, ProfilePictureSerializer
 from .serializers import InventoryItemSerializer
-from .serializers import StockAdjustmentSerializer, StockTransferSerializer
+from .serializers import StockAdjustmentSerializer, StockTransferSerializer, StockAdjustmentBatchSerializer, TransferDocumentSerializer
 from .serializers import LocationSerializer, CategorySerializer
 
-from .serializers import TotalCurrentInventorySerializer
+from .serializers import TotalCurrentInventorySerializer, JobSerializer, ReorderPointSerializer, StockAlertSerializer, DashboardParamsSerializer, PeriodParamsSerializer
 
 from .models import InventoryItem, User, Company, Location, Category
-from .models import StockAdjustment, StockTransfer
-from .models import TotalCurrentInventory
+from .models import StockAdjustment, StockTransfer, TransferDocument
+from .models import TotalCurrentInventory, StockMovement, Job, ReorderPoint, StockAlert
 
-from .filters import InventoryItemFilterSet, StockAdjustmentFilterSet, StockTransferFilterSet, TotalCurrentInventoryFilterSet
+from .filters import InventoryItemFilterSet, StockAdjustmentFilterSet, StockTransferFilterSet, TotalCurrentInventoryFilterSet, StockMovementFilterSet
 from .forms import StockLevelsFilterForm
+from .importers import InventoryImport, ImportFileError
+from .batches import StockAdjustmentBatch
+from . import ledger, caching, exports, reports, aggregation, dashboard, analytics, alerts
+from .pagination import HistoryPagination, FeedPagination
+from .search import IndexedSearchFilter
+from .fieldsets import SparseFieldsetMixin
 
-import pandas as pd
 import plotly.express as px
 import plotly.io as pio
 import openpyxl
 import uuid
 from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 from datetime import timedelta
 import logging
 
@@ -221,66 +227,87 @@ class ChangePasswordView(UpdateAPIView):
 
 # FIlter Choice
 class FilterChoicesView(generics.GenericAPIView):
+    # Lightweight id/name lookups for the filter and form dropdowns, cached per company
+    # until a category, location or item changes, and revalidated by ETag
     def get(self, request, *args, **kwargs):
         company = request.user.company
+        params = {
+            'start_date': request.query_params.get('start_date', ''),
+            'end_date': request.query_params.get('end_date', ''),
+        }
+
+        etag = caching.etag('filters', company.pk, params)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(caching.get_or_set('filters', company.pk, params, lambda: self.choices(company, params)))
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
-        # Get date parameters from the request
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-
+    def choices(self, company, params):
         # Parse date strings into date objects
-        start_date = parse_date(start_date) if start_date else None
-        end_date = parse_date(end_date) if end_date else None
+        start_date = parse_date(params['start_date']) if params['start_date'] else None
+        end_date = parse_date(params['end_date']) if params['end_date'] else None
 
-        # Get categories and locations for the company
-        categories = Category.objects.filter(company=company)
-        locations = Location.objects.filter(company=company)
-        
-        # Filter InventoryItems by date range if provided
+        # One item per product: its first receipt within the date range, if any
         items = InventoryItem.objects.filter(company=company)
-        if start_date and end_date:
-            items = items.filter(inventory_date__range=[start_date, end_date])
-        elif start_date:
+        if start_date:
             items = items.filter(inventory_date__gte=start_date)
-        elif end_date:
+        if end_date:
             items = items.filter(inventory_date__lte=end_date)
+        earlier_receipts = items.filter(product_id=OuterRef('product_id'), pk__lt=OuterRef('pk'))
+        items = items.exclude(Exists(earlier_receipts)).order_by('item_name')
+
+        locations = list(Location.objects.filter(company=company).order_by('name').values('id', 'name'))
+        return {
+            'categories': list(Category.objects.filter(company=company).order_by('name').values('id', 'name')),
+            'locations': locations,
+            'items': list(items.values('id', 'item_name', 'sku', 'product_code', 'category')),
+            'from_locations': locations,  # Same list for FROM location
+            'to_locations': locations,    # Same list for TO location
+        }
+
+# Writes that move stock: the balances a request touches are booked once, when its
+# work is done, and insufficient stock is answered with a 400
+class LedgerWritesMixin:
+    def create(self, request, *args, **kwargs):
+        return self.coalesced(super().create, request, *args, **kwargs)
 
-        # Serialize the data
-        category_serializer = CategorySerializer(categories, many=True)
-        location_serializer = LocationSerializer(locations, many=True)
-        item_serializer = InventoryItemSerializer(items, many=True)
+    def update(self, request, *args, **kwargs):
+        return self.coalesced(super().update, request, *args, **kwargs)
 
-        # Prepare the filter choices for FROM and TO locations
-        from_location = location_serializer.data
-        to_location = location_serializer.data
+    def destroy(self, request, *args, **kwargs):
+        return self.coalesced(super().destroy, request, *args, **kwargs)
 
-        # Return as JSON
-        return Response({
-            'categories': category_serializer.data,
-            'locations': location_serializer.data,  # This will include all locations
-            'items': item_serializer.data,
-            'from_locations': from_location,  # Same list for FROM location
-            'to_locations': to_location,      # Same list for TO location
-        })
+    def coalesced(self, write, *args, **kwargs):
+        try:
+            with ledger.coalesce():
+                return write(*args, **kwargs)
+        except DjangoValidationError as exc:
+            raise ValidationError(exc.messages)
 
 # Inventory
-class InventoryItemViewSet(viewsets.ModelViewSet):
+class InventoryItemViewSet(LedgerWritesMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = InventoryItem.objects.all()
     serializer_class = InventoryItemSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, filters.OrderingFilter]
     filterset_class = InventoryItemFilterSet
     search_fields = ['item_name', 'supplier_name', 'sku', 'product_code']
     ordering_fields = ['inventory_date']
     ordering = ['-inventory_date']
+    pagination_class = HistoryPagination
+    cursor_ordering = ('inventory_date', 'id')
     
     def get_queryset(self):
         company = self.request.user.company
-        queryset = InventoryItem.objects.filter(company=company).order_by('inventory_date')
-        for backend in self.filter_backends:
-            if hasattr(backend, 'filter_queryset'):
-                queryset = backend().filter_queryset(self.request, queryset, self)
-        return queryset
+        # Filtering, search and ordering are applied once by filter_queryset
+        return (
+            InventoryItem.objects.filter(company=company)
+            .select_related('category', 'location')
+            .order_by('inventory_date')
+        )
     
     def perform_create(self, serializer):
         serializer.save(company=self.request.user.company, user=self.request.user)
@@ -288,11 +315,22 @@ class InventoryItemViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         serializer.save()
 
-    def perform_destroy(self, instance):
-        instance.delete()
+    # Bulk import of a CSV/XLSX file; invalid rows are skipped and reported by row number
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FormParser])
+    def import_items(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'No file was uploaded.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            report = InventoryImport(request.user.company, request.user).run(upload)
+        except ImportFileError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if not report['created'] and report['failed']:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED)
 
 # Location manager
-class LocationViewSet(viewsets.ModelViewSet):
+class LocationViewSet(LedgerWritesMixin, viewsets.ModelViewSet):
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
     permission_classes = [IsAuthenticated]
@@ -328,18 +366,24 @@ class CategoryViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 # Stock Adjustment
-class StockAdjustmentListCreateView(generics.ListCreateAPIView):
+class StockAdjustmentListCreateView(LedgerWritesMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     serializer_class = StockAdjustmentSerializer
     filterset_class = StockAdjustmentFilterSet
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, filters.OrderingFilter]
     search_fields = ['item__item_name', 'item__sku', 'item__product_code']  # Include product_code in search
     ordering_fields = ['date']
     ordering = ['-date']
+    pagination_class = HistoryPagination
+    cursor_ordering = ('date', 'id')
 
     def get_queryset(self):
         company = self.request.user.company
-        return StockAdjustment.objects.filter(item__company=company).order_by('date')
+        return (
+            StockAdjustment.objects.filter(company=company)
+            .select_related('item', 'location', 'category')
+            .order_by('date')
+        )
 
     def perform_create(self, serializer):
         # Save the StockAdjustment instance, which will trigger the signal to create InventoryItem
@@ -353,27 +397,52 @@ class StockAdjustmentListCreateView(generics.ListCreateAPIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
              
 # Stock Adjustment Detail View
-class StockAdjustmentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class StockAdjustmentDetailView(LedgerWritesMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = StockAdjustmentSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         company = self.request.user.company
-        return StockAdjustment.objects.filter(item__company=company)
+        return StockAdjustment.objects.filter(item__company=company).select_related('item', 'location', 'category')
+
+# Batch Stock Adjustment: many lines in one request, booked all-or-nothing or line by line
+class StockAdjustmentBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = StockAdjustmentBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        batch = StockAdjustmentBatch(request.user.company, request.user)
+        created, errors = batch.run(serializer.validated_data['lines'], serializer.validated_data['mode'])
+        response = {
+            'created': StockAdjustmentSerializer(created, many=True, context={'request': request}).data,
+            'errors': errors,
+        }
+        if not created:
+            return Response(response, status=status.HTTP_400_BAD_REQUEST)
+        return Response(response, status=status.HTTP_201_CREATED)
 
 # Stock Transfer
-class StockTransferCreateView(generics.ListCreateAPIView):
+class StockTransferCreateView(LedgerWritesMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     serializer_class = StockTransferSerializer
     filterset_class = StockTransferFilterSet
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, filters.OrderingFilter]
     search_fields = ['item__item_name', 'item__sku', 'item__product_code', 'date']
     ordering_fields = ['date']
     ordering = ['-date']
+    pagination_class = HistoryPagination
+    cursor_ordering = ('date', 'id')
 
     def get_queryset(self):
         company = self.request.user.company
-        return StockTransfer.objects.filter(company=company).order_by('-date')
+        return (
+            StockTransfer.objects.filter(company=company)
+            .select_related('item__category', 'from_location', 'to_location')
+            .order_by('-date')
+        )
 
     def perform_create(self, serializer):
         item = serializer.validated_data.get('item')
@@ -390,13 +459,13 @@ class StockTransferCreateView(generics.ListCreateAPIView):
         context['request'] = self.request
         return context
 
-class StockTransferDetailView(generics.RetrieveUpdateDestroyAPIView):
+class StockTransferDetailView(LedgerWritesMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = StockTransferSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         company = self.request.user.company
-        return StockTransfer.objects.filter(company=company)
+        return StockTransfer.objects.filter(company=company).select_related('item__category', 'from_location', 'to_location')
 
     def perform_update(self, serializer):
         # Save the updated StockTransfer instance
@@ -412,8 +481,36 @@ class StockTransferDetailView(generics.RetrieveUpdateDestroyAPIView):
         instance.delete()
 
 
+# Transfer Document: many items moved between two locations in one request
+class TransferDocumentListCreateView(LedgerWritesMixin, generics.ListCreateAPIView):
+    serializer_class = TransferDocumentSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        company = self.request.user.company
+        return (
+            TransferDocument.objects.filter(company=company)
+            .select_related('from_location', 'to_location')
+            .prefetch_related('lines__item')
+            .order_by('-date', '-id')
+        )
 
-class TotalCurrentInventoryView(generics.ListAPIView):
+    def perform_create(self, serializer):
+        serializer.save(company=self.request.user.company, user=self.request.user)
+
+class TransferDocumentDetailView(LedgerWritesMixin, generics.RetrieveDestroyAPIView):
+    serializer_class = TransferDocumentSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        company = self.request.user.company
+        return (
+            TransferDocument.objects.filter(company=company)
+            .select_related('from_location', 'to_location')
+            .prefetch_related('lines__item')
+        )
+
+class TotalCurrentInventoryView(SparseFieldsetMixin, generics.ListAPIView):
     serializer_class = TotalCurrentInventorySerializer
     filterset_class = TotalCurrentInventoryFilterSet
     permission_classes = [IsAuthenticated]
@@ -424,170 +521,273 @@ class TotalCurrentInventoryView(generics.ListAPIView):
 
     def get_queryset(self):
         company = self.request.user.company
-        return TotalCurrentInventory.objects.filter(company=company)
+        return TotalCurrentInventory.objects.filter(company=company).select_related('category', 'location')
 
 
+# Reorder points; ?low=true lists the balances that are at or below theirs right now
+class ReorderPointViewSet(viewsets.ModelViewSet):
+    queryset = ReorderPoint.objects.all()
+    serializer_class = ReorderPointSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['low', 'location']
 
+    def get_queryset(self):
+        company = self.request.user.company
+        return ReorderPoint.objects.filter(company=company).select_related('product', 'location').order_by('id')
 
-# Aggregated Inventory Item View for Chartjs
-class AggregatedInventoryItemView(generics.GenericAPIView):
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = InventoryItemFilterSet
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            self.check(serializer.save(company=self.request.user.company))
 
-    def get(self, request, *args, **kwargs):
-        company = request.user.company
-        group_by = request.query_params.get('group_by', '')
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            self.check(serializer.save())
+
+    def check(self, point):
+        # A balance already on the other side of a new threshold has crossed it
+        crossed = alerts.check([ledger.balance_key(point.product_id, point.location_id)])
+        if crossed:
+            point.low = crossed[0].kind == 'low'
+
+# Crossings of reorder points, oldest first; poll the `next` link for new ones
+class StockAlertFeedView(generics.ListAPIView):
+    serializer_class = StockAlertSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = FeedPagination
+    cursor_ordering = ('sequence', 'id')
 
-        # Create a filterset instance
-        filterset = self.filterset_class(request.GET, request=request)
+    def get_queryset(self):
+        company = self.request.user.company
+        # An alert joins the feed once it is sequenced, after its transaction committed
+        return (
+            StockAlert.objects.filter(company=company, sequence__isnull=False)
+            .select_related('product', 'location')
+        )
 
-        # Check if the filterset is valid
-        if not filterset.is_valid():
-            return JsonResponse({'error': 'Invalid filter parameters'}, status=400)
-
-        # Get filtered queryset
-        items = filterset.qs
-
-        # Filter items by the current user's company
-        items = items.filter(company=company)
-
-        # Aggregate data based on group_by parameter
-        if group_by == 'daily':
-            items = items.annotate(trunc_date=TruncDay('inventory_date')).values('trunc_date').annotate(total_quantity=Sum('quantity')).order_by('trunc_date')
-        elif group_by == 'weekly':
-            items = items.annotate(trunc_date=TruncWeek('inventory_date')).values('trunc_date').annotate(total_quantity=Sum('quantity')).order_by('trunc_date')
-        elif group_by == 'monthly':
-            items = items.annotate(trunc_date=TruncMonth('inventory_date')).values('trunc_date').annotate(total_quantity=Sum('quantity')).order_by('trunc_date')
-        elif group_by == 'yearly':
-            items = items.annotate(trunc_date=TruncYear('inventory_date')).values('trunc_date').annotate(total_quantity=Sum('quantity')).order_by('trunc_date')
-        else:
-            items = items.values('inventory_date').annotate(total_quantity=Sum('quantity')).order_by('inventory_date')
 
-        # Format the data for response
-        response_data = [
-            {
-                'trunc_date': item['trunc_date'] if group_by in ['daily', 'weekly', 'monthly', 'yearly'] else item['inventory_date'],
-                'total_quantity': item['total_quantity']
-            } for item in items
-        ]
+# Exports: every row matching the list filters, streamed as CSV or NDJSON
+class ExportView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, filters.OrderingFilter]
+    columns = []  # (header, model path)
+    name = ''
 
-        return JsonResponse(response_data, safe=False)
+    def get(self, request, fmt, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return exports.streaming_response(queryset, self.columns, fmt, self.name)
 
+class InventoryItemExportView(ExportView):
+    filterset_class = InventoryItemFilterSet
+    search_fields = InventoryItemViewSet.search_fields
+    ordering_fields = InventoryItemViewSet.ordering_fields
+    ordering = ['-inventory_date', '-id']
+    name = 'inventory-items'
+    columns = [
+        ('id', 'id'),
+        ('item_name', 'item_name'),
+        ('sku', 'sku'),
+        ('product_code', 'product_code'),
+        ('supplier_name', 'supplier_name'),
+        ('quantity', 'quantity'),
+        ('price', 'price'),
+        ('inventory_date', 'inventory_date'),
+        ('expiration_date', 'expiration_date'),
+        ('category', 'category__name'),
+        ('location', 'location__name'),
+    ]
 
-# Aggregated Stock Adjustment Item View for Chartjs
-class AggregatedStockAdjustmentView(generics.GenericAPIView):
-    filter_backends = (DjangoFilterBackend,)
+    def get_queryset(self):
+        return InventoryItem.objects.filter(company=self.request.user.company)
+
+class StockAdjustmentExportView(ExportView):
     filterset_class = StockAdjustmentFilterSet
+    search_fields = StockAdjustmentListCreateView.search_fields
+    ordering_fields = StockAdjustmentListCreateView.ordering_fields
+    ordering = ['-date', '-id']
+    name = 'stock-adjustments'
+    columns = [
+        ('id', 'id'),
+        ('date', 'date'),
+        ('adjustment_type', 'adjustment_type'),
+        ('item_name', 'item__item_name'),
+        ('sku', 'item__sku'),
+        ('product_code', 'item__product_code'),
+        ('quantity', 'quantity'),
+        ('reason', 'reason'),
+        ('category', 'category__name'),
+        ('location', 'location__name'),
+    ]
+
+    def get_queryset(self):
+        return StockAdjustment.objects.filter(company=self.request.user.company)
+
+class StockTransferExportView(ExportView):
+    filterset_class = StockTransferFilterSet
+    search_fields = StockTransferCreateView.search_fields
+    ordering_fields = StockTransferCreateView.ordering_fields
+    ordering = ['-date', '-id']
+    name = 'stock-transfers'
+    columns = [
+        ('id', 'id'),
+        ('date', 'date'),
+        ('item_name', 'item__item_name'),
+        ('sku', 'item__sku'),
+        ('product_code', 'item__product_code'),
+        ('quantity', 'quantity'),
+        ('from_location', 'from_location__name'),
+        ('to_location', 'to_location__name'),
+        ('category', 'item__category__name'),
+        ('supplier_name', 'supplier_name'),
+        ('price', 'price'),
+        ('expiration_date', 'expiration_date'),
+    ]
+
+    def get_queryset(self):
+        return StockTransfer.objects.filter(company=self.request.user.company)
+
+# Applies the request's filters to `queryset`; invalid filters answer 400
+def filtered(request, filterset_class, queryset):
+    filterset = filterset_class(request.query_params, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    return filterset.qs
+
+# Stock levels per location with the movement history, as an Excel workbook.
+# location/category narrow both; start_date/end_date narrow the history.
+class StockLevelsWorkbookView(APIView):
+    permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
         company = request.user.company
-        group_by = request.query_params.get('group_by', '')
-
-        # Create a filterset instance
-        filterset = self.filterset_class(request.GET, request=request)
+        balances = filtered(request, TotalCurrentInventoryFilterSet, TotalCurrentInventory.objects.filter(company=company))
+        movements = filtered(request, StockMovementFilterSet, StockMovement.objects.filter(company=company))
+        return exports.workbook_response(balances, movements, 'stock-levels')
+
+# Background jobs: long-running work answers 202 with a job to poll
+def job_accepted(job):
+    response = Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    response['Location'] = reverse('job-detail', args=[job.pk])
+    response['Retry-After'] = '2'
+    return response
+
+class JobDetailView(generics.RetrieveAPIView):
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
 
-        # Check if the filterset is valid
-        if not filterset.is_valid():
-            return JsonResponse({'error': 'Invalid filter parameters'}, status=400)
+    def get_queryset(self):
+        return Job.objects.filter(company=self.request.user.company)
 
-        # Get filtered queryset
-        items = filterset.qs
 
-        # Filter items by the current user's company
-        items = items.filter(company=company)
+# Stock valuation and movements as a PDF, with the same filters as the workbook.
+# Rendering is queued as a job: the view answers 202 with the job to poll until
+# the report is ready, then serves the stored file until the company's data changes.
+class StockReportView(APIView):
+    permission_classes = [IsAuthenticated]
+    params = ['item_name', 'location', 'category', 'start_date', 'end_date']
 
+    def get(self, request, *args, **kwargs):
+        company = request.user.company
+        # Invalid filters are rejected here, before anything is queued
+        filtered(request, TotalCurrentInventoryFilterSet, TotalCurrentInventory.objects.none())
+        filtered(request, StockMovementFilterSet, StockMovement.objects.none())
+        params = {key: request.query_params[key] for key in self.params if request.query_params.get(key)}
 
-        # Aggregate data based on group_by parameter
-        if group_by == 'daily':
-            items = items.annotate(trunc_date=TruncDay('date')).values('trunc_date').annotate(total_quantity=Sum('quantity')).order_by('trunc_date')
-        elif group_by == 'weekly':
-            items = items.annotate(trunc_date=TruncWeek('date')).values('trunc_date').annotate(total_quantity=Sum('quantity')).order_by('trunc_date')
-        elif group_by == 'monthly':
-            items = items.annotate(trunc_date=TruncMonth('date')).values('trunc_date').annotate(total_quantity=Sum('quantity')).order_by('trunc_date')
-        elif group_by == 'yearly':
-            items = items.annotate(trunc_date=TruncYear('date')).values('trunc_date').annotate(total_quantity=Sum('quantity')).order_by('trunc_date')
-        else:
-            items = items.values('date').annotate(total_quantity=Sum('quantity')).order_by('date')
+        report = reports.open_report(company.pk, params)
+        if report is None:
+            return job_accepted(reports.schedule(company, params))
+        return FileResponse(report, as_attachment=True, filename='stock-report.pdf', content_type='application/pdf')
 
-        # Format the data for response
-        response_data = [
-            {
-                'trunc_date': item['trunc_date'] if group_by in ['daily', 'weekly', 'monthly', 'yearly'] else item['date'],
-                'total_quantity': item['total_quantity']
-            } for item in items
-        ]
 
-        return JsonResponse(response_data, safe=False)
 
-# Aggregated Stock Transfer Item View for Chart.js
-class AggregatedStockTransferView(generics.GenericAPIView):
-    # Specify the filter backend and the filter set class to be used
+# Aggregated series for Chart.js. One grouped query returns every requested metric
+# (?metrics=quantity,value,count,skus) per period (?group_by=daily|weekly|monthly|
+# quarterly|yearly|total), optionally split by the documents' dimensions (?split_by=).
+# Results are cached per company until its stock data changes; X-Cache tells hits.
+class AggregatedView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
     filter_backends = (DjangoFilterBackend,)
-    filterset_class = StockTransferFilterSet
 
     def get(self, request, *args, **kwargs):
-        # Retrieve the company associated with the current user
         company = request.user.company
-        
-        # Get the 'group_by' parameter from the query string (default to an empty string if not provided)
-        group_by = request.query_params.get('group_by', '')
-
-        # Create an instance of the filterset with the request data
+        params = {key: value.strip() for key, value in request.query_params.items() if value.strip()}
+        params['endpoint'] = type(self).__name__
+        rows, hit = caching.cached('analytics', company.pk, params, lambda: self.aggregate(request), depends_on='stock')
+        response = JsonResponse(rows, safe=False)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    def aggregate(self, request):
         filterset = self.filterset_class(request.GET, request=request)
-
-        # Validate the filterset to ensure that all filters are correctly applied
         if not filterset.is_valid():
-            return JsonResponse({'error': 'Invalid filter parameters'}, status=400)
-
-        # Retrieve the filtered queryset of items
-        items = filterset.qs
-
-        # Filter items by the current user's company
-        items = items.filter(company=company)
-
-
-        # Aggregate data based on the 'group_by' parameter
-        if group_by == 'daily':
-            # Annotate each item with the truncated day (TruncDay) and calculate the sum of quantities per day
-            items = items.annotate(trunc_date=TruncDay('date')) \
-                         .values('trunc_date') \
-                         .annotate(total_quantity=Sum('quantity')) \
-                         .order_by('trunc_date')
-        elif group_by == 'weekly':
-            # Annotate each item with the truncated week (TruncWeek) and calculate the sum of quantities per week
-            items = items.annotate(trunc_date=TruncWeek('date')) \
-                         .values('trunc_date') \
-                         .annotate(total_quantity=Sum('quantity')) \
-                         .order_by('trunc_date')
-        elif group_by == 'monthly':
-            # Annotate each item with the truncated month (TruncMonth) and calculate the sum of quantities per month
-            items = items.annotate(trunc_date=TruncMonth('date')) \
-                         .values('trunc_date') \
-                         .annotate(total_quantity=Sum('quantity')) \
-                         .order_by('trunc_date')
-        elif group_by == 'yearly':
-            # Annotate each item with the truncated year (TruncYear) and calculate the sum of quantities per year
-            items = items.annotate(trunc_date=TruncYear('date')) \
-                         .values('trunc_date') \
-                         .annotate(total_quantity=Sum('quantity')) \
-                         .order_by('trunc_date')
-        else:
-            # If no 'group_by' parameter is provided, group by the exact date
-            items = items.values('date') \
-                         .annotate(total_quantity=Sum('quantity')) \
-                         .order_by('date')
+            raise ValidationError(filterset.errors)
+        return aggregation.aggregate(
+            filterset,
+            request.user.company,
+            group_by=request.query_params.get('group_by', ''),
+            metrics=aggregation.parse_list(request.query_params.get('metrics', 'quantity')),
+            split_by=aggregation.parse_list(request.query_params.get('split_by')),
+        )
 
-        # Prepare the response data, formatting the date and total quantity
-        response_data = [
-            {
-                'trunc_date': item['trunc_date'] if group_by in ['daily', 'weekly', 'monthly', 'yearly'] else item['date'],
-                'total_quantity': item['total_quantity'],
+class AggregatedInventoryItemView(AggregatedView):
+    filterset_class = InventoryItemFilterSet
 
-            } for item in items
-        ]
+class AggregatedStockAdjustmentView(AggregatedView):
+    filterset_class = StockAdjustmentFilterSet
 
-        # Return the aggregated data as a JSON response
-        return JsonResponse(response_data, safe=False)
+class AggregatedStockTransferView(AggregatedView):
+    filterset_class = StockTransferFilterSet
 
+# The dashboard's figures in one request, cached until the company's stock changes
+class DashboardView(APIView):
+    permission_classes = [IsAuthenticated]
 
+    def get(self, request, *args, **kwargs):
+        company = request.user.company
+        params = DashboardParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        start_date, end_date = dashboard.period()
+        start_date = params.validated_data.get('start_date', start_date)
+        end_date = params.validated_data.get('end_date', end_date)
+        low_stock = params.validated_data.get('low_stock', dashboard.LOW_STOCK)
+        top = params.validated_data.get('top', dashboard.TOP_MOVERS)
+
+        key = {'endpoint': type(self).__name__, 'start_date': str(start_date), 'end_date': str(end_date),
+               'low_stock': low_stock, 'top': top}
+        figures, hit = caching.cached(
+            'analytics', company.pk, key,
+            lambda: dashboard.kpis(company, start_date, end_date, low_stock, top),
+            depends_on='stock',
+        )
+        response = JsonResponse(figures)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
 
+# Per-SKU turnover, days of cover, sell-through and ABC/XYZ classes, cached until the company's stock changes
+class InventoryAnalyticsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        company = request.user.company
+        params = PeriodParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        start_date, end_date = analytics.period()
+        start_date = params.validated_data.get('start_date', start_date)
+        end_date = params.validated_data.get('end_date', end_date)
+
+        key = {'endpoint': type(self).__name__, 'start_date': str(start_date), 'end_date': str(end_date)}
+        products, hit = caching.cached(
+            'analytics', company.pk, key,
+            lambda: analytics.inventory_analytics(company, start_date, end_date),
+            depends_on='stock',
+        )
+        response = JsonResponse({'start_date': start_date, 'end_date': end_date, 'products': products})
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+# Hit and miss counts of the response caches, for staff
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(caching.stats(['filters', 'analytics']))
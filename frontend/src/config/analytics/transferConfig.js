@@ -1,7 +1,7 @@
 import formatDate from '../../utils/formatDate';
 
 const transferConfig = {
-  apiEndpoint: 'aggregated-stock-adjusments/',
+  apiEndpoint: 'aggregated-stock-transfers/',
   chartTitle: 'Stock Transfer Analytics',
   filtersConfig: {
     start_date: '',